@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 from .models import User, Shop, Category, Product, ProductInfo, Parameter, \
-    ProductParameter, Order, OrderItem, Contact, ConfirmEmailToken
+    ProductParameter, Order, OrderItem, Contact, ConfirmEmailToken, ImportJob, \
+    ShopOrder, EmailOutbox, SpentRefreshToken
 
 
 admin.site.register(User)
@@ -13,5 +14,9 @@ admin.site.register(Parameter)
 admin.site.register(ProductParameter)
 admin.site.register(Order)
 admin.site.register(OrderItem)
+admin.site.register(ShopOrder)
+admin.site.register(EmailOutbox)
 admin.site.register(Contact)
 admin.site.register(ConfirmEmailToken)
+admin.site.register(ImportJob)
+admin.site.register(SpentRefreshToken)
@@ -0,0 +1,236 @@
+from collections import OrderedDict
+from copy import copy
+from threading import Lock
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signing import BadSignature, SignatureExpired
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import User
+from .tokens import read_token
+
+
+def shared_stamps():
+    """
+    Tell whether the default cache holding the stamps is shared between processes.
+
+    A process-local cache only sees the stamp bumps of its own process, so tokens are not
+    cached then and every request loads the user.
+
+    Returns:
+        bool: True if the stamps are seen by every process.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def stamp_key(user_id):
+    """Build the shared cache key of the stamp of a user's cached tokens."""
+    return f'auth-user-stamp:{user_id}'
+
+
+def user_stamp(user_id):
+    """
+    Get the shared stamp of a user, creating it when it is missing.
+
+    Read it before loading the user, so a change committed meanwhile replaces the stamp
+    and the loaded user is not trusted.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        str: The stamp.
+    """
+    stamp = cache.get(stamp_key(user_id))
+    if stamp is None:
+        cache.add(stamp_key(user_id), uuid4().hex, settings.AUTH_TOKEN_CACHE_TTL)
+        stamp = cache.get(stamp_key(user_id))
+    return stamp
+
+
+def bump_user_stamp(user_id):
+    """
+    Replace the shared stamp of a user, so every process stops using its cached tokens.
+
+    The stamp is replaced now and again after the commit, because a process may reload
+    the user before the change is committed.
+
+    Args:
+        user_id (int): The ID of the changed user.
+    """
+    def bump():
+        cache.set(stamp_key(user_id), uuid4().hex, settings.AUTH_TOKEN_CACHE_TTL)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of token keys to (user, token) pairs, with entries expiring after a TTL.
+
+    Every entry keeps the shared stamp of its user read before the user was loaded. An
+    entry is used only while the stamp in the shared cache is the same, so changes made
+    in any process invalidate it. The keys are also indexed by user ID. Without a shared
+    default cache nothing is cached, see shared_stamps.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.users = {}
+        self.lock = Lock()
+
+    def get(self, key):
+        if not shared_stamps():
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < monotonic():
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+        _, user, token, stamp = entry
+        if cache.get(stamp_key(user.id)) != stamp:
+            self.discard(key)
+            return None
+        return user, token
+
+    def set(self, key, user, token, stamp):
+        if not shared_stamps():
+            return
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (monotonic() + settings.AUTH_TOKEN_CACHE_TTL, user, token, stamp)
+            self.users.setdefault(user.id, set()).add(key)
+            while len(self.entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        """Remove an entry and its index entry, the lock must be held."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            keys = self.users[entry[1].id]
+            keys.discard(key)
+            if not keys:
+                del self.users[entry[1].id]
+
+    def discard(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def discard_user(self, user_id):
+        with self.lock:
+            for key in list(self.users.get(user_id, ())):
+                self.remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.users.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication keeping the users of recently seen tokens in a per-process cache.
+
+    Repeated requests with the same token are authenticated with one lookup in the shared
+    cache instead of queries. Saving the user, e.g. deactivating it or setting a new
+    password, and deleting or rotating the token replace the user's shared stamp, so all
+    processes drop the entries on the next request. With a process-local default cache
+    the tokens are looked up on every request.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user, token, user_stamp(user.id))
+            return user, token
+        user, token = cached
+        return copy(user), token
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authentication with the signed expiring tokens of backend.tokens sent as 'Bearer <token>'.
+
+    The signature and the expiry are checked on every request without the database. The
+    user is loaded once per token and kept in the token cache, whose entries are dropped
+    in every process when the user is saved, as long as the default cache is shared
+    between processes; otherwise the user is loaded on every request. Either way a revoke
+    applies to the next request in any process.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed('Invalid token header.')
+        return self.authenticate_credentials(key)
+
+    def authenticate_credentials(self, key):
+        try:
+            user_id, version = read_token(key)
+        except SignatureExpired:
+            raise AuthenticationFailed('Token expired.')
+        except BadSignature:
+            raise AuthenticationFailed('Invalid token.')
+
+        cached = token_cache.get(key)
+        if cached is None:
+            stamp = user_stamp(user_id)
+            user = User.objects.filter(id=user_id).first()
+            if user is None:
+                raise AuthenticationFailed('User inactive or deleted.')
+            token_cache.set(key, user, None, stamp)
+        else:
+            user = copy(cached[0])
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        if user.token_version != version:
+            raise AuthenticationFailed('Token revoked.')
+        return user, key
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """Drop the cached tokens of a changed or deleted user, except after saving only the last login."""
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    token_cache.discard_user(instance.pk)
+    bump_user_stamp(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, created=False, **kwargs):
+    """Drop a rotated or deleted token from the cache."""
+    if created:
+        return
+    token_cache.discard(instance.key)
+    bump_user_stamp(instance.user_id)
@@ -0,0 +1,240 @@
+from statistics import quantiles
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ujson import dumps
+
+from .importers import import_price_list
+from .models import Contact, Order, ProductInfo, User
+from .orders import add_basket_items, place_order
+from .tokens import issue_tokens
+
+
+def analyze_tables():
+    """Refresh the planner statistics of all tables."""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def seed_benchmark_data(shops, products, orders):
+    """
+    Generate shops, products and placed orders through the import and checkout code paths.
+
+    Users are inserted with bulk_create, so no confirmation emails are queued. The tables are
+    analyzed after every stage, so the planner sees the uncommitted rows instead of empty tables.
+
+    Args:
+        shops (int): The number of shops.
+        products (int): The number of products per shop.
+        orders (int): The number of placed orders.
+
+    Returns:
+        dict: The generated shop users, buyers, their contacts and the product info IDs.
+    """
+    shop_users = User.objects.bulk_create([
+        User(email=f'benchmark-shop{number}@example.com', username=f'benchmark-shop{number}', type='shop',
+             is_active=True) for number in range(shops)])
+    buyers = User.objects.bulk_create([
+        User(email=f'benchmark-buyer{number}@example.com', username=f'benchmark-buyer{number}', type='buyer',
+             is_active=True) for number in range(max(orders, 1))])
+    for number, shop_user in enumerate(shop_users):
+        category_id = 800000 + number
+        import_price_list(shop_user.id, {
+            'shop': f'Benchmark shop {number}',
+            'categories': [{'id': category_id, 'name': f'Benchmark category {number}'}],
+            'goods': [{'id': external_id, 'category': category_id, 'name': f'Product {number}-{external_id}',
+                       'model': f'model/{number}/{external_id}', 'price': 100 + external_id,
+                       'price_rrc': 120 + external_id, 'quantity': 1000000,
+                       'parameters': {'Цвет': ('черный', 'белый')[external_id % 2], 'Размер': external_id % 10}}
+                      for external_id in range(products)],
+        })
+    product_info_ids = list(ProductInfo.objects.filter(shop__user__in=shop_users).order_by('id').values_list(
+        'id', flat=True))
+    analyze_tables()
+    contacts = Contact.objects.bulk_create([Contact(user=buyer, city='Москва', street='Тверская', phone='1')
+                                            for buyer in buyers])
+    for number in range(orders):
+        buyer = buyers[number]
+        add_basket_items(buyer.id, {product_info_ids[(number * 7 + line) % len(product_info_ids)]: 1 + line
+                                    for line in range(3)})
+        place_order(buyer.id, Order.objects.get(user=buyer, status='basket').id, contacts[number].id)
+    analyze_tables()
+    return {'shop_users': shop_users, 'buyers': buyers, 'contacts': contacts, 'product_info_ids': product_info_ids}
+
+
+def catalog_requests(data, iteration):
+    """Build the catalog requests: product pages, filters, search, categories and shops."""
+    category = f'{800000 + iteration % len(data["shop_users"])}'
+    return [
+        ('get', reverse('backend:products'), {'limit': 50}),
+        ('get', reverse('backend:products'), {'category_id': category, 'in_stock': 'true', 'limit': 50}),
+        ('get', reverse('backend:products'), {'q': f'Product {iteration % 10}', 'limit': 20}),
+        ('get', reverse('backend:categories'), None),
+        ('get', reverse('backend:shops'), None),
+    ]
+
+
+def catalog_scenario(data, iteration):
+    """Browse the catalog with the response cache emptied before every run, so the queries are measured."""
+    caches[settings.CATALOG_CACHE_ALIAS].clear()
+    return catalog_requests(data, iteration)
+
+
+def catalog_cached_scenario(data, iteration):
+    """Browse the same catalog pages in every run, so after the warm-up all responses come from the cache."""
+    return catalog_requests(data, 0)
+
+
+def basket_scenario(data, iteration):
+    """Add goods to the basket, change their quantities and read the basket."""
+    product_info_ids = data['product_info_ids']
+    items = [{'product_info': product_info_ids[(iteration * 5 + line) % len(product_info_ids)], 'quantity': 1}
+             for line in range(5)]
+    return [
+        ('post', reverse('backend:basket'), {'items': dumps(items)}),
+        ('get', reverse('backend:basket'), None),
+        ('put', reverse('backend:basket'), lambda: {'items': dumps([
+            {'id': order_item_id, 'quantity': 2}
+            for order_item_id in Order.objects.get(user=data['buyer'], status='basket').order_items.values_list(
+                'id', flat=True)])}),
+    ]
+
+
+def checkout_scenario(data, iteration):
+    """Fill the basket and place it as an order."""
+    product_info_ids = data['product_info_ids']
+    items = [{'product_info': product_info_ids[(iteration * 3 + line) % len(product_info_ids)], 'quantity': 1}
+             for line in range(3)]
+    return [
+        ('post', reverse('backend:basket'), {'items': dumps(items)}),
+        ('post', reverse('backend:order'), lambda: {
+            'id': str(Order.objects.get(user=data['buyer'], status='basket').id), 'contact': data['contact'].id}),
+    ]
+
+
+def partner_scenario(data, iteration):
+    """Poll the partner order feed from the start and list the partner's orders."""
+    return [
+        ('get', reverse('backend:partner-orders'), {'since': 0, 'limit': 100}),
+        ('get', reverse('backend:partner-status'), None),
+    ]
+
+
+SCENARIOS = {
+    'catalog': (catalog_scenario, 'buyer'),
+    'catalog_cached': (catalog_cached_scenario, 'buyer'),
+    'basket': (basket_scenario, 'buyer'),
+    'checkout': (checkout_scenario, 'buyer'),
+    'partner': (partner_scenario, 'shop'),
+}
+
+
+def run_scenario(name, data, iterations):
+    """
+    Run a scenario several times through the full request stack and measure every request.
+
+    One extra unmeasured run warms up the authentication and the per-process caches.
+
+    Args:
+        name (str): The name of the scenario in SCENARIOS.
+        data (dict): The data returned by seed_benchmark_data.
+        iterations (int): The number of runs of the scenario.
+
+    Returns:
+        dict: The request count, throughput, p50/p95/p99 latency in milliseconds and queries per request.
+    """
+    scenario, role = SCENARIOS[name]
+    user = data['shop_users'][0] if role == 'shop' else data['buyers'][0]
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {issue_tokens(user)["access"]}')
+    data = {**data, 'buyer': data['buyers'][0], 'contact': data['contacts'][0]}
+    timings = []
+    queries = []
+    for iteration in range(-1, iterations):
+        for method, url, params in scenario(data, iteration):
+            params = params() if callable(params) else params
+            with CaptureQueriesContext(connection) as captured:
+                start = perf_counter()
+                response = getattr(client, method)(url, params, content_type='application/json') \
+                    if method == 'put' else getattr(client, method)(url, params)
+                elapsed = perf_counter() - start
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name}: {method.upper()} {url} returned {response.status_code}')
+            if iteration >= 0:
+                timings.append(elapsed)
+                queries.append(len(captured.captured_queries))
+    percentiles = quantiles(timings, n=100, method='inclusive') if len(timings) > 1 else timings * 99
+    return {
+        'requests': len(timings),
+        'throughput': round(len(timings) / sum(timings), 1),
+        'p50': round(percentiles[49] * 1000, 2),
+        'p95': round(percentiles[94] * 1000, 2),
+        'p99': round(percentiles[98] * 1000, 2),
+        'queries': round(sum(queries) / len(queries), 2),
+    }
+
+
+def connection_overhead(iterations):
+    """
+    Compare a query on a new database connection with the same query on a persistent one.
+
+    A new connection is what every request paid with CONN_MAX_AGE=0.
+
+    Args:
+        iterations (int): The number of measured queries of each kind.
+
+    Returns:
+        dict: The p50 latency of both kinds in milliseconds and their difference.
+    """
+    def measure(query):
+        timings = []
+        for _ in range(iterations):
+            start = perf_counter()
+            query()
+            timings.append(perf_counter() - start)
+        return round(sorted(timings)[len(timings) // 2] * 1000, 2)
+
+    def new_connection_query():
+        wrapper = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        finally:
+            wrapper.close()
+
+    def persistent_connection_query():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    persistent_connection_query()
+    new = measure(new_connection_query)
+    persistent = measure(persistent_connection_query)
+    return {'new': new, 'persistent': persistent, 'saved': round(new - persistent, 2)}
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Find the scenarios slower or running more queries than their stored baseline.
+
+    Args:
+        results (dict): The measurements keyed by scenario name.
+        baseline (dict): The stored measurements keyed by scenario name.
+        tolerance (float): The allowed relative p95 latency increase, e.g. 0.5 for 50%.
+
+    Returns:
+        list: The descriptions of the regressions.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['p95'] > expected['p95'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {result["p95"]} ms > baseline {expected["p95"]} ms')
+        if result['queries'] > expected['queries']:
+            regressions.append(f'{name}: {result["queries"]} queries per request > baseline {expected["queries"]}')
+    return regressions
@@ -0,0 +1,72 @@
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, F, Max, Sum
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .models import Shop
+
+
+def bump_catalog_version(shop_ids):
+    """
+    Invalidate the cached catalog responses after the assortment or status of shops changed.
+
+    Args:
+        shop_ids (list): The IDs of the changed shops.
+    """
+    Shop.objects.filter(id__in=shop_ids).update(catalog_version=F('catalog_version') + 1)
+
+
+def catalog_version():
+    """
+    Fingerprint the state of the whole catalog with a single aggregate query.
+
+    Versions only grow and shop IDs are never reused, so the number of shops, the
+    highest shop ID and the sum of the shop versions change with every bump, creation
+    or deletion of a shop.
+
+    Returns:
+        str: The catalog version.
+    """
+    version = Shop.objects.aggregate(count=Count('id'), last=Max('id'), total=Sum('catalog_version'))
+    return '{count}.{last}.{total}'.format(**version)
+
+
+class CatalogCacheMixin:
+    """
+    Mixin caching the GET responses of catalog views until the catalog version changes.
+
+    Responses are stored in the CATALOG_CACHE_ALIAS cache under a key built from the scheme,
+    the host, the path, the query parameters, the Accept header and the catalog version, and
+    are returned with an ETag that allows clients to revalidate them with If-None-Match. The
+    cursor links of the pages are absolute, so a page requested through one host is never
+    served to clients of another.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return super().dispatch(request, *args, **kwargs)
+
+        query = sorted(request.GET.lists())
+        key = sha1(f'{request.scheme}|{request.get_host()}|{request.path}|{query}|'
+                   f'{request.headers.get("Accept", "")}|{catalog_version()}'.encode()).hexdigest()
+        etag = f'"{key}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        cache = caches[settings.CATALOG_CACHE_ALIAS]
+        cached = cache.get(f'catalog:{key}')
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if hasattr(response, 'render'):
+                response.render()
+            cache.set(f'catalog:{key}', (response.content, response['Content-Type']), settings.CATALOG_CACHE_TIMEOUT)
+        response['ETag'] = etag
+        return response
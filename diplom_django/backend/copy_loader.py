@@ -0,0 +1,192 @@
+from csv import QUOTE_NONNUMERIC, writer
+from io import StringIO
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from ujson import dumps
+
+from .parsers import iter_batches
+from .search import refresh_search_entries
+
+STAGING_GOODS_SQL = '''
+CREATE TEMPORARY TABLE staging_goods (
+    position bigint,
+    external_id bigint,
+    category_id bigint,
+    category_name text,
+    name text,
+    model text,
+    price bigint,
+    price_rrc bigint,
+    quantity bigint,
+    parameters json,
+    product_info_id bigint DEFAULT nextval(%(sequence)s::regclass)
+) ON COMMIT DROP
+'''
+
+# The CSV writer quotes missing category names as "", FORCE_NULL reads them back as NULL.
+COPY_GOODS_SQL = '''
+COPY staging_goods (position, external_id, category_id, category_name, name, model, price, price_rrc, quantity,
+                    parameters)
+FROM STDIN WITH (FORMAT csv, FORCE_NULL (category_name))
+'''
+
+MERGE_CATEGORIES_SQL = '''
+INSERT INTO backend_category (id, name)
+SELECT DISTINCT ON (category_id) category_id, category_name
+FROM staging_goods
+WHERE category_name IS NOT NULL
+ORDER BY category_id, position DESC
+ON CONFLICT (id) DO NOTHING;
+
+INSERT INTO backend_category_shops (category_id, shop_id)
+SELECT DISTINCT category_id, %(shop_id)s
+FROM staging_goods
+WHERE category_name IS NOT NULL
+ON CONFLICT (category_id, shop_id) DO NOTHING;
+'''
+
+MERGE_PRODUCTS_SQL = '''
+CREATE TEMPORARY TABLE staging_products ON COMMIT DROP AS
+SELECT keys.name, keys.category_id, min(product.id) AS id
+FROM (SELECT DISTINCT name, category_id FROM staging_goods) keys
+LEFT JOIN backend_product product ON product.name = keys.name AND product.category_id = keys.category_id
+GROUP BY keys.name, keys.category_id;
+
+WITH created AS (
+    INSERT INTO backend_product (name, category_id)
+    SELECT name, category_id FROM staging_products WHERE id IS NULL
+    RETURNING id, name, category_id
+)
+UPDATE staging_products
+SET id = created.id
+FROM created
+WHERE staging_products.name = created.name AND staging_products.category_id = created.category_id;
+'''
+
+MERGE_PARAMETERS_SQL = '''
+CREATE TEMPORARY TABLE staging_parameters ON COMMIT DROP AS
+SELECT staging_goods.position, item.ordinality, item.value ->> 0 AS name, item.value ->> 1 AS value
+FROM staging_goods, json_array_elements(staging_goods.parameters) WITH ORDINALITY item;
+
+CREATE TEMPORARY TABLE staging_parameter_names ON COMMIT DROP AS
+SELECT names.name, min(parameter.id) AS id
+FROM (SELECT DISTINCT name FROM staging_parameters) names
+LEFT JOIN backend_parameter parameter ON parameter.name = names.name
+GROUP BY names.name;
+
+WITH created AS (
+    INSERT INTO backend_parameter (name)
+    SELECT name FROM staging_parameter_names WHERE id IS NULL
+    RETURNING id, name
+)
+UPDATE staging_parameter_names
+SET id = created.id
+FROM created
+WHERE staging_parameter_names.name = created.name;
+'''
+
+MERGE_GOODS_SQL = '''
+INSERT INTO backend_productinfo (id, product_id, external_id, model, price, price_rrc, quantity, is_active, shop_id)
+SELECT staging_goods.product_info_id, staging_products.id, staging_goods.external_id, staging_goods.model,
+       staging_goods.price, staging_goods.price_rrc, staging_goods.quantity, TRUE, %(shop_id)s
+FROM staging_goods
+JOIN staging_products
+    ON staging_products.name = staging_goods.name AND staging_products.category_id = staging_goods.category_id
+ORDER BY staging_goods.position;
+
+INSERT INTO backend_productparameter (product_info_id, parameter_id, value)
+SELECT staging_goods.product_info_id, staging_parameter_names.id, staging_parameters.value
+FROM staging_parameters
+JOIN staging_goods ON staging_goods.position = staging_parameters.position
+JOIN staging_parameter_names ON staging_parameter_names.name = staging_parameters.name
+ORDER BY staging_parameters.position, staging_parameters.ordinality;
+'''
+
+DROP_STAGING_SQL = 'DROP TABLE staging_goods, staging_products, staging_parameters, staging_parameter_names'
+
+
+class CopyStream:
+    """
+    Read-only file-like object feeding the CSV encoded goods to COPY FROM STDIN.
+
+    Every read returns the rows of the next batch, so the goods are never held in memory.
+    """
+
+    def __init__(self, goods, progress=None):
+        self.batches = iter_batches(goods, settings.PRICE_LIST_BATCH_SIZE)
+        self.progress = progress
+        self.rows = 0
+
+    def read(self, size=-1):
+        batch = next(self.batches, None)
+        if batch is None:
+            return ''
+        buffer = StringIO()
+        writer(buffer, quoting=QUOTE_NONNUMERIC).writerows(
+            (self.rows + position, item['id'], item['category'], item.get('category_name'), item['name'],
+             item['model'], item['price'], item['price_rrc'], item['quantity'],
+             dumps([(str(name), str(value)) for name, value in item['parameters'].items()], ensure_ascii=False))
+            for position, item in enumerate(batch))
+        self.rows += len(batch)
+        if self.progress is not None:
+            self.progress(self.rows)
+        return buffer.getvalue()
+
+
+def copy_from(cursor, sql, stream):
+    """
+    Run COPY FROM STDIN with the API of the installed driver.
+
+    psycopg 3, needed by the connection pool, replaced copy_expert of psycopg2 with copy.
+
+    Args:
+        cursor: The database cursor.
+        sql (str): The COPY statement.
+        stream: A file-like object returning '' when it is exhausted.
+    """
+    if is_psycopg3:
+        with cursor.copy(sql) as copy:
+            for data in iter(stream.read, ''):
+                copy.write(data)
+    else:
+        cursor.copy_expert(sql, stream)
+
+
+def copy_goods(shop, goods, progress=None):
+    """
+    Load goods with COPY into a staging table and merge them into the catalog with set-based SQL.
+
+    Gives the same rows as create_goods: missing categories, products and parameters are
+    created, existing ones are reused by name, and product infos and their parameters get
+    their IDs in price list order. Must run inside a transaction, which drops the staging
+    tables if the load fails.
+
+    Args:
+        shop (Shop): The shop the goods belong to.
+        goods: An iterable of price list goods.
+        progress (callable): Called with the number of loaded goods after every batch.
+
+    Returns:
+        int: The number of loaded goods.
+    """
+    stream = CopyStream(goods, progress)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence('backend_productinfo', 'id')")
+        cursor.execute(STAGING_GOODS_SQL, {'sequence': cursor.fetchone()[0]})
+        copy_from(cursor, COPY_GOODS_SQL, stream)
+        # Autovacuum never sees uncommitted rows, so without fresh statistics the planner
+        # treats the staging tables and the tables filled earlier in the transaction as empty.
+        cursor.execute('ANALYZE staging_goods, backend_product, backend_parameter')
+        cursor.execute(MERGE_CATEGORIES_SQL, {'shop_id': shop.id})
+        cursor.execute(MERGE_PRODUCTS_SQL)
+        cursor.execute(MERGE_PARAMETERS_SQL)
+        cursor.execute('ANALYZE staging_products, staging_parameters, staging_parameter_names')
+        cursor.execute(MERGE_GOODS_SQL, {'shop_id': shop.id})
+        cursor.execute('ANALYZE backend_productinfo, backend_productparameter')
+        cursor.execute('SELECT product_info_id FROM staging_goods ORDER BY position')
+        product_info_ids = [product_info_id for product_info_id, in cursor.fetchall()]
+        cursor.execute(DROP_STAGING_SQL)
+    refresh_search_entries(product_info_ids)
+    return stream.rows
@@ -0,0 +1,158 @@
+from collections import defaultdict
+
+from django.http import HttpResponse
+from rest_framework.fields import DateTimeField
+from ujson import dumps
+
+from .metrics import serialization_timer
+from .models import Contact, OrderItem, ProductInfo, ProductParameter
+
+PRODUCT_INFO_FIELDS = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters')
+
+PRODUCT_INFO_VALUES = {
+    'id': ('id',),
+    'model': ('model',),
+    'product': ('product__name', 'product__category__name'),
+    'shop': ('shop_id',),
+    'quantity': ('quantity',),
+    'price': ('price',),
+    'price_rrc': ('price_rrc',),
+    'product_parameters': (),
+}
+
+CONTACT_FIELDS = ('id', 'city', 'street', 'house', 'frame', 'apartment', 'phone')
+
+datetime_field = DateTimeField()
+
+
+@serialization_timer()
+def json_response(data, status=200):
+    """
+    Encode data with ujson into an HTTP response.
+
+    Args:
+        data: The JSON-serializable payload.
+        status (int): The HTTP status code.
+
+    Returns:
+        HttpResponse: The response with an application/json body.
+    """
+    return HttpResponse(dumps(data, ensure_ascii=False), content_type='application/json', status=status)
+
+
+def product_info_values(fields=None):
+    """
+    List the .values() lookups needed to serialize the given product info fields.
+
+    Args:
+        fields (list): The requested fields, all of PRODUCT_INFO_FIELDS when None.
+
+    Returns:
+        list: The lookups to pass to QuerySet.values().
+    """
+    lookups = ['id']
+    for field in fields or PRODUCT_INFO_FIELDS:
+        lookups.extend(lookup for lookup in PRODUCT_INFO_VALUES[field] if lookup not in lookups)
+    return lookups
+
+
+def product_parameters(product_info_ids):
+    """
+    Fetch the parameters of several product infos with one query.
+
+    Args:
+        product_info_ids (list): The IDs of the product infos.
+
+    Returns:
+        dict: The lists of {'parameter', 'value'} dicts keyed by product info ID.
+    """
+    parameters = defaultdict(list)
+    rows = ProductParameter.objects.filter(product_info_id__in=product_info_ids).order_by('id').values_list(
+        'product_info_id', 'parameter__name', 'value')
+    for product_info_id, name, value in rows:
+        parameters[product_info_id].append({'parameter': name, 'value': value})
+    return parameters
+
+
+@serialization_timer()
+def serialize_product_infos(rows, fields=None):
+    """
+    Build the ProductInfoSerializer representation from .values() rows.
+
+    Args:
+        rows (list): Dicts returned by .values(*product_info_values(fields)).
+        fields (list): The requested fields, all of PRODUCT_INFO_FIELDS when None.
+
+    Returns:
+        list: The serialized product infos.
+    """
+    fields = fields or PRODUCT_INFO_FIELDS
+    parameters = product_parameters([row['id'] for row in rows]) if 'product_parameters' in fields else {}
+    result = []
+    for row in rows:
+        data = {}
+        for field in fields:
+            if field == 'product':
+                data['product'] = {'name': row['product__name'], 'category': row['product__category__name']}
+            elif field == 'shop':
+                data['shop'] = row['shop_id']
+            elif field == 'product_parameters':
+                data['product_parameters'] = parameters.get(row['id'], [])
+            else:
+                data[field] = row[field]
+        result.append(data)
+    return result
+
+
+@serialization_timer()
+def serialize_orders(queryset, total_field='total_sum', cursor_field=None):
+    """
+    Build the OrderSerializer representation of orders with a constant number of flat queries.
+
+    Lines of placed orders are served from their product snapshot, only basket lines
+    are joined with the current catalog.
+
+    Args:
+        queryset (QuerySet): The orders to serialize.
+        total_field (str): The field or annotation holding the total, e.g. the total of one shop's part.
+        cursor_field (str): The annotation returned as the 'cursor' of every order, if any.
+
+    Returns:
+        list: The serialized orders.
+    """
+    fields = ['id', 'status', 'dt', 'contact_id', total_field]
+    if cursor_field:
+        fields.append(cursor_field)
+    orders = list(queryset.values(*fields))
+    items = defaultdict(list)
+    item_rows = OrderItem.objects.filter(order_id__in=[order['id'] for order in orders]).order_by('id').values_list(
+        'order_id', 'id', 'product_info_id', 'quantity', 'product_snapshot')
+    product_info_ids = set()
+    for order_id, item_id, product_info_id, quantity, snapshot in item_rows:
+        items[order_id].append((item_id, product_info_id, quantity, snapshot))
+        if snapshot is None:
+            product_info_ids.add(product_info_id)
+
+    product_infos = {row['id']: row for row in serialize_product_infos(
+        list(ProductInfo.objects.filter(id__in=product_info_ids).values(*product_info_values())))} \
+        if product_info_ids else {}
+    contact_ids = {order['contact_id'] for order in orders if order['contact_id'] is not None}
+    contacts = {row['id']: row for row in Contact.objects.filter(id__in=contact_ids).values(*CONTACT_FIELDS)}
+
+    result = [
+        {
+            'id': order['id'],
+            'order_items': [{'id': item_id, 'product_info': snapshot or product_infos.get(product_info_id),
+                             'quantity': quantity}
+                            for item_id, product_info_id, quantity, snapshot in items[order['id']]],
+            'status': order['status'],
+            'dt': datetime_field.to_representation(order['dt']),
+            'total_sum': order[total_field],
+            'contact': contacts.get(order['contact_id']),
+        }
+        for order in orders
+    ]
+    if cursor_field:
+        for data, order in zip(result, orders):
+            data['cursor'] = order[cursor_field]
+    return result
@@ -0,0 +1,38 @@
+from django.db.models import F
+
+from .fast_serializers import serialize_orders
+from .models import Order, ShopOrder
+
+
+def partner_feed(user_id, since, limit):
+    """
+    Fetch the orders of the partner's shop changed after a feed cursor.
+
+    Args:
+        user_id (int): The ID of the shop owner.
+        since (int): The cursor returned by the previous call, 0 for the whole history.
+        limit (int): The maximum number of returned orders.
+
+    Returns:
+        dict: The changed orders, oldest change first, each with its cursor, and the cursor to pass next time.
+    """
+    orders = Order.objects.filter(shop_orders__shop__user_id=user_id, shop_orders__change_seq__gt=since).exclude(
+        status='basket').annotate(shop_total_sum=F('shop_orders__total_sum'),
+                                  change_seq=F('shop_orders__change_seq')).order_by('change_seq')[:limit]
+    results = serialize_orders(orders, total_field='shop_total_sum', cursor_field='change_seq')
+    return {'cursor': results[-1]['cursor'] if results else since, 'orders': results}
+
+
+def has_feed_changes(user_id, since):
+    """
+    Check with one index lookup whether the partner's shop has orders changed after a cursor.
+
+    Args:
+        user_id (int): The ID of the shop owner.
+        since (int): The feed cursor.
+
+    Returns:
+        bool: True if partner_feed would return orders.
+    """
+    return ShopOrder.objects.filter(shop__user_id=user_id, change_seq__gt=since).exclude(
+        order__status='basket').exists()
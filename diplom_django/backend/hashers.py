@@ -0,0 +1,24 @@
+from threading import BoundedSemaphore
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+hash_slots = BoundedSemaphore(settings.PASSWORD_HASH_CONCURRENCY)
+
+
+class ThrottledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 hasher with the iteration count from PASSWORD_HASH_ITERATIONS and a cap on concurrent hashing.
+
+    At most PASSWORD_HASH_CONCURRENCY hashes are computed at once per process, so a burst
+    of logins waits for a slot instead of taking every CPU from the other endpoints.
+    Passwords hashed with another iteration count are rehashed on the next login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+    def encode(self, password, salt, iterations=None):
+        with hash_slots:
+            return super().encode(password, salt, iterations)
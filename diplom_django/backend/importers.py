@@ -0,0 +1,340 @@
+from collections import defaultdict
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import bump_catalog_version
+from .copy_loader import copy_goods
+from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, \
+    OrderItem
+from .orders import update_basket_totals, update_order_totals
+from .parsers import iter_batches
+from .search import refresh_search_entries
+
+
+def save_categories(shop, categories):
+    """
+    Create the missing categories of a price list and link all of them to the shop.
+
+    Args:
+        shop (Shop): The shop the price list belongs to.
+        categories (list): The price list categories, each a dict with 'id' and 'name' keys.
+    """
+    names = {category['id']: category['name'] for category in categories}
+    if not names:
+        return
+    existing = set(Category.objects.filter(id__in=names).values_list('id', flat=True))
+    Category.objects.bulk_create([Category(id=category_id, name=name) for category_id, name in names.items()
+                                  if category_id not in existing])
+    through = Category.shops.through
+    through.objects.bulk_create([through(category_id=category_id, shop_id=shop.id) for category_id in names],
+                                ignore_conflicts=True)
+
+
+def resolve_products(goods):
+    """
+    Map every (name, category) pair of the goods to a product ID, creating the missing products.
+
+    Args:
+        goods (list): The price list goods.
+
+    Returns:
+        dict: The product IDs keyed by (name, category_id).
+    """
+    keys = {(item['name'], item['category']) for item in goods}
+    products = {}
+    existing = Product.objects.filter(name__in={name for name, _ in keys},
+                                      category_id__in={category_id for _, category_id in keys}).order_by('id')
+    for product_id, name, category_id in existing.values_list('id', 'name', 'category_id'):
+        products.setdefault((name, category_id), product_id)
+    created = Product.objects.bulk_create([Product(name=name, category_id=category_id) for name, category_id in keys
+                                           if (name, category_id) not in products])
+    for product in created:
+        products[(product.name, product.category_id)] = product.id
+    return products
+
+
+def resolve_parameters(goods):
+    """
+    Map every parameter name used by the goods to a parameter ID, creating the missing parameters.
+
+    Args:
+        goods (list): The price list goods.
+
+    Returns:
+        dict: The parameter IDs keyed by name.
+    """
+    names = {str(name) for item in goods for name in item['parameters']}
+    parameters = {}
+    for parameter_id, name in Parameter.objects.filter(name__in=names).order_by('id').values_list('id', 'name'):
+        parameters.setdefault(name, parameter_id)
+    created = Parameter.objects.bulk_create([Parameter(name=name) for name in names if name not in parameters])
+    for parameter in created:
+        parameters[parameter.name] = parameter.id
+    return parameters
+
+
+def batch_categories(goods):
+    """
+    Collect the categories declared inline by goods, as CSV price lists have no category header.
+
+    Empty names do not declare a category, as COPY loads them as NULL.
+
+    Args:
+        goods (list): A batch of price list goods.
+
+    Returns:
+        list: The categories, each a dict with 'id' and 'name' keys.
+    """
+    names = [(item['category'], item.pop('category_name', None)) for item in goods]
+    return [{'id': category_id, 'name': name} for category_id, name in names if name]
+
+
+def create_goods(shop, goods, products, parameters):
+    """
+    Insert goods and their parameters with one bulk_create each.
+
+    Args:
+        shop (Shop): The shop the goods belong to.
+        goods (list): The price list goods.
+        products (dict): The product IDs returned by resolve_products.
+        parameters (dict): The parameter IDs returned by resolve_parameters.
+
+    Returns:
+        tuple: The IDs of the created product infos and the number of written parameters.
+    """
+    product_infos = ProductInfo.objects.bulk_create([
+        ProductInfo(product_id=products[(item['name'], item['category'])],
+                    external_id=item['id'],
+                    model=item['model'],
+                    price=item['price'],
+                    price_rrc=item['price_rrc'],
+                    quantity=item['quantity'],
+                    shop_id=shop.id)
+        for item in goods
+    ])
+    product_parameters = ProductParameter.objects.bulk_create([
+        ProductParameter(product_info_id=product_info.id,
+                         parameter_id=parameters[str(name)],
+                         value=value)
+        for product_info, item in zip(product_infos, goods)
+        for name, value in item['parameters'].items()
+    ])
+    return [product_info.id for product_info in product_infos], len(product_parameters)
+
+
+def import_price_list(user_id, data, progress=None):
+    """
+    Import a supplier price list, replacing the current assortment of the shop.
+
+    The goods are consumed in batches of PRICE_LIST_BATCH_SIZE entries. For every batch
+    categories, products and parameters are resolved with one lookup each and all rows
+    are inserted with bulk_create, so the number of SQL statements depends only on the
+    number of batches. Price lists of at least PRICE_LIST_COPY_THRESHOLD goods are loaded
+    with copy_goods instead, which streams them into a staging table with COPY. The whole
+    import runs inside a single transaction. The replaced goods are removed from baskets,
+    placed orders keep their snapshots.
+
+    Args:
+        user_id (int): The ID of the user owning the shop.
+        data (dict): The parsed price list with 'shop', 'categories' and 'goods' keys.
+        progress (callable): Called with the number of processed goods after every batch.
+
+    Returns:
+        Shop: The shop the price list was imported into.
+    """
+    rows_processed = 0
+    with transaction.atomic():
+        shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user_id)
+        save_categories(shop, data['categories'])
+        basket_ids = list(Order.objects.filter(status='basket', order_items__product_info__shop_id=shop.id).values_list(
+            'id', flat=True).distinct())
+        OrderItem.objects.filter(order_id__in=basket_ids, product_info__shop_id=shop.id).delete()
+        ProductInfo.objects.filter(shop_id=shop.id).delete()
+        update_order_totals(basket_ids)
+        goods = iter(data['goods'])
+        head = list(islice(goods, settings.PRICE_LIST_COPY_THRESHOLD))
+        if len(head) == settings.PRICE_LIST_COPY_THRESHOLD:
+            copy_goods(shop, chain(head, goods), progress)
+        else:
+            for goods in iter_batches(head, settings.PRICE_LIST_BATCH_SIZE):
+                save_categories(shop, batch_categories(goods))
+                product_info_ids, _ = create_goods(shop, goods, resolve_products(goods), resolve_parameters(goods))
+                refresh_search_entries(product_info_ids)
+                rows_processed += len(goods)
+                if progress is not None:
+                    progress(rows_processed)
+        bump_catalog_version([shop.id])
+    return shop
+
+
+def sync_goods(shop, goods, summary, pending=None):
+    """
+    Synchronize one batch of goods with the rows stored for the shop.
+
+    Args:
+        shop (Shop): The shop the goods belong to.
+        goods (list): A batch of price list goods with unique IDs.
+        summary (dict): The change counters updated in place.
+        pending (dict): Collects the new goods by ID instead of inserting them, so they can
+            be loaded with copy_new_goods.
+    """
+    products = resolve_products(goods)
+    parameters = resolve_parameters(goods)
+
+    existing = {}
+    duplicate_ids = []
+    for product_info in ProductInfo.objects.filter(shop_id=shop.id,
+                                                   external_id__in=[item['id'] for item in goods]).order_by('id'):
+        if product_info.external_id in existing:
+            duplicate_ids.append(existing[product_info.external_id].id)
+        existing[product_info.external_id] = product_info
+    current_parameters = defaultdict(dict)
+    for product_parameter in ProductParameter.objects.filter(
+            product_info_id__in=[product_info.id for product_info in existing.values()]):
+        current_parameters[product_parameter.product_info_id][product_parameter.parameter_id] = product_parameter
+
+    new_goods = []
+    reindexed_ids = []
+    changed_infos = []
+    changed_fields = set()
+    parameters_to_create = []
+    parameters_to_update = []
+    parameters_to_delete = []
+    for item in goods:
+        product_info = existing.get(item['id'])
+        if product_info is None:
+            new_goods.append(item)
+            continue
+
+        values = {
+            'product_id': products[(item['name'], item['category'])],
+            'model': item['model'],
+            'price': item['price'],
+            'price_rrc': item['price_rrc'],
+            'quantity': item['quantity'],
+            'is_active': True,
+        }
+        fields = [field for field, value in values.items() if getattr(product_info, field) != value]
+        for field in fields:
+            setattr(product_info, field, values[field])
+        changed_fields.update(fields)
+
+        stored_parameters = current_parameters.pop(product_info.id, {})
+        parameters_changed = False
+        for name, value in item['parameters'].items():
+            parameter_id, value = parameters[str(name)], str(value)
+            product_parameter = stored_parameters.pop(parameter_id, None)
+            if product_parameter is None:
+                parameters_to_create.append(ProductParameter(product_info_id=product_info.id,
+                                                             parameter_id=parameter_id, value=value))
+                parameters_changed = True
+            elif product_parameter.value != value:
+                product_parameter.value = value
+                parameters_to_update.append(product_parameter)
+                parameters_changed = True
+        if stored_parameters:
+            parameters_to_delete.extend(product_parameter.id for product_parameter in stored_parameters.values())
+            parameters_changed = True
+
+        if fields:
+            changed_infos.append(product_info)
+        if parameters_changed or 'product_id' in fields or 'model' in fields:
+            reindexed_ids.append(product_info.id)
+        if fields or parameters_changed:
+            summary['updated'] += 1
+        else:
+            summary['unchanged'] += 1
+
+    if changed_infos:
+        ProductInfo.objects.bulk_update(changed_infos, sorted(changed_fields))
+    if 'price' in changed_fields:
+        update_basket_totals([product_info.id for product_info in changed_infos])
+    if duplicate_ids:
+        summary['retired'] += ProductInfo.objects.filter(id__in=duplicate_ids, is_active=True).update(is_active=False)
+    if parameters_to_delete:
+        ProductParameter.objects.filter(id__in=parameters_to_delete).delete()
+    if parameters_to_update:
+        ProductParameter.objects.bulk_update(parameters_to_update, ['value'])
+    ProductParameter.objects.bulk_create(parameters_to_create)
+    if pending is None:
+        created_ids, parameters_created = create_goods(shop, new_goods, products, parameters)
+        summary['created'] += len(new_goods)
+    else:
+        pending.update((item['id'], item) for item in new_goods)
+        created_ids, parameters_created = [], 0
+    refresh_search_entries(reindexed_ids + created_ids)
+    summary['parameters_updated'] += len(parameters_to_create) + len(parameters_to_update) \
+        + len(parameters_to_delete) + parameters_created
+
+
+def copy_new_goods(shop, pending, summary):
+    """
+    Load the new goods collected by sync_goods with copy_goods and empty the collection.
+
+    Args:
+        shop (Shop): The shop the goods belong to.
+        pending (dict): The new goods keyed by ID.
+        summary (dict): The change counters updated in place.
+    """
+    summary['created'] += copy_goods(shop, pending.values())
+    summary['parameters_updated'] += sum(len(item['parameters']) for item in pending.values())
+    pending.clear()
+
+
+def sync_price_list(user_id, data, progress=None):
+    """
+    Synchronize the shop's assortment with a supplier price list.
+
+    Rows are matched by (shop, external_id): new goods are inserted, changed prices,
+    quantities and parameters are written with bulk_update, and goods missing from the
+    price list are retired instead of deleted, so order items keep their product info.
+    The goods are processed in batches of PRICE_LIST_BATCH_SIZE entries inside a single
+    transaction. In price lists of at least PRICE_LIST_COPY_THRESHOLD goods the new goods
+    are collected and loaded with copy_goods whenever that many are pending and at the end.
+
+    Args:
+        user_id (int): The ID of the user owning the shop.
+        data (dict): The parsed price list with 'shop', 'categories' and 'goods' keys.
+        progress (callable): Called with the number of processed goods after every batch.
+
+    Returns:
+        dict: The number of created, updated, unchanged and retired goods and of written parameters.
+    """
+    summary = {'created': 0, 'updated': 0, 'unchanged': 0, 'retired': 0, 'parameters_updated': 0}
+    seen = set()
+    rows_processed = 0
+    with transaction.atomic():
+        shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user_id)
+        save_categories(shop, data['categories'])
+        goods = iter(data['goods'])
+        head = list(islice(goods, settings.PRICE_LIST_COPY_THRESHOLD))
+        pending = {} if len(head) == settings.PRICE_LIST_COPY_THRESHOLD else None
+        for goods in iter_batches(chain(head, goods), settings.PRICE_LIST_BATCH_SIZE):
+            rows_processed += len(goods)
+            goods = list({item['id']: item for item in goods}.values())
+            save_categories(shop, batch_categories(goods))
+            seen.update(item['id'] for item in goods)
+            if pending:
+                # Goods repeated from an earlier batch replace the pending row, as the ORM batches update it.
+                for item in goods:
+                    if item['id'] in pending:
+                        summary['unchanged' if pending[item['id']] == item else 'updated'] += 1
+                        pending[item['id']] = item
+                goods = [item for item in goods if pending.get(item['id']) is not item]
+            sync_goods(shop, goods, summary, pending)
+            if pending is not None and len(pending) >= settings.PRICE_LIST_COPY_THRESHOLD:
+                copy_new_goods(shop, pending, summary)
+            if progress is not None:
+                progress(rows_processed)
+        if pending:
+            copy_new_goods(shop, pending, summary)
+
+        retired_ids = [product_info_id for product_info_id, external_id
+                       in ProductInfo.objects.filter(shop_id=shop.id, is_active=True).values_list('id', 'external_id')
+                       if external_id not in seen]
+        if retired_ids:
+            summary['retired'] += ProductInfo.objects.filter(id__in=retired_ids).update(is_active=False)
+        bump_catalog_version([shop.id])
+    return summary
@@ -0,0 +1,100 @@
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+from requests import get
+
+from .importers import import_price_list, sync_price_list
+from .models import ImportJob, Shop
+from .parsers import detect_format, parse_price_list
+
+DOWNLOAD_TIMEOUT = 60
+
+
+def claim_import_job():
+    """
+    Take the oldest queued import job, skipping jobs already locked by other workers.
+
+    Returns:
+        ImportJob: The claimed job moved to the downloading phase, or None if the queue is empty.
+    """
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update(skip_locked=True).filter(phase='queued').order_by('id').first()
+        if job is not None:
+            job.phase = 'downloading'
+            job.started_at = timezone.now()
+            job.save(update_fields=['phase', 'started_at'])
+    return job
+
+
+def progress_reporter(job):
+    """
+    Build a callback storing the number of processed rows of a job.
+
+    The row is updated over a separate autocommit connection, so the progress is visible
+    to the status endpoint while the import transaction is still open.
+
+    Args:
+        job (ImportJob): The running job.
+
+    Returns:
+        tuple: The callback and the connection that must be closed once the job is finished.
+    """
+    connection = connections.create_connection(DEFAULT_DB_ALIAS)
+
+    def report(rows_processed):
+        job.rows_processed = rows_processed
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {ImportJob._meta.db_table} SET rows_processed = %s WHERE id = %s',
+                           [rows_processed, job.id])
+
+    return report, connection
+
+
+def run_import_job(job):
+    """
+    Stream and import the price list of a claimed job, recording its progress on the job.
+
+    CSV price lists carry no shop name, so they are imported into the user's shop, or for a
+    first import into a new shop named by the job.
+
+    Args:
+        job (ImportJob): The job returned by claim_import_job.
+    """
+    progress, progress_connection = progress_reporter(job)
+    try:
+        with get(job.url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            shop = Shop.objects.filter(user_id=job.user_id).values_list('name', flat=True).first() or job.shop
+            data = parse_price_list(response.raw, detect_format(job.url, response.headers.get('Content-Type', '')),
+                                    shop=shop)
+            job.phase = 'importing'
+            job.save(update_fields=['phase'])
+            if job.mode == 'replace':
+                import_price_list(job.user_id, data, progress=progress)
+                job.summary = {'created': job.rows_processed}
+            else:
+                job.summary = sync_price_list(job.user_id, data, progress=progress)
+        job.phase = 'done'
+    except Exception as e:
+        job.phase = 'failed'
+        job.error = str(e)
+    finally:
+        progress_connection.close()
+    job.finished_at = timezone.now()
+    job.save(update_fields=['phase', 'rows_processed', 'summary', 'error', 'finished_at'])
+
+
+def run_pending_import_jobs():
+    """
+    Process queued import jobs until the queue is empty.
+
+    Returns:
+        int: The number of processed jobs.
+    """
+    processed = 0
+    job = claim_import_job()
+    while job is not None:
+        run_import_job(job)
+        processed += 1
+        job = claim_import_job()
+    return processed
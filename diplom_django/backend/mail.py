@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+
+def enqueue_email(subject, body, recipients, from_email=None):
+    """
+    Queue an email in the outbox instead of sending it during the request.
+
+    The row is written in the current transaction, so the email is sent only if the
+    change that caused it is committed.
+
+    Args:
+        subject (str): The subject of the email.
+        body (str): The text of the email.
+        recipients (list): The recipient addresses.
+        from_email (str): The sender address, EMAIL_HOST_USER when None.
+
+    Returns:
+        EmailOutbox: The queued email.
+    """
+    return EmailOutbox.objects.create(subject=subject, body=body, recipients=list(recipients),
+                                      from_email=from_email or settings.EMAIL_HOST_USER)
+
+
+def retry_email(email, error):
+    """
+    Record a failed delivery attempt and schedule the next one with exponential backoff.
+
+    Args:
+        email (EmailOutbox): The email that could not be sent.
+        error (Exception): The delivery error.
+    """
+    email.attempts += 1
+    email.error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = timezone.now() + timedelta(
+            seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1))
+
+
+def claim_outbox_batch():
+    """
+    Lease one batch of due emails to this worker.
+
+    The batch is selected with SKIP LOCKED and its next attempt is moved EMAIL_OUTBOX_LEASE
+    seconds ahead before the transaction commits, so other workers do not see the emails
+    as due while they are sent. If the worker dies, the emails are sent again after the
+    lease runs out.
+
+    Returns:
+        list: The leased emails.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(EmailOutbox.objects.select_for_update(skip_locked=True).filter(
+            status='pending', next_attempt_at__lte=now).order_by('id')[:settings.EMAIL_OUTBOX_BATCH_SIZE])
+        EmailOutbox.objects.filter(id__in=[email.id for email in emails]).update(
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE))
+    return emails
+
+
+def send_outbox_batch():
+    """
+    Send one batch of due emails over a single connection of the configured email backend.
+
+    The batch is leased with claim_outbox_batch and sent outside a transaction, so a slow
+    mail server holds no row locks. The statuses are saved after the batch.
+
+    Returns:
+        int: The number of processed emails.
+    """
+    emails = claim_outbox_batch()
+    if not emails:
+        return 0
+    attempted = set()
+    try:
+        with get_connection() as connection:
+            for email in emails:
+                message = EmailMultiAlternatives(email.subject, email.body, email.from_email, email.recipients,
+                                                 connection=connection)
+                attempted.add(email.id)
+                try:
+                    message.send()
+                except Exception as e:
+                    retry_email(email, e)
+                else:
+                    email.status = 'sent'
+                    email.sent_at = timezone.now()
+    except Exception as e:
+        for email in emails:
+            if email.id not in attempted:
+                retry_email(email, e)
+    EmailOutbox.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'error', 'sent_at'])
+    return len(emails)
+
+
+def send_outbox_emails():
+    """
+    Send due emails from the outbox until no due email is left.
+
+    Returns:
+        int: The number of processed emails.
+    """
+    processed = 0
+    while batch := send_outbox_batch():
+        processed += batch
+    return processed
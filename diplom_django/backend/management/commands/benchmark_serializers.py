@@ -0,0 +1,78 @@
+from time import perf_counter
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from ujson import dumps
+
+from backend.fast_serializers import product_info_values, serialize_orders, serialize_product_infos
+from backend.importers import import_price_list
+from backend.models import Order, OrderItem, ProductInfo, User
+from backend.orders import snapshot_order_items, update_order_totals
+from backend.serializers import OrderSerializer, ProductInfoSerializer
+
+
+def measure(function, repeat):
+    """Return the best wall time of several calls of function."""
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    """
+    Compare the DRF serializers with the fast read path on generated fixture data.
+    """
+    help = 'Benchmark the catalog and order serializers. The generated data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Number of generated products.')
+        parser.add_argument('--orders', type=int, default=200, help='Number of generated orders.')
+        parser.add_argument('--items', type=int, default=10, help='Number of items per order.')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of runs of every serializer.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['products'], options['orders'], options['items'])
+            products = ProductInfo.objects.filter(shop__name='Benchmark shop')
+            orders = Order.objects.filter(user__email='benchmark@example.com')
+            cases = [
+                ('products', lambda: JSONRenderer().render(ProductInfoSerializer(
+                    products.select_related('product__category').prefetch_related('product_parameters__parameter'),
+                    many=True).data),
+                 lambda: dumps(serialize_product_infos(list(products.values(*product_info_values()))))),
+                ('orders', lambda: JSONRenderer().render(OrderSerializer(orders.prefetch_related(
+                    'order_items__product_info__product__category',
+                    'order_items__product_info__product_parameters__parameter'), many=True).data),
+                 lambda: dumps(serialize_orders(orders))),
+            ]
+            for name, drf, fast in cases:
+                drf_time = measure(drf, options['repeat'])
+                fast_time = measure(fast, options['repeat'])
+                self.stdout.write(f'{name}: DRF {drf_time * 1000:.1f} ms, fast {fast_time * 1000:.1f} ms, '
+                                  f'{drf_time / fast_time:.1f}x faster')
+            transaction.set_rollback(True)
+
+    def seed(self, products, orders, items):
+        shop_user, buyer = User.objects.bulk_create([User(email='benchmark-shop@example.com', type='shop'),
+                                                     User(email='benchmark@example.com', type='buyer')])
+        import_price_list(shop_user.id, {
+            'shop': 'Benchmark shop',
+            'categories': [{'id': 900000 + category, 'name': f'Benchmark {category}'} for category in range(10)],
+            'goods': [{'id': external_id, 'category': 900000 + external_id % 10, 'name': f'Product {external_id}',
+                       'model': f'model/{external_id}', 'price': 100 + external_id, 'price_rrc': 200 + external_id,
+                       'quantity': 10, 'parameters': {'Цвет': 'черный', 'Память (Гб)': external_id % 512}}
+                      for external_id in range(products)],
+        })
+        product_info_ids = list(ProductInfo.objects.filter(shop__user=shop_user).values_list('id', flat=True))
+        created = Order.objects.bulk_create([Order(user=buyer, status='new') for _ in range(orders)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_info_id=product_info_ids[(number * items + item) % len(product_info_ids)],
+                      quantity=1 + item)
+            for number, order in enumerate(created) for item in range(items)
+        ])
+        snapshot_order_items([order.id for order in created])
+        update_order_totals([order.id for order in created])
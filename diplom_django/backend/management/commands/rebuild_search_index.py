@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.models import ProductInfo
+from backend.parsers import iter_batches
+from backend.search import refresh_search_entries
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the catalog search documents of all product infos.
+    """
+    help = 'Rebuild the catalog search table, e.g. after the search configuration changed.'
+
+    def handle(self, *args, **options):
+        product_info_ids = ProductInfo.objects.order_by('id').values_list('id', flat=True).iterator()
+        rows = 0
+        for batch in iter_batches(product_info_ids, settings.PRICE_LIST_BATCH_SIZE):
+            refresh_search_entries(batch)
+            rows += len(batch)
+        self.stdout.write(f'Indexed {rows} product(s)')
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.models import Order, ShopOrder
+from backend.orders import calculate_order_totals, save_order_totals
+from backend.parsers import iter_batches
+
+
+class Command(BaseCommand):
+    """
+    Compare the stored order totals with the order items and fix the drifted ones.
+    """
+    help = 'Recalculate the stored totals of orders and of their per-shop parts that drifted from the order items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drifted orders.')
+
+    def handle(self, *args, **options):
+        order_ids = Order.objects.order_by('id').values_list('id', flat=True).iterator()
+        checked = drifted = 0
+        for batch in iter_batches(order_ids, settings.PRICE_LIST_BATCH_SIZE):
+            with transaction.atomic():
+                orders, shops = calculate_order_totals(batch)
+                stored_orders = {order_id: (total_sum, items_count) for order_id, total_sum, items_count
+                                 in Order.objects.filter(id__in=batch).values_list('id', 'total_sum', 'items_count')}
+                stored_shops = {(order_id, shop_id): (total_sum, items_count)
+                                for order_id, shop_id, total_sum, items_count in ShopOrder.objects.filter(
+                                    order_id__in=batch).values_list('order_id', 'shop_id', 'total_sum', 'items_count')}
+                drifted_ids = {order_id for order_id in orders if orders[order_id] != stored_orders.get(order_id)}
+                drifted_ids.update(order_id for order_id, _ in shops.keys() ^ stored_shops.keys())
+                drifted_ids.update(order_id for order_id, shop_id in shops.keys() & stored_shops.keys()
+                                   if shops[(order_id, shop_id)] != stored_shops[(order_id, shop_id)])
+                if drifted_ids and not options['dry_run']:
+                    save_order_totals({order_id: orders[order_id] for order_id in drifted_ids},
+                                      {key: value for key, value in shops.items() if key[0] in drifted_ids})
+            checked += len(batch)
+            drifted += len(drifted_ids)
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(f'Checked {checked} order(s). {action} {drifted} drifted order(s)')
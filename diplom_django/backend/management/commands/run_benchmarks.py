@@ -0,0 +1,67 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+
+from backend.benchmarks import SCENARIOS, compare_with_baseline, connection_overhead, run_scenario, \
+    seed_benchmark_data
+
+
+class Command(BaseCommand):
+    """
+    Measure the API scenarios on generated data and compare them with the stored baselines.
+
+    The data is generated and measured in one transaction that is rolled back, and its
+    locks are held until the end of the run, so the command refuses to run outside DEBUG
+    unless --force confirms a dedicated database. Catalog responses are cached in the
+    separate 'benchmark' cache instead of the shared catalog cache.
+    """
+    help = 'Benchmark the API endpoints. The generated data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=5, help='Number of generated shops.')
+        parser.add_argument('--products', type=int, default=500, help='Number of products per shop.')
+        parser.add_argument('--orders', type=int, default=200, help='Number of generated placed orders.')
+        parser.add_argument('--iterations', type=int, default=20, help='Number of runs of every scenario.')
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help='Scenario to run, all when omitted. May be repeated.')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'baselines.json'),
+                            help='JSON file with the baseline measurements.')
+        parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative p95 latency increase over the baseline.')
+        parser.add_argument('--force', action='store_true',
+                            help='Run with DEBUG off, only against a database dedicated to benchmarks.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('The benchmark locks and fills the configured database until it ends. Run it with '
+                               'DEBUG on, or pass --force to run it against a dedicated database.')
+        results = {}
+        with override_settings(CATALOG_CACHE_ALIAS='benchmark'), transaction.atomic():
+            data = seed_benchmark_data(options['shops'], options['products'], options['orders'])
+            for name in options['scenario'] or SCENARIOS:
+                results[name] = run_scenario(name, data, options['iterations'])
+                self.stdout.write('{name}: {requests} requests, {throughput} req/s, p50 {p50} ms, p95 {p95} ms, '
+                                  'p99 {p99} ms, {queries} queries/request'.format(name=name, **results[name]))
+            transaction.set_rollback(True)
+        caches['benchmark'].clear()
+        self.stdout.write('connection: {new} ms with a new connection, {persistent} ms with a persistent one, '
+                          '{saved} ms saved per request'.format(**connection_overhead(options['iterations'])))
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+            baseline.update(results)
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f'Saved the baseline to {baseline_path}')
+        elif baseline_path.exists():
+            regressions = compare_with_baseline(results, json.loads(baseline_path.read_text()), options['tolerance'])
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+            self.stdout.write('No regressions against the baseline')
@@ -0,0 +1,25 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from backend.jobs import run_pending_import_jobs
+
+
+class Command(BaseCommand):
+    """
+    Worker processing the queued price list imports outside the web workers.
+    """
+    help = 'Process queued price list import jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait for new jobs.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_pending_import_jobs()
+            if processed:
+                self.stdout.write(f'Processed {processed} import job(s)')
+            if options['once']:
+                break
+            sleep(options['interval'])
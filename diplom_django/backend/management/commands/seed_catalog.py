@@ -0,0 +1,47 @@
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from backend.importers import import_price_list
+from backend.models import ProductInfo
+from backend.parsers import detect_format, parse_price_list
+from backend.seeding import generate_price_list, reset_catalog
+
+
+class Command(BaseCommand):
+    """
+    Load local price list files or generated price lists into the catalog.
+
+    Every price list replaces the assortment of its shop, so loading the same files again
+    gives the same catalog. Shops loaded by this command have no owner.
+    """
+    help = 'Seed the catalog from price list files (YAML, JSON lines or CSV) or with generated price lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Price list files. CSV shops are named after the file.')
+        parser.add_argument('--shops', type=int, default=0, help='Number of generated shops.')
+        parser.add_argument('--products', type=int, default=1000, help='Number of goods per generated shop.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Delete the catalog, the orders and the shops before loading.')
+
+    def handle(self, *args, **options):
+        if not options['files'] and not options['shops'] and not options['reset']:
+            raise CommandError('Pass price list files, --shops or --reset.')
+        start = perf_counter()
+        shop_ids = []
+        with transaction.atomic():
+            if options['reset']:
+                reset_catalog(orders=True)
+            for path in options['files']:
+                try:
+                    with open(path, 'rb') as stream:
+                        data = parse_price_list(stream, detect_format(path), shop=Path(path).stem)
+                        shop_ids.append(import_price_list(None, data).id)
+                except (OSError, ValueError) as e:
+                    raise CommandError(f'{path}: {e}')
+            for number in range(1, options['shops'] + 1):
+                shop_ids.append(import_price_list(None, generate_price_list(number, options['products'])).id)
+        goods = ProductInfo.objects.filter(shop_id__in=shop_ids).count()
+        self.stdout.write(f'Loaded {goods} goods of {len(shop_ids)} shop(s) in {perf_counter() - start:.1f}s')
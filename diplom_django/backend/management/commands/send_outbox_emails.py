@@ -0,0 +1,25 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from backend.mail import send_outbox_emails
+
+
+class Command(BaseCommand):
+    """
+    Worker sending the queued emails outside the web workers.
+    """
+    help = 'Send the queued emails from the outbox, retrying failed ones with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no due email is left.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait for new emails.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = send_outbox_emails()
+            if processed:
+                self.stdout.write(f'Processed {processed} email(s)')
+            if options['once']:
+                break
+            sleep(options['interval'])
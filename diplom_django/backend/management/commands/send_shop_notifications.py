@@ -0,0 +1,27 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from backend.notifications import send_shop_notifications
+
+
+class Command(BaseCommand):
+    """
+    Worker delivering the digests of new orders to the shops.
+    """
+    help = 'Send the shops digests of their new orders by webhook or email, honouring their notification interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit after one pass over the due shops.')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between the passes.')
+
+    def handle(self, *args, **options):
+        while True:
+            notified, errors = send_shop_notifications()
+            if notified:
+                self.stdout.write(f'Notified shops about {notified} order(s)')
+            for shop_id, error in errors.items():
+                self.stderr.write(f'Shop {shop_id}: {error}')
+            if options['once']:
+                break
+            sleep(options['interval'])
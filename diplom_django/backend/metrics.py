@@ -0,0 +1,255 @@
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from hmac import compare_digest
+from ipaddress import ip_address, ip_network
+from threading import Lock
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+from rest_framework.renderers import JSONRenderer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Query count, DB time and serialization time of one request.
+
+    An instance is installed as the execute wrapper of the database connections, so
+    it sees every query run by the request's thread.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += perf_counter() - start
+
+
+@contextmanager
+def serialization_timer():
+    """
+    Add the time spent in the block, without its queries, to the serialization time of the current request.
+
+    Also usable as a decorator. Nested timers are counted once.
+    """
+    metrics = current_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start, db_time = perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serialization_time += perf_counter() - start - (metrics.db_time - db_time)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSON renderer counting the rendering time of DRF responses as serialization time.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serialization_timer():
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe per-process totals of the request metrics keyed by URL name.
+    """
+
+    def __init__(self):
+        self.views = {}
+        self.listeners = []
+        self.lock = Lock()
+
+    def record(self, view, queries, db_time, serialization_time, total_time):
+        with self.lock:
+            totals = self.views.setdefault(view, {
+                'requests': 0, 'queries': 0, 'db_time': 0.0, 'serialization_time': 0.0, 'total_time': 0.0,
+                'buckets': [0] * len(LATENCY_BUCKETS)})
+            totals['requests'] += 1
+            totals['queries'] += queries
+            totals['db_time'] += db_time
+            totals['serialization_time'] += serialization_time
+            totals['total_time'] += total_time
+            for number, bound in enumerate(LATENCY_BUCKETS):
+                if total_time <= bound:
+                    totals['buckets'][number] += 1
+            for listener in self.listeners:
+                listener.append({'view': view, 'queries': queries, 'db_time': db_time,
+                                 'serialization_time': serialization_time, 'total_time': total_time})
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        """
+        Render the totals in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        with self.lock:
+            views = {view: {**totals, 'buckets': list(totals['buckets'])} for view, totals in self.views.items()}
+        lines = []
+        for name, key, kind, description in (
+                ('api_requests_total', 'requests', 'counter', 'Handled requests.'),
+                ('api_request_queries_total', 'queries', 'counter', 'SQL queries run by the requests.'),
+                ('api_request_db_seconds_total', 'db_time', 'counter', 'Time spent in SQL queries.'),
+                ('api_request_serialization_seconds_total', 'serialization_time', 'counter',
+                 'Time spent serializing responses.')):
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            lines += [f'{name}{{view="{label(view)}"}} {totals[key]}' for view, totals in sorted(views.items())]
+        name = 'api_request_duration_seconds'
+        lines += [f'# HELP {name} Total request handling time.', f'# TYPE {name} histogram']
+        for view, totals in sorted(views.items()):
+            for bound, count in zip(LATENCY_BUCKETS, totals['buckets']):
+                lines.append(f'{name}_bucket{{view="{label(view)}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{view="{label(view)}",le="+Inf"}} {totals["requests"]}')
+            lines.append(f'{name}_sum{{view="{label(view)}"}} {totals["total_time"]}')
+            lines.append(f'{name}_count{{view="{label(view)}"}} {totals["requests"]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+
+def label(value):
+    """Escape a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def view_name(request):
+    """Get the URL name of the handled request."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+class QueryMetricsMiddleware:
+    """
+    Middleware recording the query count, DB, serialization and total time of every request.
+
+    The totals are kept per URL name and served by metrics_view. In debug mode they are
+    also returned in the X-Query-Count and Server-Timing headers. Async views run their
+    queries in executor threads, so only their total time is recorded.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        reset = current_metrics.set(metrics)
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(reset)
+        return self.finish(request, response, metrics, perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        start = perf_counter()
+        response = await self.get_response(request)
+        return self.finish(request, response, metrics, perf_counter() - start)
+
+    def finish(self, request, response, metrics, total_time):
+        metrics_registry.record(view_name(request), metrics.queries, metrics.db_time, metrics.serialization_time,
+                                total_time)
+        if settings.DEBUG:
+            response['X-Query-Count'] = metrics.queries
+            response['Server-Timing'] = (f'db;dur={metrics.db_time * 1000:.2f}, '
+                                         f'serialize;dur={metrics.serialization_time * 1000:.2f}, '
+                                         f'total;dur={total_time * 1000:.2f}')
+        return response
+
+
+def scrape_allowed(request):
+    """
+    Tell whether a request may read the metrics.
+
+    Scrapers either send METRICS_TOKEN as 'Authorization: Bearer <token>' or connect from
+    one of the METRICS_ALLOWED_NETWORKS. The address is REMOTE_ADDR, never a client header.
+
+    Args:
+        request (HttpRequest): The scrape request.
+
+    Returns:
+        bool: True if the metrics may be served.
+    """
+    if settings.METRICS_TOKEN:
+        keyword, _, token = request.headers.get('Authorization', '').partition(' ')
+        if keyword.lower() == 'bearer' and compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+            return True
+    try:
+        address = ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """
+    Serve the request metrics of this process in the Prometheus text format.
+
+    Args:
+        request (HttpRequest): The scrape request.
+
+    Returns:
+        HttpResponse: The metrics, or a 403 response if the scraper is not allowed.
+    """
+    if not scrape_allowed(request):
+        return JsonResponse({'status': False, 'error': 'Forbidden'}, status=403)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@contextmanager
+def query_budget(budgets):
+    """
+    Fail if a request to a view runs more queries than its budget, for use in tests.
+
+    Args:
+        budgets (dict): The maximum queries per request keyed by URL name, e.g. {'backend:basket': 6}.
+
+    Raises:
+        AssertionError: If a request handled in the block exceeded its budget.
+    """
+    captured = []
+    with metrics_registry.lock:
+        metrics_registry.listeners.append(captured)
+    try:
+        yield captured
+    finally:
+        with metrics_registry.lock:
+            metrics_registry.listeners.remove(captured)
+    exceeded = [f'{request["view"]} ran {request["queries"]} queries, budget {budgets[request["view"]]}'
+                for request in captured
+                if request['view'] in budgets and request['queries'] > budgets[request['view']]]
+    assert not exceeded, 'Query budgets exceeded:\n' + '\n'.join(exceeded)
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-17 04:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_productinfo_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Ссылка на прайс-лист')),
+                ('mode', models.CharField(default='sync', max_length=10, verbose_name='Режим импорта')),
+                ('phase', models.CharField(choices=[('queued', 'В очереди'), ('downloading', 'Загрузка прайс-листа'), ('importing', 'Импорт товаров'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Этап')),
+                ('rows_processed', models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')),
+                ('summary', models.JSONField(blank=True, default=dict, verbose_name='Итоги импорта')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача импорта',
+                'verbose_name_plural': 'Список задач импорта',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.4 on 2026-10-17 04:15
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+CREATE_TRIGRAM_INDEX = '''
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS productsearch_text_trgm_idx ON backend_productsearch USING gin (text gin_trgm_ops);
+    END IF;
+END
+$$;
+'''
+
+DROP_TRIGRAM_INDEX = 'DROP INDEX IF EXISTS productsearch_text_trgm_idx;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_shop_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearch',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='backend.productinfo', verbose_name='Информация о продукте')),
+                ('text', models.TextField(verbose_name='Текст для поиска')),
+                ('document', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+            options={
+                'verbose_name': 'Поисковый индекс продукта',
+                'verbose_name_plural': 'Поисковый индекс каталога',
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['document'], name='productsearch_document_idx')],
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGRAM_INDEX, DROP_TRIGRAM_INDEX),
+    ]
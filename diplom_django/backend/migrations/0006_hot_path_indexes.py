@@ -0,0 +1,47 @@
+# Generated by Django 5.0.4 on 2026-10-17 04:17
+
+from django.db import migrations, models
+
+
+def merge_duplicate_baskets(apps, schema_editor):
+    """Move the items of extra baskets into the oldest basket of each user."""
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    baskets = {}
+    for order_id, user_id in Order.objects.filter(status='basket').order_by('id').values_list('id', 'user_id'):
+        if user_id in baskets:
+            OrderItem.objects.filter(order_id=order_id).update(order_id=baskets[user_id])
+            Order.objects.filter(id=order_id).delete()
+        else:
+            baskets[user_id] = order_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_productsearch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parameter',
+            index=models.Index(fields=['name'], name='parameter_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'category'], name='product_name_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'external_id'], name='productinfo_shop_external_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_baskets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'basket')), fields=('user',), name='unique_user_basket'),
+        ),
+    ]
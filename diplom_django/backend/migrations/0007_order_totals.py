@@ -0,0 +1,60 @@
+# Generated by Django 5.0.4 on 2026-10-17 04:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма заказа'),
+        ),
+        migrations.CreateModel(
+            name='ShopOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма заказа')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='Количество позиций')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.order', verbose_name='Заказ')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Заказ магазина',
+                'verbose_name_plural': 'Список заказов магазинов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoporder',
+            constraint=models.UniqueConstraint(fields=('order', 'shop'), name='unique_shop_order'),
+        ),
+        migrations.RunSQL(
+            '''
+            INSERT INTO backend_shoporder (order_id, shop_id, total_sum, items_count)
+            SELECT order_item.order_id, product_info.shop_id,
+                   SUM(order_item.quantity * product_info.price), COUNT(*)
+            FROM backend_orderitem order_item
+            JOIN backend_productinfo product_info ON product_info.id = order_item.product_info_id
+            GROUP BY order_item.order_id, product_info.shop_id;
+            UPDATE backend_order SET total_sum = totals.total_sum, items_count = totals.items_count
+            FROM (
+                SELECT order_id, SUM(total_sum) AS total_sum, SUM(items_count) AS items_count
+                FROM backend_shoporder
+                GROUP BY order_id
+            ) totals
+            WHERE totals.order_id = backend_order.id;
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.4 on 2026-10-17 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Цена на момент заказа'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_snapshot',
+            field=models.JSONField(blank=True, null=True, verbose_name='Товар на момент заказа'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product_info',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='backend.productinfo', verbose_name='Информация о продукте.'),
+        ),
+        migrations.RunSQL(
+            '''
+            UPDATE backend_orderitem order_item
+            SET price = product_info.price,
+                product_snapshot = jsonb_build_object(
+                    'id', product_info.id,
+                    'model', product_info.model,
+                    'product', jsonb_build_object('name', product.name, 'category', category.name),
+                    'shop', product_info.shop_id,
+                    'quantity', product_info.quantity,
+                    'price', product_info.price,
+                    'price_rrc', product_info.price_rrc,
+                    'product_parameters', coalesce((
+                        SELECT jsonb_agg(jsonb_build_object('parameter', parameter.name, 'value', product_parameter.value)
+                                         ORDER BY product_parameter.id)
+                        FROM backend_productparameter product_parameter
+                        JOIN backend_parameter parameter ON parameter.id = product_parameter.parameter_id
+                        WHERE product_parameter.product_info_id = product_info.id
+                    ), '[]'::jsonb))
+            FROM backend_order orders, backend_productinfo product_info
+            JOIN backend_product product ON product.id = product_info.product_id
+            LEFT JOIN backend_category category ON category.id = product.category_id
+            WHERE orders.id = order_item.order_id AND orders.status != 'basket'
+              AND product_info.id = order_item.product_info_id;
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.4 on 2026-10-17 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='notification_interval',
+            field=models.PositiveIntegerField(default=0, verbose_name='Интервал уведомлений (мин)'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='notification_webhook',
+            field=models.URLField(blank=True, verbose_name='Webhook уведомлений'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последнее уведомление'),
+        ),
+        migrations.AddField(
+            model_name='shoporder',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Магазин уведомлен'),
+        ),
+        migrations.AddIndex(
+            model_name='shoporder',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['shop'], name='shoporder_unnotified_idx'),
+        ),
+        migrations.RunSQL(
+            '''
+            UPDATE backend_shoporder SET notified_at = now()
+            FROM backend_order
+            WHERE backend_order.id = backend_shoporder.order_id AND backend_order.status != 'basket';
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
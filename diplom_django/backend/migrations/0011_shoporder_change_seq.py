@@ -0,0 +1,31 @@
+# Generated by Django 5.0.4 on 2026-10-17 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_shop_notifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoporder',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, verbose_name='Номер изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='shoporder',
+            index=models.Index(fields=['shop', 'change_seq'], name='shoporder_shop_change_idx'),
+        ),
+        migrations.RunSQL(
+            '''
+            CREATE SEQUENCE backend_shoporder_change_seq;
+            UPDATE backend_shoporder SET change_seq = nextval('backend_shoporder_change_seq')
+            FROM backend_order
+            WHERE backend_order.id = backend_shoporder.order_id AND backend_order.status != 'basket';
+            ''',
+            'DROP SEQUENCE backend_shoporder_change_seq;',
+        ),
+    ]
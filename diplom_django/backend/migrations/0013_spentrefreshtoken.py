@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-17 05:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_user_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpentRefreshToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=32, unique=True, verbose_name='ID токена')),
+                ('spent_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spent_refresh_tokens', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Использованный токен обновления',
+                'verbose_name_plural': 'Список использованных токенов обновления',
+                'indexes': [models.Index(fields=['user', 'spent_at'], name='spentrefresh_user_spent_idx')],
+            },
+        ),
+    ]
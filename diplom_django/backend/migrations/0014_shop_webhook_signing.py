@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-17 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_spentrefreshtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='notification_secret',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Ключ подписи webhook'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='notifying_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Уведомление отправляется до'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.4 on 2026-10-17 05:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_shop_webhook_signing'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_status_idx',
+        ),
+    ]
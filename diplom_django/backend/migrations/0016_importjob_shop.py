@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-17 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_remove_order_user_status_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='shop',
+            field=models.CharField(blank=True, max_length=70, verbose_name='Название магазина'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.4 on 2026-10-17 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_importjob_shop'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='next_notification_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка уведомления'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='notification_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Неудачных попыток уведомления'),
+        ),
+        migrations.RunSQL(
+            '''
+            DELETE FROM backend_shoporder
+            USING backend_order
+            WHERE backend_order.id = backend_shoporder.order_id AND backend_order.status = 'basket';
+            ''',
+            migrations.RunSQL.noop,
+        ),
+    ]
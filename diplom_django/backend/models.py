@@ -1,8 +1,11 @@
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django_rest_passwordreset.tokens import get_token_generator
 from .managers import CustomUserManager
+from django.utils import timezone
 from django.utils.translation import gettext_lazy
 
 
@@ -16,6 +19,20 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+IMPORT_PHASE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('downloading', 'Загрузка прайс-листа'),
+    ('importing', 'Импорт товаров'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+)
+
+EMAIL_STATUS_CHOICES = (
+    ('pending', 'Ожидает отправки'),
+    ('sent', 'Отправлено'),
+    ('failed', 'Ошибка'),
+)
+
 
 class User(AbstractUser):
     """
@@ -35,6 +52,7 @@ class User(AbstractUser):
     is_active = models.BooleanField(gettext_lazy('is_active'), default=False,
                                     help_text=gettext_lazy('Determines whether the user is active'))
     type = models.CharField(verbose_name='Тип пользователя', max_length=5)
+    token_version = models.PositiveIntegerField(verbose_name='Версия токенов', default=0)
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -52,6 +70,14 @@ class Shop(models.Model):
     url = models.URLField(verbose_name='Ссылка магазина', null=True, blank=True)
     user = models.OneToOneField(User, verbose_name='Пользователь', blank=True, null=True, on_delete=models.CASCADE)
     status = models.BooleanField(default=True, verbose_name='Статус получения заказа')
+    catalog_version = models.PositiveIntegerField(default=0, verbose_name='Версия каталога')
+    notification_interval = models.PositiveIntegerField(default=0, verbose_name='Интервал уведомлений (мин)')
+    notification_webhook = models.URLField(verbose_name='Webhook уведомлений', blank=True)
+    notified_at = models.DateTimeField(verbose_name='Последнее уведомление', null=True, blank=True)
+    notification_secret = models.CharField(max_length=64, verbose_name='Ключ подписи webhook', blank=True)
+    notifying_until = models.DateTimeField(verbose_name='Уведомление отправляется до', null=True, blank=True)
+    notification_attempts = models.PositiveSmallIntegerField(verbose_name='Неудачных попыток уведомления', default=0)
+    next_notification_at = models.DateTimeField(verbose_name='Следующая попытка уведомления', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -87,6 +113,7 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Список продуктов'
+        indexes = [models.Index(fields=['name', 'category'], name='product_name_category_idx')]
 
     def __str__(self):
         return self.name
@@ -105,11 +132,13 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество продукта')
     price = models.PositiveIntegerField(verbose_name='Цена продукта')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    is_active = models.BooleanField(default=True, verbose_name='Есть в прайс-листе')
 
     class Meta:
         verbose_name = 'Информация о продукте'
         verbose_name_plural = 'Информационный список о продуктах'
         constraints = [models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info')]
+        indexes = [models.Index(fields=['shop', 'external_id'], name='productinfo_shop_external_idx')]
 
     def __str__(self):
         return f'{self.product.name} {self.model}'
@@ -124,6 +153,7 @@ class Parameter(models.Model):
     class Meta:
         verbose_name = 'Название параметра'
         verbose_name_plural = 'Список названий параметров'
+        indexes = [models.Index(fields=['name'], name='parameter_name_idx')]
 
     def __str__(self):
         return self.name
@@ -148,6 +178,24 @@ class ProductParameter(models.Model):
         return f'{self.product_info.model} {self.parameter.name}'
 
 
+class ProductSearch(models.Model):
+    """
+    ProductSearch model with the denormalized search document of a product info.
+    """
+    product_info = models.OneToOneField(ProductInfo, verbose_name='Информация о продукте', related_name='search',
+                                        primary_key=True, on_delete=models.CASCADE)
+    text = models.TextField(verbose_name='Текст для поиска')
+    document = SearchVectorField(null=True)
+
+    class Meta:
+        verbose_name = 'Поисковый индекс продукта'
+        verbose_name_plural = 'Поисковый индекс каталога'
+        indexes = [GinIndex(fields=['document'], name='productsearch_document_idx')]
+
+    def __str__(self):
+        return self.text
+
+
 class Contact(models.Model):
     """
     Contact model with additional fields.
@@ -178,10 +226,14 @@ class Order(models.Model):
     dt = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, verbose_name='Статус заказа', choices=STATE_CHOICES)
     contact = models.ForeignKey(Contact, verbose_name='Контакт', blank=True, null=True, on_delete=models.CASCADE)
+    total_sum = models.PositiveIntegerField(verbose_name='Сумма заказа', default=0)
+    items_count = models.PositiveIntegerField(verbose_name='Количество позиций', default=0)
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Список заказов'
+        constraints = [models.UniqueConstraint(fields=['user'], condition=models.Q(status='basket'),
+                                               name='unique_user_basket')]
 
     def __str__(self):
         return f'{self.dt}'
@@ -194,15 +246,108 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, verbose_name='Заказ', related_name='order_items', blank=True,
                               on_delete=models.CASCADE)
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте.', related_name='order_items',
-                                     blank=True, on_delete=models.CASCADE)
+                                     blank=True, null=True, on_delete=models.SET_NULL)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена на момент заказа', blank=True, null=True)
+    product_snapshot = models.JSONField(verbose_name='Товар на момент заказа', blank=True, null=True)
 
     class Meta:
         verbose_name = 'Заказанная позиция'
         verbose_name_plural = 'Список заказанных позиций'
 
     def __str__(self):
-        return f'id заказа - {self.order.id}. Товар: {self.product_info.model} {self.quantity}'
+        model = self.product_snapshot['model'] if self.product_snapshot else self.product_info.model
+        return f'id заказа - {self.order.id}. Товар: {model} {self.quantity}'
+
+
+class ShopOrder(models.Model):
+    """
+    ShopOrder model with the part of an order supplied by one shop.
+    """
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='shop_orders', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='shop_orders', on_delete=models.CASCADE)
+    total_sum = models.PositiveIntegerField(verbose_name='Сумма заказа', default=0)
+    items_count = models.PositiveIntegerField(verbose_name='Количество позиций', default=0)
+    notified_at = models.DateTimeField(verbose_name='Магазин уведомлен', null=True, blank=True)
+    change_seq = models.BigIntegerField(verbose_name='Номер изменения', default=0)
+
+    class Meta:
+        verbose_name = 'Заказ магазина'
+        verbose_name_plural = 'Список заказов магазинов'
+        constraints = [models.UniqueConstraint(fields=['order', 'shop'], name='unique_shop_order')]
+        indexes = [models.Index(fields=['shop'], condition=models.Q(notified_at__isnull=True),
+                                name='shoporder_unnotified_idx'),
+                   models.Index(fields=['shop', 'change_seq'], name='shoporder_shop_change_idx')]
+
+    def __str__(self):
+        return f'id заказа - {self.order_id}. Магазин: {self.shop_id}'
+
+
+class ImportJob(models.Model):
+    """
+    ImportJob model for price list imports processed in the background.
+    """
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Ссылка на прайс-лист')
+    shop = models.CharField(max_length=70, verbose_name='Название магазина', blank=True)
+    mode = models.CharField(max_length=10, verbose_name='Режим импорта', default='sync')
+    phase = models.CharField(max_length=20, verbose_name='Этап', choices=IMPORT_PHASE_CHOICES, default='queued')
+    rows_processed = models.PositiveIntegerField(verbose_name='Обработано товаров', default=0)
+    summary = models.JSONField(verbose_name='Итоги импорта', default=dict, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = 'Список задач импорта'
+
+    def __str__(self):
+        return f'{self.url} {self.phase}'
+
+
+class EmailOutbox(models.Model):
+    """
+    EmailOutbox model for emails written together with the change that caused them and sent by a worker.
+    """
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст письма')
+    from_email = models.CharField(max_length=255, verbose_name='Отправитель')
+    recipients = models.JSONField(verbose_name='Получатели', default=list)
+    status = models.CharField(max_length=10, verbose_name='Статус', choices=EMAIL_STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток отправки', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка', default=timezone.now)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Очередь исходящих писем'
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='emailoutbox_status_next_idx')]
+
+    def __str__(self):
+        return f'{self.subject} {self.status}'
+
+
+class SpentRefreshToken(models.Model):
+    """
+    SpentRefreshToken model for the IDs of refresh tokens already exchanged for new tokens.
+    """
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='spent_refresh_tokens',
+                             on_delete=models.CASCADE)
+    jti = models.CharField(max_length=32, unique=True, verbose_name='ID токена')
+    spent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Использованный токен обновления'
+        verbose_name_plural = 'Список использованных токенов обновления'
+        indexes = [models.Index(fields=['user', 'spent_at'], name='spentrefresh_user_spent_idx')]
+
+    def __str__(self):
+        return f'{self.jti} {self.spent_at}'
 
 
 class ConfirmEmailToken(models.Model):
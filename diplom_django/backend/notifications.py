@@ -0,0 +1,258 @@
+import hmac
+from collections import defaultdict
+from datetime import timedelta
+from hashlib import sha256
+from ipaddress import ip_address
+from secrets import token_hex
+from socket import IPPROTO_TCP, gaierror, getaddrinfo
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from requests import RequestException, post
+from ujson import dumps
+
+from .fast_serializers import datetime_field
+from .mail import enqueue_email
+from .models import OrderItem, Shop, ShopOrder
+
+WEBHOOK_TIMEOUT = 10
+WEBHOOK_LEASE = timedelta(seconds=WEBHOOK_TIMEOUT * 6)
+
+
+def check_webhook_url(url):
+    """
+    Check that a webhook URL is https and that its host resolves only to public addresses.
+
+    Partners choose the URL, so without the check the worker could be made to call
+    services of the internal network, e.g. the cloud metadata endpoint.
+
+    Args:
+        url (str): The webhook URL.
+
+    Raises:
+        ValueError: If the URL is not https or its host is missing, unresolvable or not public.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != 'https' or not parts.hostname:
+        raise ValueError('The webhook must be an https URL')
+    try:
+        addresses = getaddrinfo(parts.hostname, parts.port or 443, proto=IPPROTO_TCP)
+    except (gaierror, UnicodeError, ValueError) as e:
+        raise ValueError(f'The webhook host could not be resolved: {e}')
+    for *_, sockaddr in addresses:
+        address = ip_address(sockaddr[0].split('%')[0])
+        address = getattr(address, 'ipv4_mapped', None) or address
+        if not address.is_global or address.is_multicast:
+            raise ValueError('The webhook host must have a public address')
+
+
+def sign_payload(secret, timestamp, body):
+    """
+    Sign a webhook body with the shop's secret.
+
+    Args:
+        secret (str): The shop's notification secret.
+        timestamp (int): The UNIX time of the delivery, signed with the body against replays.
+        body (bytes): The request body.
+
+    Returns:
+        str: The value of the X-Signature header.
+    """
+    digest = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, sha256).hexdigest()
+    return f'sha256={digest}'
+
+
+def deliver_webhook(shop, digest):
+    """
+    Post a digest to the shop's webhook, signed with the shop's secret.
+
+    The URL is checked again right before the call, because the addresses of its host
+    may have changed since it was saved. Redirects are not followed.
+
+    Args:
+        shop (Shop): The notified shop.
+        digest (dict): The digest returned by build_digest.
+
+    Raises:
+        ValueError: If the webhook URL is not allowed.
+        RequestException: If the webhook could not be called.
+    """
+    check_webhook_url(shop.notification_webhook)
+    body = dumps(digest, ensure_ascii=False).encode()
+    timestamp = int(timezone.now().timestamp())
+    post(shop.notification_webhook, data=body, timeout=WEBHOOK_TIMEOUT, allow_redirects=False, headers={
+        'Content-Type': 'application/json',
+        'X-Signature-Timestamp': str(timestamp),
+        'X-Signature': sign_payload(shop.notification_secret, timestamp, body),
+    }).raise_for_status()
+
+
+def due_shop_ids(now):
+    """
+    Find the shops with unnotified placed orders whose digest interval has passed.
+
+    Shops whose webhook failed are skipped until their next attempt is due.
+
+    Args:
+        now (datetime): The current time.
+
+    Returns:
+        list: The IDs of the shops to notify.
+    """
+    rows = ShopOrder.objects.filter(
+        Q(shop__next_notification_at__isnull=True) | Q(shop__next_notification_at__lte=now),
+        notified_at__isnull=True).exclude(order__status='basket').order_by().values_list(
+        'shop_id', 'shop__notification_interval', 'shop__notified_at').distinct()
+    return [shop_id for shop_id, interval, notified_at in rows
+            if notified_at is None or notified_at + timedelta(minutes=interval) <= now]
+
+
+def build_digest(shop, shop_orders):
+    """
+    Collect the lines a shop has to supply for its new orders.
+
+    Only the lines from the shop's own price list are included, read from the order
+    line snapshots.
+
+    Args:
+        shop (Shop): The notified shop.
+        shop_orders (list): The shop's parts of the new orders with their orders selected.
+
+    Returns:
+        dict: The digest with the shop ID and the list of orders.
+    """
+    lines = defaultdict(list)
+    rows = OrderItem.objects.filter(order_id__in=[shop_order.order_id for shop_order in shop_orders],
+                                    product_snapshot__shop=shop.id).order_by('id').values_list(
+        'order_id', 'product_snapshot', 'price', 'quantity')
+    for order_id, snapshot, price, quantity in rows:
+        lines[order_id].append({'product_info': snapshot['id'], 'name': snapshot['product']['name'],
+                                'model': snapshot['model'], 'price': price, 'quantity': quantity})
+    return {
+        'shop': shop.id,
+        'orders': [{'id': shop_order.order_id, 'dt': datetime_field.to_representation(shop_order.order.dt),
+                    'total_sum': shop_order.total_sum, 'items': lines[shop_order.order_id]}
+                   for shop_order in shop_orders],
+    }
+
+
+def digest_text(digest):
+    """
+    Render a digest as the text of an email.
+
+    Args:
+        digest (dict): The digest returned by build_digest.
+
+    Returns:
+        str: The text of the email.
+    """
+    lines = []
+    for order in digest['orders']:
+        lines.append(f'Order {order["id"]} from {order["dt"]}, total {order["total_sum"]}:')
+        lines.extend(f'  {item["name"]} {item["model"]} x {item["quantity"]} = {item["price"] * item["quantity"]}'
+                     for item in order['items'])
+    return '\n'.join(lines)
+
+
+def mark_notified(shop, shop_orders, now):
+    """
+    Mark the delivered orders and the time of the shop's last digest.
+
+    Args:
+        shop (Shop): The notified shop.
+        shop_orders (list): The delivered shop parts of the orders.
+        now (datetime): The time of the delivery.
+    """
+    ShopOrder.objects.filter(id__in=[shop_order.id for shop_order in shop_orders]).update(notified_at=now)
+    Shop.objects.filter(id=shop.id).update(notified_at=now, notifying_until=None, notification_attempts=0,
+                                           next_notification_at=None)
+
+
+def retry_notification(shop, now):
+    """
+    Release the shop after a failed webhook and schedule the next attempt with exponential backoff.
+
+    Args:
+        shop (Shop): The shop whose webhook failed.
+        now (datetime): The time of the attempt.
+    """
+    attempts = shop.notification_attempts + 1
+    delay = min(settings.SHOP_NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1),
+                settings.SHOP_NOTIFICATION_MAX_RETRY_DELAY)
+    Shop.objects.filter(id=shop.id).update(notifying_until=None, notification_attempts=attempts,
+                                           next_notification_at=now + timedelta(seconds=delay))
+
+
+def notify_shop(shop_id, now):
+    """
+    Deliver one digest of the shop's new orders to its webhook or, without one, to the outbox.
+
+    The shop row is locked with SKIP LOCKED, so several workers never deliver the same
+    digest. Emails are queued under the lock. For webhooks the shop is leased for
+    WEBHOOK_LEASE instead and the lock is released before the call, so the HTTP request
+    holds no database locks. If the webhook fails, nothing is marked and the orders are
+    retried with exponential backoff, see retry_notification, or after the lease runs out
+    when the worker dies.
+
+    Args:
+        shop_id (int): The ID of the shop.
+        now (datetime): The current time.
+
+    Returns:
+        int: The number of orders in the delivered digest.
+
+    Raises:
+        ValueError: If the webhook URL is not allowed.
+        RequestException: If the webhook could not be called.
+    """
+    with transaction.atomic():
+        shop = Shop.objects.select_for_update(skip_locked=True, of=('self',)).select_related('user').filter(
+            id=shop_id).first()
+        if shop is None or (shop.notifying_until is not None and shop.notifying_until > now) or (
+                shop.next_notification_at is not None and shop.next_notification_at > now):
+            return 0
+        shop_orders = list(ShopOrder.objects.filter(shop_id=shop.id, notified_at__isnull=True).exclude(
+            order__status='basket').select_related('order').order_by('order_id'))
+        if not shop_orders:
+            return 0
+        digest = build_digest(shop, shop_orders)
+        if shop.notification_webhook:
+            shop.notifying_until = now + WEBHOOK_LEASE
+            shop.notification_secret = shop.notification_secret or token_hex(32)
+            shop.save(update_fields=['notifying_until', 'notification_secret'])
+        else:
+            if shop.user is not None:
+                enqueue_email(f'New orders for {shop.name}: {len(shop_orders)}', digest_text(digest),
+                              [shop.user.email])
+            mark_notified(shop, shop_orders, now)
+            return len(shop_orders)
+
+    try:
+        deliver_webhook(shop, digest)
+    except (ValueError, RequestException):
+        retry_notification(shop, now)
+        raise
+    with transaction.atomic():
+        mark_notified(shop, shop_orders, now)
+    return len(shop_orders)
+
+
+def send_shop_notifications():
+    """
+    Deliver the digests of all shops that are due.
+
+    Returns:
+        tuple: The number of notified orders and the delivery errors keyed by shop ID.
+    """
+    now = timezone.now()
+    notified = 0
+    errors = {}
+    for shop_id in due_shop_ids(now):
+        try:
+            notified += notify_shop(shop_id, now)
+        except (ValueError, RequestException) as e:
+            errors[shop_id] = str(e)
+    return notified, errors
@@ -0,0 +1,298 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Sum
+from django.db.models.expressions import RawSQL
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Coalesce
+
+from .cache import bump_catalog_version
+from .fast_serializers import product_info_values, serialize_product_infos
+from .models import Contact, Order, OrderItem, ProductInfo, Shop, ShopOrder
+
+
+def positive_int(value):
+    """
+    Convert an integer or a string of digits to a positive integer.
+
+    Args:
+        value: The value from the request.
+
+    Returns:
+        int: The positive integer, or None if the value is not one.
+    """
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    return None
+
+
+def parse_items(items, key):
+    """
+    Validate a list of basket items and sum the quantities of repeated keys.
+
+    Args:
+        items (list): The items from the request, each a dict with key and 'quantity'.
+        key (str): The name of the item field identifying the row, e.g. 'product_info' or 'id'.
+
+    Returns:
+        tuple: The quantities keyed by the item field and the list of errors.
+    """
+    if not isinstance(items, list):
+        return {}, ['Items must be a list']
+    quantities = defaultdict(int)
+    errors = []
+    for number, item in enumerate(items):
+        item_id = positive_int(item.get(key)) if isinstance(item, dict) else None
+        quantity = positive_int(item.get('quantity')) if isinstance(item, dict) else None
+        if item_id is None or quantity is None:
+            errors.append({'item': number, 'error': f'{key} and a positive quantity are required'})
+        else:
+            quantities[item_id] += quantity
+    return dict(quantities), errors
+
+
+def validate_basket_items(items):
+    """
+    Validate new basket items in one pass against a single product info lookup.
+
+    Args:
+        items (list): The items from the request, each a dict with 'product_info' and 'quantity'.
+
+    Returns:
+        tuple: The quantities keyed by product info ID and the list of errors.
+    """
+    quantities, errors = parse_items(items, 'product_info')
+    available = set(ProductInfo.objects.filter(id__in=quantities, is_active=True, shop__status=True).values_list(
+        'id', flat=True))
+    errors.extend({'product_info': product_info_id, 'error': 'Product is not available'}
+                  for product_info_id in sorted(quantities.keys() - available))
+    return quantities, errors
+
+
+def add_basket_items(user_id, quantities):
+    """
+    Add items to the user's basket, merging the quantities of products already in it.
+
+    The basket is locked for the duration of the transaction, existing lines are updated
+    with one bulk_update and new lines are inserted with one bulk_create.
+
+    Args:
+        user_id (int): The ID of the basket owner.
+        quantities (dict): The validated quantities keyed by product info ID.
+
+    Returns:
+        tuple: The number of created and of merged basket items.
+    """
+    with transaction.atomic():
+        basket, _ = Order.objects.select_for_update().get_or_create(user_id=user_id, status='basket')
+        existing = {}
+        for order_item in OrderItem.objects.filter(order_id=basket.id, product_info_id__in=quantities).order_by('id'):
+            existing.setdefault(order_item.product_info_id, order_item)
+        for product_info_id, order_item in existing.items():
+            order_item.quantity += quantities[product_info_id]
+        if existing:
+            OrderItem.objects.bulk_update(existing.values(), ['quantity'])
+        created = OrderItem.objects.bulk_create([
+            OrderItem(order_id=basket.id, product_info_id=product_info_id, quantity=quantity)
+            for product_info_id, quantity in quantities.items() if product_info_id not in existing
+        ])
+        update_order_totals([basket.id])
+    return len(created), len(existing)
+
+
+def update_basket_items(user_id, quantities):
+    """
+    Set the quantities of basket items with a single UPDATE statement.
+
+    Args:
+        user_id (int): The ID of the basket owner.
+        quantities (dict): The new quantities keyed by order item ID.
+
+    Returns:
+        int: The number of updated basket items.
+    """
+    with transaction.atomic():
+        basket, _ = Order.objects.select_for_update().get_or_create(user_id=user_id, status='basket')
+        updated = OrderItem.objects.filter(order_id=basket.id).bulk_update(
+            [OrderItem(id=order_item_id, quantity=quantity) for order_item_id, quantity in quantities.items()],
+            ['quantity'])
+        update_order_totals([basket.id])
+    return updated
+
+
+def snapshot_order_items(order_ids):
+    """
+    Copy the current price and product data into the lines of orders being placed.
+
+    The snapshot has the product info representation of the catalog, so placed orders
+    are served without joining the catalog and are not changed by later imports.
+
+    Args:
+        order_ids (list): The IDs of the orders.
+    """
+    order_items = list(OrderItem.objects.filter(order_id__in=order_ids, product_info__isnull=False).only(
+        'id', 'product_info_id'))
+    product_infos = {row['id']: row for row in serialize_product_infos(list(ProductInfo.objects.filter(
+        id__in={order_item.product_info_id for order_item in order_items}).values(*product_info_values())))}
+    for order_item in order_items:
+        order_item.product_snapshot = product_infos[order_item.product_info_id]
+        order_item.price = order_item.product_snapshot['price']
+    OrderItem.objects.bulk_update(order_items, ['price', 'product_snapshot'])
+
+
+def place_order(user_id, order_id, contact_id):
+    """
+    Place the user's basket as a new order, reserving the stock of every line.
+
+    The basket and then the product infos of its lines are locked with SELECT ... FOR
+    UPDATE, the product infos in ID order, so concurrent checkouts sharing products
+    always lock them in the same order and cannot deadlock. The order is placed only
+    if every line is available in the requested quantity; otherwise nothing is written.
+    The catalog versions of the shops are bumped, so cached catalog responses never show
+    the stock from before the checkout.
+
+    Args:
+        user_id (int): The ID of the basket owner.
+        order_id (int): The ID of the basket.
+        contact_id (int): The ID of the user's delivery contact.
+
+    Returns:
+        list: The errors preventing the placement, empty if the order was placed.
+    """
+    with transaction.atomic():
+        basket = Order.objects.select_for_update().filter(id=order_id, user_id=user_id, status='basket').first()
+        if basket is None:
+            return ['Basket not found']
+        if not Contact.objects.filter(id=contact_id, user_id=user_id).exists():
+            return ['Contact not found']
+
+        quantities = defaultdict(int)
+        for product_info_id, quantity in OrderItem.objects.filter(order_id=basket.id).values_list(
+                'product_info_id', 'quantity'):
+            quantities[product_info_id] += quantity
+        if not quantities:
+            return ['Basket is empty']
+
+        product_infos = list(ProductInfo.objects.select_for_update(of=('self',)).filter(
+            id__in=quantities).select_related('shop').order_by('id'))
+        errors = [{'product_info': product_info_id, 'error': 'Product is not available'}
+                  for product_info_id in sorted(quantities.keys() - {product_info.id for product_info in product_infos})]
+        for product_info in product_infos:
+            if not product_info.is_active or not product_info.shop.status:
+                errors.append({'product_info': product_info.id, 'error': 'Product is not available'})
+            elif product_info.quantity < quantities[product_info.id]:
+                errors.append({'product_info': product_info.id, 'error': 'Not enough stock',
+                               'available': product_info.quantity})
+        if errors:
+            return errors
+
+        for product_info in product_infos:
+            product_info.quantity -= quantities[product_info.id]
+        ProductInfo.objects.bulk_update(product_infos, ['quantity'])
+        Order.objects.filter(id=basket.id).update(contact_id=contact_id, status='new')
+        snapshot_order_items([basket.id])
+        update_order_totals([basket.id])
+        touch_shop_orders([basket.id])
+        bump_catalog_version(sorted({product_info.shop_id for product_info in product_infos}))
+    return []
+
+
+def touch_shop_orders(order_ids):
+    """
+    Move the shop parts of changed orders to the end of the partner order feed.
+
+    The shops of the orders are locked with SELECT ... FOR NO KEY UPDATE in ID order and
+    their parts get new values of the backend_shoporder_change_seq sequence. The locks
+    are held until commit, so the values of one shop become visible in the order they
+    were taken and a feed reader never skips a change that commits later with a smaller
+    value, while checkouts of other shops are not serialized. Call it late in the
+    transaction to keep the locks short.
+
+    Args:
+        order_ids (list): The IDs of the changed orders.
+    """
+    with transaction.atomic():
+        shop_ids = list(Shop.objects.select_for_update(no_key=True).filter(
+            id__in=ShopOrder.objects.filter(order_id__in=order_ids).values('shop_id')).order_by('id').values_list(
+            'id', flat=True))
+        ShopOrder.objects.filter(order_id__in=order_ids, shop_id__in=shop_ids).update(
+            change_seq=RawSQL("nextval('backend_shoporder_change_seq')", []))
+
+
+def calculate_order_totals(order_ids):
+    """
+    Aggregate the totals of orders and of their per-shop parts with one grouped query.
+
+    Lines of placed orders are counted at their snapshot price, basket lines at the
+    current price of the product. Only placed orders are split into shop parts, so the
+    notification and feed queries on the parts never see baskets.
+
+    Args:
+        order_ids (list): The IDs of the orders.
+
+    Returns:
+        tuple: The (total_sum, items_count) pairs keyed by order ID and keyed by (order ID, shop ID).
+    """
+    orders = {order_id: (0, 0) for order_id in order_ids}
+    shops = {}
+    rows = OrderItem.objects.filter(order_id__in=order_ids).order_by().values(
+        'order_id', 'order__status',
+        shop=Coalesce('product_info__shop_id', Cast(KT('product_snapshot__shop'), IntegerField()))).annotate(
+        total_sum=Sum(F('quantity') * Coalesce('price', 'product_info__price')), items_count=Count('id'))
+    for row in rows:
+        total_sum, items_count = orders[row['order_id']]
+        orders[row['order_id']] = (total_sum + row['total_sum'], items_count + row['items_count'])
+        if row['order__status'] != 'basket':
+            shops[(row['order_id'], row['shop'])] = (row['total_sum'], row['items_count'])
+    return orders, shops
+
+
+def save_order_totals(orders, shops):
+    """
+    Store calculated totals on the orders and upsert their per-shop parts.
+
+    Parts missing from shops are deleted, e.g. those of baskets.
+
+    Args:
+        orders (dict): The (total_sum, items_count) pairs keyed by order ID.
+        shops (dict): The (total_sum, items_count) pairs keyed by (order ID, shop ID).
+    """
+    Order.objects.bulk_update([Order(id=order_id, total_sum=total_sum, items_count=items_count)
+                               for order_id, (total_sum, items_count) in orders.items()],
+                              ['total_sum', 'items_count'])
+    shop_orders = ShopOrder.objects.bulk_create(
+        [ShopOrder(order_id=order_id, shop_id=shop_id, total_sum=total_sum, items_count=items_count)
+         for (order_id, shop_id), (total_sum, items_count) in shops.items()],
+        update_conflicts=True, unique_fields=['order', 'shop'], update_fields=['total_sum', 'items_count'])
+    ShopOrder.objects.filter(order_id__in=orders).exclude(
+        id__in=[shop_order.id for shop_order in shop_orders]).delete()
+
+
+def update_order_totals(order_ids):
+    """
+    Recalculate the stored totals of orders after their items or prices changed.
+
+    Must be called inside the transaction that changed the items, so the totals are
+    committed together with them.
+
+    Args:
+        order_ids (list): The IDs of the changed orders.
+    """
+    if order_ids:
+        save_order_totals(*calculate_order_totals(order_ids))
+
+
+def update_basket_totals(product_info_ids):
+    """
+    Recalculate the totals of the baskets containing product infos whose price changed.
+
+    Placed orders keep the totals they were placed with.
+
+    Args:
+        product_info_ids (list): The IDs of the repriced product infos.
+    """
+    if product_info_ids:
+        update_order_totals(list(Order.objects.filter(
+            status='basket', order_items__product_info_id__in=product_info_ids).values_list('id', flat=True).distinct()))
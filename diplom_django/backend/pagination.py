@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProductInfoPagination(CursorPagination):
+    """
+    Keyset pagination of the catalog on the primary key.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'limit'
+    max_page_size = 1000
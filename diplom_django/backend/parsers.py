@@ -0,0 +1,235 @@
+from codecs import getreader
+from csv import DictReader
+
+from ujson import loads
+from yaml import AliasEvent, MappingEndEvent, MappingNode, MappingStartEvent, ScalarEvent, ScalarNode, \
+    SequenceEndEvent, SequenceNode, SequenceStartEvent
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+PRICE_LIST_FORMATS = ('yaml', 'jsonl', 'csv')
+
+CSV_GOODS_FIELDS = ('id', 'category', 'category_name', 'name', 'model', 'price', 'price_rrc', 'quantity')
+CSV_INTEGER_FIELDS = ('id', 'category', 'price', 'price_rrc', 'quantity')
+
+
+def detect_format(url, content_type=''):
+    """
+    Guess the format of a price list from its URL or the Content-Type of the download.
+
+    Args:
+        url (str): The URL of the price list.
+        content_type (str): The Content-Type header of the response.
+
+    Returns:
+        str: One of PRICE_LIST_FORMATS, 'yaml' when nothing else matches.
+    """
+    path = url.split('?', 1)[0].lower()
+    if path.endswith(('.jsonl', '.ndjson')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'jsonl'
+    if path.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return 'yaml'
+
+
+def parse_price_list(stream, price_list_format='yaml', shop=None):
+    """
+    Parse a price list from a file-like object without loading it into memory.
+
+    Args:
+        stream: A binary or text file-like object.
+        price_list_format (str): One of PRICE_LIST_FORMATS.
+        shop (str): The shop name, required for CSV price lists that have no header.
+
+    Returns:
+        dict: The price list with 'shop' and 'categories' keys and a lazy 'goods' iterator.
+
+    Raises:
+        ValueError: If the format is unknown or the price list is malformed.
+    """
+    if price_list_format == 'yaml':
+        return parse_yaml(stream)
+    if price_list_format == 'jsonl':
+        return parse_json_lines(stream)
+    if price_list_format == 'csv':
+        return parse_csv(stream, shop)
+    raise ValueError(f'Unknown price list format: {price_list_format}')
+
+
+def _text_lines(stream):
+    if isinstance(stream.read(0), bytes):
+        return getreader('utf-8')(stream)
+    return stream
+
+
+def _compose_node(loader, anchors):
+    event = loader.get_event()
+    if isinstance(event, AliasEvent):
+        return anchors[event.anchor]
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+    elif isinstance(event, SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(SequenceNode, None, event.implicit)
+        node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(SequenceEndEvent):
+            node.value.append(_compose_node(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    elif isinstance(event, MappingStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(MappingNode, None, event.implicit)
+        node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(MappingEndEvent):
+            key = _compose_node(loader, anchors)
+            node.value.append((key, _compose_node(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+    else:
+        raise ValueError(f'Unexpected YAML event: {event}')
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+def _load_node(loader, anchors):
+    return loader.construct_document(_compose_node(loader, anchors))
+
+
+def _iter_yaml_goods(loader, anchors):
+    loader.get_event()
+    while not loader.check_event(SequenceEndEvent):
+        yield _load_node(loader, anchors)
+    loader.get_event()
+
+
+def parse_yaml(stream):
+    """
+    Parse a YAML price list, constructing one entry of 'goods' at a time.
+
+    The document is read as a stream of parser events with the libyaml based CSafeLoader
+    when it is available, so only the current entry is held in memory. This requires the
+    'shop' and 'categories' keys to precede 'goods'; otherwise the goods are buffered.
+
+    Args:
+        stream: A binary or text file-like object.
+
+    Returns:
+        dict: The price list with 'shop' and 'categories' keys and a lazy 'goods' iterator.
+
+    Raises:
+        ValueError: If the document is not a mapping or has no shop or goods.
+    """
+    loader = SafeLoader(stream)
+    anchors = {}
+    loader.get_event()
+    loader.get_event()
+    if not loader.check_event(MappingStartEvent):
+        raise ValueError('The price list must be a mapping')
+    loader.get_event()
+    header = {}
+    while not loader.check_event(MappingEndEvent):
+        key = _load_node(loader, anchors)
+        if key != 'goods':
+            header[key] = _load_node(loader, anchors)
+        elif not loader.check_event(SequenceStartEvent):
+            raise ValueError('The goods must be a list')
+        elif 'shop' in header:
+            return {'shop': header['shop'], 'categories': header.get('categories') or [],
+                    'goods': _iter_yaml_goods(loader, anchors)}
+        else:
+            header['goods'] = list(_iter_yaml_goods(loader, anchors))
+    if 'shop' not in header or 'goods' not in header:
+        raise ValueError('The price list must contain the shop and the goods')
+    return {'shop': header['shop'], 'categories': header.get('categories') or [], 'goods': iter(header['goods'])}
+
+
+def parse_json_lines(stream):
+    """
+    Parse a JSON Lines price list.
+
+    The first line holds an object with the 'shop' and 'categories' keys, each following
+    line holds one entry of goods.
+
+    Args:
+        stream: A binary or text file-like object.
+
+    Returns:
+        dict: The price list with 'shop' and 'categories' keys and a lazy 'goods' iterator.
+
+    Raises:
+        ValueError: If the header line is missing.
+    """
+    lines = (line for line in _text_lines(stream) if line.strip())
+    header = loads(next(lines, '{}'))
+    if 'shop' not in header:
+        raise ValueError('The first line must contain the shop')
+    return {'shop': header['shop'], 'categories': header.get('categories') or [],
+            'goods': (loads(line) for line in lines)}
+
+
+def _csv_goods(rows):
+    for row in rows:
+        item = {field: row[field] for field in CSV_GOODS_FIELDS if row.get(field)}
+        for field in CSV_INTEGER_FIELDS:
+            if field not in item:
+                raise ValueError(f'Row {rows.line_num}: the {field} field is required')
+            try:
+                item[field] = int(item[field])
+            except ValueError:
+                raise ValueError(f'Row {rows.line_num}: the {field} field must be an integer') from None
+        if 'name' not in item:
+            raise ValueError(f'Row {rows.line_num}: the name field is required')
+        item.setdefault('model', '')
+        item['parameters'] = {name: value for name, value in row.items()
+                              if name not in CSV_GOODS_FIELDS and value}
+        yield item
+
+
+def parse_csv(stream, shop):
+    """
+    Parse a CSV price list.
+
+    Every row holds one entry of goods with the id, category, name, model, price, price_rrc
+    and quantity columns and an optional category_name column; all other non-empty columns
+    are the parameters of the product.
+
+    Args:
+        stream: A binary or text file-like object.
+        shop (str): The name of the shop the price list belongs to.
+
+    Returns:
+        dict: The price list with 'shop' and 'categories' keys and a lazy 'goods' iterator.
+
+    Raises:
+        ValueError: If the shop is not given. Rows with an empty required column or a non-integer
+            number raise it while the goods are iterated, naming the row and the column.
+    """
+    if not shop:
+        raise ValueError('The shop is required for CSV price lists')
+    return {'shop': shop, 'categories': [], 'goods': _csv_goods(DictReader(_text_lines(stream)))}
+
+
+def iter_batches(goods, size):
+    """
+    Split the goods into lists of at most size entries.
+
+    Args:
+        goods: An iterable of price list entries.
+        size (int): The maximum size of a batch.
+
+    Yields:
+        list: The next batch of entries.
+    """
+    goods = iter(goods)
+    for first in goods:
+        batch = [first]
+        batch.extend(item for _, item in zip(range(size - 1), goods))
+        yield batch
+
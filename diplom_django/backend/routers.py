@@ -0,0 +1,123 @@
+from contextvars import ContextVar
+from hashlib import sha1
+from random import choice
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import Resolver404, resolve
+
+read_database = ContextVar('read_database', default=None)
+
+
+def replica_reads(view):
+    """
+    Mark a view class or function whose GET requests may read from the replicas.
+
+    Args:
+        view: The view class or function.
+
+    Returns:
+        The same view.
+    """
+    view.replica_reads = True
+    return view
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of replica routed requests to the replica chosen for the request.
+
+    Everything else, including all writes and reads inside transactions, goes to the
+    primary, so objects loaded from a replica are still saved to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_database.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in settings.REPLICA_DATABASES else None
+
+
+def sticky_key(authorization):
+    """Build the cache key pinning the reads of a client to the primary."""
+    return f'replica-sticky:{sha1(authorization.encode()).hexdigest()}'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware routing the reads of safe requests to views marked with replica_reads to a random replica.
+
+    After a successful unsafe request, e.g. a basket change or a checkout, the client's
+    Authorization header is pinned to the primary for REPLICA_STICKINESS_TTL seconds, so
+    the client reads its own writes while the replicas catch up. Set a cache shared by
+    all processes, or a client may be pinned in one process only.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        reset = read_database.set(self.choose_database(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_database.reset(reset)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        reset = read_database.set(self.choose_database(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_database.reset(reset)
+        self.pin(request, response)
+        return response
+
+    def choose_database(self, request):
+        """
+        Choose the replica for the reads of a request.
+
+        Args:
+            request (HttpRequest): The request.
+
+        Returns:
+            str: The alias of the replica, or None to read from the primary.
+        """
+        if request.method not in ('GET', 'HEAD') or not settings.REPLICA_DATABASES:
+            return None
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        except Resolver404:
+            return None
+        if not getattr(getattr(match.func, 'view_class', match.func), 'replica_reads', False):
+            return None
+        authorization = request.headers.get('Authorization')
+        if authorization and cache.get(sticky_key(authorization)):
+            return None
+        return choice(settings.REPLICA_DATABASES)
+
+    def pin(self, request, response):
+        """Pin the client of a successful unsafe request to the primary."""
+        authorization = request.headers.get('Authorization')
+        if not settings.REPLICA_DATABASES or not authorization or request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return
+        if response.status_code < 400:
+            cache.set(sticky_key(authorization), True, settings.REPLICA_STICKINESS_TTL)
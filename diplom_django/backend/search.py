@@ -0,0 +1,74 @@
+from functools import cache
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q
+
+REFRESH_SEARCH_SQL = '''
+INSERT INTO backend_productsearch (product_info_id, text, document)
+SELECT product_info.id,
+       concat_ws(' ', product.name, product_info.model, parameters.text),
+       setweight(to_tsvector(%(config)s::regconfig, product.name), 'A')
+       || setweight(to_tsvector(%(config)s::regconfig, translate(product_info.model, '/-_', '   ')), 'B')
+       || setweight(to_tsvector(%(config)s::regconfig, coalesce(parameters.text, '')), 'C')
+FROM backend_productinfo product_info
+JOIN backend_product product ON product.id = product_info.product_id
+LEFT JOIN LATERAL (
+    SELECT string_agg(value, ' ' ORDER BY id) AS text
+    FROM backend_productparameter
+    WHERE product_info_id = product_info.id
+) parameters ON TRUE
+WHERE product_info.id = ANY(%(ids)s)
+ON CONFLICT (product_info_id) DO UPDATE SET text = EXCLUDED.text, document = EXCLUDED.document
+'''
+
+
+def refresh_search_entries(product_info_ids):
+    """
+    Rebuild the search documents of product infos with a single upsert.
+
+    Args:
+        product_info_ids (list): The IDs of the created or changed product infos.
+    """
+    if not product_info_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(REFRESH_SEARCH_SQL, {'config': settings.CATALOG_SEARCH_CONFIG, 'ids': list(product_info_ids)})
+
+
+@cache
+def has_trigram_support():
+    """
+    Check once per process whether the pg_trgm extension is installed.
+
+    Returns:
+        bool: True if typo-tolerant trigram matching is available.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        return cursor.fetchone()[0]
+
+
+def search_product_infos(queryset, text):
+    """
+    Filter product infos by a search phrase and order them by relevance.
+
+    The phrase is matched against the full-text document of the name, model and parameter
+    values. When pg_trgm is installed, words similar to the phrase match as well, which
+    tolerates typos, and the similarity is added to the rank.
+
+    Args:
+        queryset (QuerySet): The product infos to search.
+        text (str): The search phrase in web search syntax.
+
+    Returns:
+        QuerySet: The matching product infos, most relevant first.
+    """
+    query = SearchQuery(text, config=settings.CATALOG_SEARCH_CONFIG, search_type='websearch')
+    condition = Q(search__document=query)
+    rank = SearchRank(F('search__document'), query)
+    if has_trigram_support():
+        condition |= Q(search__text__trigram_word_similar=text)
+        rank = rank + TrigramWordSimilarity(text, 'search__text')
+    return queryset.filter(condition).annotate(rank=rank).order_by('-rank', 'id')
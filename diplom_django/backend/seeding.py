@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from .cache import bump_catalog_version
+from .models import Category, Order, OrderItem, Parameter, Product, ProductInfo, ProductParameter, ProductSearch, \
+    Shop, ShopOrder
+from .orders import update_order_totals
+
+CATALOG_MODELS = (ProductParameter, ProductSearch, ProductInfo, Product, Parameter, Category.shops.through, Category)
+
+ORDER_MODELS = (ShopOrder, OrderItem, Order, Shop)
+
+
+def reset_catalog(orders=False):
+    """
+    Delete the catalog, and with orders=True also the orders and the shops.
+
+    The full reset is one TRUNCATE that restarts the IDs, and the catalog cache is cleared
+    after the commit, because the restarted shop IDs and versions may repeat a catalog
+    version seen before. The catalog only reset keeps the orders and the shops. Its goods
+    are removed from baskets and placed orders keep their snapshots. The link tables are
+    truncated, the tables referenced by order lines are emptied with DELETE, and the
+    versions of all shops are bumped.
+
+    Args:
+        orders (bool): Also delete the orders and the shops.
+    """
+    quote_name = connection.ops.quote_name
+    if orders:
+        tables = ', '.join(quote_name(model._meta.db_table) for model in CATALOG_MODELS + ORDER_MODELS)
+        with connection.cursor() as cursor:
+            # Deferred foreign key checks of rows written earlier in the transaction would block the TRUNCATE.
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute(f'TRUNCATE TABLE {tables} RESTART IDENTITY CASCADE')
+        transaction.on_commit(caches[settings.CATALOG_CACHE_ALIAS].clear)
+        return
+
+    basket_ids = list(Order.objects.filter(status='basket', order_items__product_info__isnull=False).values_list(
+        'id', flat=True).distinct())
+    OrderItem.objects.filter(order_id__in=basket_ids, product_info__isnull=False).delete()
+    update_order_totals(basket_ids)
+    OrderItem.objects.filter(product_info__isnull=False).update(product_info=None)
+    with connection.cursor() as cursor:
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute('TRUNCATE TABLE {}'.format(', '.join(
+            quote_name(model._meta.db_table) for model in (ProductParameter, ProductSearch, Category.shops.through))))
+        for model in (ProductInfo, Product, Parameter, Category):
+            cursor.execute(f'DELETE FROM {quote_name(model._meta.db_table)}')
+    bump_catalog_version(Shop.objects.values('id'))
+
+
+def generate_price_list(number, products, categories=10):
+    """
+    Generate a synthetic price list in the format returned by the price list parsers.
+
+    The goods are produced lazily, so price lists of any size use constant memory.
+
+    Args:
+        number (int): The number of the shop, used in its name and in the category IDs.
+        products (int): The number of goods.
+        categories (int): The number of categories the goods are spread over.
+
+    Returns:
+        dict: The price list with 'shop' and 'categories' keys and a lazy 'goods' iterator.
+    """
+    category_ids = [number * 1000 + category for category in range(1, categories + 1)]
+    return {
+        'shop': f'Synthetic shop {number}',
+        'categories': [{'id': category_id, 'name': f'Synthetic category {category_id}'}
+                       for category_id in category_ids],
+        'goods': ({'id': external_id,
+                   'category': category_ids[external_id % categories],
+                   'model': f'synthetic/{number}/{external_id}',
+                   'name': f'Synthetic product {number}-{external_id}',
+                   'price': 100 + external_id % 10000,
+                   'price_rrc': 120 + external_id % 10000,
+                   'quantity': external_id % 50,
+                   'parameters': {'Цвет': ('черный', 'белый', 'синий')[external_id % 3],
+                                  'Размер': external_id % 10}}
+                  for external_id in range(1, products + 1)),
+    }
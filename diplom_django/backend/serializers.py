@@ -1,5 +1,10 @@
+from secrets import token_hex
+
+from django.utils import timezone
 from rest_framework import serializers
-from .models import User, Category, Shop, Product, ProductInfo, ProductParameter, Order, OrderItem, Contact
+from .models import User, Category, Shop, Product, ProductInfo, ProductParameter, Order, OrderItem, Contact, \
+    ImportJob
+from .notifications import check_webhook_url
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -61,6 +66,30 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', ]
 
 
+class ShopNotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Shop
+        fields = ['notification_interval', 'notification_webhook', 'notification_secret', 'notified_at',
+                  'next_notification_at']
+        read_only_fields = ['notification_secret', 'notified_at', 'next_notification_at']
+
+    def validate_notification_webhook(self, value):
+        if value:
+            try:
+                check_webhook_url(value)
+            except ValueError as e:
+                raise serializers.ValidationError(str(e))
+        return value
+
+    def update(self, instance, validated_data):
+        if validated_data.get('notification_webhook') and not instance.notification_secret:
+            validated_data['notification_secret'] = token_hex(32)
+        if validated_data.get('notification_webhook', instance.notification_webhook) != instance.notification_webhook:
+            # A new webhook is tried on the next run instead of waiting out the backoff of the old one.
+            validated_data.update(notification_attempts=0, next_notification_at=None)
+        return super().update(instance, validated_data)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
@@ -74,14 +103,34 @@ class OrderItemSerializer(serializers.ModelSerializer):
 class OrderItemCreateSerializer(OrderItemSerializer):
     product_info = ProductInfoSerializer(read_only=True)
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.product_snapshot is not None:
+            data['product_info'] = instance.product_snapshot
+        return data
+
 
 class OrderSerializer(serializers.ModelSerializer):
     order_items = OrderItemCreateSerializer(read_only=True, many=True)
-
-    total_sum = serializers.IntegerField()
     contact = ContactSerializer(read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'order_items', 'status', 'dt', 'total_sum', 'contact']
-        read_only_fields = ['id', ]
+        read_only_fields = ['id', 'total_sum']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'url', 'shop', 'mode', 'phase', 'rows_processed', 'rows_per_second', 'summary', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_rows_per_second(self, job):
+        if job.started_at is None:
+            return 0
+        elapsed = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+        return round(job.rows_processed / elapsed, 1) if elapsed > 0 else 0
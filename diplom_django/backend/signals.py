@@ -1,11 +1,11 @@
-from django.conf import settings
 from typing import Type
 from django.db.models.signals import post_save
-from django.core.mail import EmailMultiAlternatives
 from django.dispatch import Signal, receiver
 from django_rest_passwordreset.signals import reset_password_token_created
 
-from .models import ConfirmEmailToken, User
+from .mail import enqueue_email
+from .models import ConfirmEmailToken, Order, User
+from .orders import touch_shop_orders
 
 new_user_registered = Signal()
 
@@ -16,7 +16,7 @@ new_order = Signal()
 def password_reset_token_created(sender, instance, reset_password_token, **kwargs):
     """
     This function is a signal receiver for the reset_password_token_created signal.
-    It sends an email to the user with the reset password token.
+    It queues an email to the user with the reset password token.
 
     Parameters:
     - sender (django_rest_passwordreset.signals.ResetPasswordTokenCreated): The sender of the signal.
@@ -24,20 +24,18 @@ def password_reset_token_created(sender, instance, reset_password_token, **kwarg
     - reset_password_token (django_rest_passwordreset.models.ResetPasswordToken): The ResetPasswordToken instance.
     - kwargs (dict): Additional keyword arguments passed to the signal receiver.
     """
-    message = EmailMultiAlternatives(
+    enqueue_email(
         f'Password Reset Token for {reset_password_token.user}',
         reset_password_token.key,
-        settings.EMAIL_HOST_USER,
         [reset_password_token.user.email]
     )
-    message.send()
 
 
 @receiver(post_save, sender=User)
 def new_user_registered_signal(sender: Type[User], instance: User, created: bool, **kwargs):
     """
     This function is a signal receiver for the new_user_registered signal.
-    It sends an email to the user with a confirmation email token.
+    It queues an email to the user with a confirmation email token.
 
     Parameters:
     - sender (Type[User]): The type of the User model.
@@ -45,33 +43,53 @@ def new_user_registered_signal(sender: Type[User], instance: User, created: bool
     - created (bool): A boolean indicating whether the instance was created or updated.
     - kwargs (dict): Additional keyword arguments passed to the signal receiver.
     """
+    if not created:
+        return
+
     token, _ = ConfirmEmailToken.objects.get_or_create(user_id=instance.pk)
 
-    message = EmailMultiAlternatives(
+    enqueue_email(
         f"Password Reset Token for {instance.email}",
         token.key,
-        settings.EMAIL_HOST_USER,
         [instance.email]
     )
-    message.send()
+
+
+@receiver(post_save, sender=Order)
+def order_saved_signal(sender: Type[Order], instance: Order, created: bool, **kwargs):
+    """
+    This function is a signal receiver for the post_save signal of orders.
+    It moves placed orders changed through the ORM, e.g. status changes in the admin, to the end of the partner order
+    feed.
+
+    Parameters:
+    - sender (Type[Order]): The type of the Order model.
+    - instance (Order): The saved Order instance.
+    - created (bool): A boolean indicating whether the instance was created or updated.
+    - kwargs (dict): Additional keyword arguments passed to the signal receiver.
+    """
+    if created or instance.status == 'basket':
+        return
+
+    touch_shop_orders([instance.pk])
 
 
 @receiver(new_order)
-def new_order_signal(user_id, **kwargs):
+def new_order_signal(user_id, email=None, **kwargs):
     """
     This function is a signal receiver for the new_order signal.
-    It sends an email to the user with an update on their order status.
+    It queues an email to the user with an update on their order status.
 
     Parameters:
     - user_id (int): The ID of the user associated with the order.
+    - email (str): The email of the user, looked up by user_id when not passed.
     - kwargs (dict): Additional keyword arguments passed to the signal receiver.
     """
-    user = User.objects.get(id=user_id)
+    if email is None:
+        email = User.objects.values_list('email', flat=True).get(id=user_id)
 
-    message = EmailMultiAlternatives(
+    enqueue_email(
         'Order status update',
         'The order has been collected',
-        settings.EMAIL_HOST_USER,
-        [user.email]
+        [email]
     )
-    message.send()
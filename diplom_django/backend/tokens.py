@@ -0,0 +1,70 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core import signing
+from rest_framework.authtoken.models import Token
+
+from .models import User
+
+ACCESS_SALT = 'backend.tokens.access'
+REFRESH_SALT = 'backend.tokens.refresh'
+
+
+def issue_tokens(user):
+    """
+    Sign a short-lived access token and a long-lived refresh token for a user.
+
+    Both tokens carry the user ID and the user's token version and are signed with
+    SECRET_KEY, so they are verified without the database. Bumping the token version
+    revokes all tokens issued before. The refresh token also carries a random ID, which
+    is recorded when the token is exchanged, so every refresh token is used only once.
+
+    Args:
+        user (User): The authenticated user.
+
+    Returns:
+        dict: The access and refresh tokens and the access token lifetime in seconds.
+    """
+    payload = [user.id, user.token_version]
+    return {
+        'access': signing.dumps(payload, salt=ACCESS_SALT),
+        'refresh': signing.dumps(payload + [uuid4().hex], salt=REFRESH_SALT),
+        'expires_in': settings.ACCESS_TOKEN_TTL,
+    }
+
+
+def read_token(token, refresh=False):
+    """
+    Verify the signature and the age of a token.
+
+    Args:
+        token (str): The token returned by issue_tokens.
+        refresh (bool): Whether the token is a refresh token.
+
+    Returns:
+        tuple: The user ID and the token version, and for refresh tokens also the token ID.
+
+    Raises:
+        SignatureExpired: If the token is older than its lifetime.
+        BadSignature: If the token is malformed or was not signed by us.
+    """
+    if refresh:
+        user_id, version, jti = signing.loads(token, salt=REFRESH_SALT, max_age=settings.REFRESH_TOKEN_TTL)
+        return user_id, version, jti
+    user_id, version = signing.loads(token, salt=ACCESS_SALT, max_age=settings.ACCESS_TOKEN_TTL)
+    return user_id, version
+
+
+def revoke_tokens(user_id):
+    """
+    Revoke every signed and permanent token of a user.
+
+    Must be called inside a transaction, the user row is locked until it ends.
+
+    Args:
+        user_id (int): The ID of the user.
+    """
+    user = User.objects.select_for_update().get(id=user_id)
+    user.token_version += 1
+    user.save(update_fields=['token_version'])
+    Token.objects.filter(user_id=user.id).delete()
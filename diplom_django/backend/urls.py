@@ -1,7 +1,9 @@
 from django.urls import path
+from .metrics import metrics_view
 from .views import RegisterAccountView, ConfirmEmailView, AccountDetailsView, LoginAccountView, ContactView, \
     CategoryView, ShopView, BasketView, OrderView, PartnerOrdersView, PartnerStatusView, PartnerUpdateView, \
-    ProductInfoView, upload_goods
+    PartnerImportJobView, PartnerNotificationsView, ProductInfoView, TokenRefreshView, TokenRevokeView, \
+    partner_orders_poll, upload_goods
 from django_rest_passwordreset.views import reset_password_request_token, reset_password_confirm
 
 
@@ -12,16 +14,22 @@ urlpatterns = [
     path('user/register/confirm/', ConfirmEmailView.as_view(), name='email-confirm'),
     path('user/details/', AccountDetailsView.as_view(), name='account-details'),
     path('user/login/', LoginAccountView.as_view(), name='user-login'),
+    path('user/token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('user/token/revoke/', TokenRevokeView.as_view(), name='token-revoke'),
     path('user/contact/', ContactView.as_view(), name='user-contact'),
     path('user/password-reset/', reset_password_request_token, name='reset-password'),
     path('user/password-reset/confirm/', reset_password_confirm, name='reset-password-confirm'),
     path('partner/status/', PartnerStatusView.as_view(), name='partner-status'),
     path('partner/orders/', PartnerOrdersView.as_view(), name='partner-orders'),
+    path('partner/orders/poll/', partner_orders_poll, name='partner-orders-poll'),
+    path('partner/notifications/', PartnerNotificationsView.as_view(), name='partner-notifications'),
     path('partner/update/', PartnerUpdateView.as_view(), name='partner-update'),
+    path('partner/update/<int:job_id>/', PartnerImportJobView.as_view(), name='partner-import-job'),
     path('categories/', CategoryView.as_view(), name='categories'),
     path('shops/', ShopView.as_view(), name='shops'),
     path('products/', ProductInfoView.as_view(), name='products'),
     path('basket/', BasketView.as_view(), name='basket'),
     path('order/', OrderView.as_view(), name='order'),
+    path('metrics/', metrics_view, name='metrics'),
     path('upload_goods/', upload_goods, name='upload_goods'),
 ]
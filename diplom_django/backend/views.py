@@ -1,33 +1,55 @@
+import asyncio
+from datetime import timedelta
 from distutils.util import strtobool
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.core.signing import BadSignature
 from django.core.validators import URLValidator
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F, Exists, OuterRef
 from django.http import JsonResponse
 from ujson import loads
-from yaml import load as yaml_load, Loader
-from requests import get
 from rest_framework import status
 from django.contrib.auth.password_validation import validate_password
-from rest_framework.authtoken.models import Token
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.generics import ListAPIView
 from rest_framework.views import APIView
-import psycopg2
 from django.views.decorators.http import require_http_methods
-
-from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact, \
-    ConfirmEmailToken
-from .serializers import UserSerializer, CategorySerializer, ProductInfoSerializer, OrderSerializer, \
-    OrderItemSerializer, ContactSerializer, ShopSerializer
+from django.utils import timezone
+
+from .models import User, Shop, Category, Product, ProductInfo, ProductParameter, Order, OrderItem, Contact, \
+    ConfirmEmailToken, ImportJob, SpentRefreshToken
+from .serializers import UserSerializer, CategorySerializer, ContactSerializer, ShopSerializer, ImportJobSerializer, \
+    ShopNotificationSerializer
+from .fast_serializers import PRODUCT_INFO_FIELDS, json_response, product_info_values, serialize_product_infos, \
+    serialize_orders
 from .signals import new_order, new_user_registered
+from .importers import import_price_list
+from .parsers import parse_yaml
+from .pagination import ProductInfoPagination
+from .cache import CatalogCacheMixin, bump_catalog_version
+from .search import search_product_infos
+from .feeds import has_feed_changes, partner_feed
+from .routers import replica_reads
+from .seeding import reset_catalog
+from .tokens import issue_tokens, read_token, revoke_tokens
+from .throttling import AuthEmailThrottle, AuthIPThrottle
+from .orders import add_basket_items, parse_items, place_order, positive_int, update_basket_items, update_order_totals, \
+    validate_basket_items
 
 
 class RegisterAccountView(APIView):
     """
     View for register a new user account.
     """
+    throttle_classes = [AuthIPThrottle, AuthEmailThrottle]
 
     def post(self, request, *args, **kwargs):
         """
@@ -57,10 +79,9 @@ class RegisterAccountView(APIView):
                     return JsonResponse({'status': False, 'error': 'Invalid type'})
                 user_serializer = UserSerializer(data=request.data)
                 if user_serializer.is_valid():
-                    user = user_serializer.save()
-                    user.set_password(request.data['password'])
-                    user.save()
-                    token, _ = ConfirmEmailToken.objects.get_or_create(user_id=user.id)
+                    with transaction.atomic():
+                        user = user_serializer.save(password=make_password(request.data['password']))
+                        token, _ = ConfirmEmailToken.objects.get_or_create(user_id=user.id)
                     return JsonResponse({'status': True, 'your token for confirm email': token.key})
                 else:
                     return JsonResponse({'status': False, 'error': user_serializer.errors})
@@ -170,6 +191,7 @@ class LoginAccountView(APIView):
     """
     View for logging in a user account.
     """
+    throttle_classes = [AuthIPThrottle, AuthEmailThrottle]
 
     def post(self, request, *args, **kwargs):
         """
@@ -191,13 +213,80 @@ class LoginAccountView(APIView):
             user = authenticate(request, username=request.data['email'], password=request.data['password'])
             if user is not None:
                 if user.is_active:
-                    token, _ = Token.objects.get_or_create(user=user)
-                    return JsonResponse({'status': True, 'your token, save it': token.key})
+                    return JsonResponse({'status': True, **issue_tokens(user)})
                 return JsonResponse({'status': False, 'error': 'Account is not active'})
         return JsonResponse({'status': False, 'error': 'invalid arguments'})
 
 
-class CategoryView(ListAPIView):
+class TokenRefreshView(APIView):
+    """
+    View for exchanging a refresh token for a new pair of tokens.
+    """
+    authentication_classes = []
+    throttle_classes = [AuthIPThrottle]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Issue new tokens for a valid refresh token, which is spent by the exchange.
+
+        A replayed refresh token was leaked, so reusing one revokes every token of the user.
+
+        Args:
+            request (HttpRequest): The HTTP request object with the 'refresh' token.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            JsonResponse: A JSON response containing new access and refresh tokens,
+            otherwise an error message.
+        """
+        if 'refresh' not in request.data:
+            return JsonResponse({'status': False, 'error': 'invalid arguments'}, status=400)
+        try:
+            user_id, version, jti = read_token(request.data['refresh'], refresh=True)
+        except (BadSignature, ValueError) as e:
+            return JsonResponse({'status': False, 'error': str(e)}, status=401)
+        with transaction.atomic():
+            user = User.objects.select_for_update().filter(id=user_id, is_active=True, token_version=version).first()
+            if user is None:
+                return JsonResponse({'status': False, 'error': 'Token revoked'}, status=401)
+            _, created = SpentRefreshToken.objects.get_or_create(jti=jti, defaults={'user_id': user.id})
+            if not created:
+                # A spent refresh token was replayed, so it leaked: revoke the whole session.
+                revoke_tokens(user.id)
+                return JsonResponse({'status': False, 'error': 'Token reused'}, status=401)
+            SpentRefreshToken.objects.filter(
+                user_id=user.id, spent_at__lt=timezone.now() - timedelta(seconds=settings.REFRESH_TOKEN_TTL)).delete()
+        return JsonResponse({'status': True, **issue_tokens(user)})
+
+
+class TokenRevokeView(APIView):
+    """
+    View for revoking all tokens of the user.
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        Revoke every signed and permanent token of the user, e.g. after a leak or on logout from all devices.
+
+        Args:
+            request (HttpRequest): The HTTP request object.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            JsonResponse: A JSON response containing the status of the operation.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'status': False, 'error': 'Not authenticated'}, status=403)
+
+        with transaction.atomic():
+            revoke_tokens(request.user.id)
+        return JsonResponse({'status': True})
+
+
+@replica_reads
+class CategoryView(CatalogCacheMixin, ListAPIView):
     """
     View for listing categories.
     """
@@ -205,7 +294,8 @@ class CategoryView(ListAPIView):
     serializer_class = CategorySerializer
 
 
-class ShopView(ListAPIView):
+@replica_reads
+class ShopView(CatalogCacheMixin, ListAPIView):
     """
     View for listing shops.
     """
@@ -213,7 +303,8 @@ class ShopView(ListAPIView):
     serializer_class = ShopSerializer
 
 
-class ProductInfoView(APIView):
+@replica_reads
+class ProductInfoView(CatalogCacheMixin, APIView):
     """
     View for getting product information.
     """
@@ -222,8 +313,12 @@ class ProductInfoView(APIView):
         """
         Get product information.
 
-        This method retrieves product information based on the provided query parameters.
-        It filters the product information based on the 'shop_id' and 'category_id' query parameters.
+        This method retrieves a page of product information based on the provided query parameters.
+        It filters the product information based on the 'shop_id', 'category_id', 'price_min', 'price_max'
+        and 'in_stock' query parameters and on any number of 'parameter' values given as 'name:value'.
+        Pages are ordered by ID and addressed with the 'cursor' and 'limit' query parameters,
+        and the 'fields' query parameter selects the returned fields. With the 'q' query parameter
+        the first 'limit' products matching the search phrase are returned, most relevant first.
 
         Args:
             request (HttpRequest): The HTTP request object.
@@ -236,21 +331,50 @@ class ProductInfoView(APIView):
         Raises:
             ValidationError: If the provided query parameters are invalid.
         """
-        query = Q(shop__status=True)
+        query = Q(shop__status=True, is_active=True)
         shop_id = request.query_params.get('shop_id')
         category_id = request.query_params.get('category_id')
-
-        if shop_id:
-            query = query & Q(shop_id=shop_id)
-
-        if category_id:
-            query = query & Q(product__category_id=category_id)
-
-        queryset = ProductInfo.objects.filter(query).select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
-        serializer = ProductInfoSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        price_min = request.query_params.get('price_min')
+        price_max = request.query_params.get('price_max')
+        in_stock = request.query_params.get('in_stock')
+        fields = request.query_params.get('fields')
+        fields = fields.split(',') if fields else None
+
+        try:
+            if shop_id:
+                query = query & Q(shop_id=int(shop_id))
+            if category_id:
+                query = query & Q(product__category_id=int(category_id))
+            if price_min:
+                query = query & Q(price__gte=int(price_min))
+            if price_max:
+                query = query & Q(price__lte=int(price_max))
+            if in_stock and strtobool(in_stock):
+                query = query & Q(quantity__gt=0)
+        except ValueError as e:
+            return JsonResponse({'status': False, 'error': str(e)}, status=400)
+
+        queryset = ProductInfo.objects.filter(query)
+        for parameter in request.query_params.getlist('parameter'):
+            name, separator, value = parameter.partition(':')
+            if not separator:
+                return JsonResponse({'status': False, 'error': 'Invalid parameter filter'}, status=400)
+            queryset = queryset.filter(Exists(ProductParameter.objects.filter(
+                product_info_id=OuterRef('id'), parameter__name=name, value=value)))
+
+        if fields is not None and not set(fields) <= set(PRODUCT_INFO_FIELDS):
+            return JsonResponse({'status': False, 'error': 'Invalid fields'}, status=400)
+
+        paginator = ProductInfoPagination()
+        search = request.query_params.get('q')
+        if search:
+            limit = paginator.get_page_size(request)
+            rows = list(search_product_infos(queryset, search).values(*product_info_values(fields))[:limit])
+            return json_response({'next': None, 'previous': None, 'results': serialize_product_infos(rows, fields)})
+
+        page = paginator.paginate_queryset(queryset.values(*product_info_values(fields)), request, view=self)
+        return json_response({'next': paginator.get_next_link(), 'previous': paginator.get_previous_link(),
+                              'results': serialize_product_infos(page, fields)})
 
 
 class BasketView(APIView):
@@ -276,17 +400,16 @@ class BasketView(APIView):
         if not request.user.is_authenticated:
             return JsonResponse({'status': False, 'error': 'Not authenticated'}, status=403)
 
-        basket = Order.objects.filter(user_id=request.user.id, status='basket').prefetch_related(
-            'order_items__product_info__product__category',
-            'order_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price'))).distinct()
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        basket = Order.objects.filter(user_id=request.user.id, status='basket')
+        return json_response(serialize_orders(basket))
 
     def post(self, request, *args, **kwargs):
         """
         Adds items in the user's basket.
 
+        All items are validated before anything is written; the quantities of products
+        already in the basket are increased instead of adding duplicate lines.
+
         Args:
             request (Request): The HTTP request object.
             *args: Additional positional arguments.
@@ -310,21 +433,15 @@ class BasketView(APIView):
             except ValueError as e:
                 return JsonResponse({'status': False, 'error': f'Invalid request format: {e}'}, status=400)
             else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
-                objects_created = 0
-                for order_item in items_dict:
-                    order_item.update({'order': basket.id})
-                    serializer = OrderItemSerializer(data=order_item)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                        except IntegrityError as e:
-                            return JsonResponse({'status': False, 'error': str(e)})
-                        else:
-                            objects_created += 1
-                    else:
-                        JsonResponse({'status': False, 'error': serializer.errors})
-                return JsonResponse({'status': True, 'Objects_created': objects_created})
+                quantities, errors = validate_basket_items(items_dict)
+                if errors:
+                    return JsonResponse({'status': False, 'error': errors}, status=400)
+                try:
+                    objects_created, objects_merged = add_basket_items(request.user.id, quantities)
+                except IntegrityError as e:
+                    return JsonResponse({'status': False, 'error': str(e)})
+                return JsonResponse({'status': True, 'Objects_created': objects_created,
+                                     'Objects_merged': objects_merged})
         return JsonResponse({'status': False, 'error': 'Invalid arguments'}, status=400)
 
     def delete(self, request, *args, **kwargs):
@@ -358,7 +475,9 @@ class BasketView(APIView):
                     query = query | Q(order_id=basket.id, id=order_item_id)
                     objects_deleted = True
             if objects_deleted:
-                deleted_count = OrderItem.objects.filter(query).delete()[0]
+                with transaction.atomic():
+                    deleted_count = OrderItem.objects.filter(query).delete()[0]
+                    update_order_totals([basket.id])
                 return JsonResponse({'status': True, 'deleted_count': deleted_count}, status=200)
         return JsonResponse({'status': False, 'error': 'Invalid arguments'}, status=400)
 
@@ -389,13 +508,10 @@ class BasketView(APIView):
             except ValueError as e:
                 return JsonResponse({'status': False, 'error': f'Invalid request format: {e}'}, status=400)
             else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
-                objects_updated = 0
-                for order_item in items_dict:
-                    if isinstance(order_item['id'], int) and isinstance(order_item['quantity'], int):
-                        objects_updated += OrderItem.objects.filter(order_id=basket.id,
-                                                                    id=order_item['id']).update(
-                            quantity=order_item['quantity'])
+                quantities, errors = parse_items(items_dict, 'id')
+                if errors:
+                    return JsonResponse({'status': False, 'error': errors}, status=400)
+                objects_updated = update_basket_items(request.user.id, quantities)
                 return JsonResponse({'status': True, 'objects_updated': objects_updated})
         return JsonResponse({'status': False, 'error': 'Invalid arguments'}, status=400)
 
@@ -409,6 +525,11 @@ class PartnerUpdateView(APIView):
         """
         This method handles the POST request for updating the partner's fixture.
 
+        The price list is queued for the import worker and the ID of the import job is returned
+        immediately. By default the price list is synchronized with the current assortment;
+        pass mode=replace to delete and recreate all goods. CSV price lists carry no shop name,
+        so the first CSV import of a partner without a shop must pass it as shop.
+
         Args:
             request (Request): The HTTP request object.
             *args: Additional positional arguments.
@@ -435,32 +556,52 @@ class PartnerUpdateView(APIView):
             except ValidationError as e:
                 return JsonResponse({'status': False, 'error': str(e)}, status=400)
             else:
-                stream = get(url).content
-                data = yaml_load(stream, Loader=Loader)
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              external_id=item['id'],
-                                                              model=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value)
-                return JsonResponse({'status': True})
+                mode = request.data.get('mode') or 'sync'
+                if mode not in ('sync', 'replace'):
+                    return JsonResponse({'status': False, 'error': 'Invalid mode'}, status=400)
+                shop = str(request.data.get('shop') or '')
+                if len(shop) > ImportJob._meta.get_field('shop').max_length:
+                    return JsonResponse({'status': False, 'error': 'Invalid shop'}, status=400)
+                job = ImportJob.objects.create(user_id=request.user.id, url=url, shop=shop, mode=mode)
+                return JsonResponse({'status': True, 'job': job.id}, status=202)
         return JsonResponse({'status': False, 'error': 'Invalid arguments'})
 
 
+class PartnerImportJobView(APIView):
+    """
+    This view is responsible for reporting the progress of the partner's price list imports.
+    """
+
+    def get(self, request, job_id, *args, **kwargs):
+        """
+        This method handles the GET request for fetching the state of an import job.
+
+        Args:
+            request (Request): The HTTP request object.
+            job_id (int): The ID of the import job.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            JsonResponse: A JSON response containing the phase, processed rows and throughput of the job.
+
+        Raises:
+            AuthenticationFailed: If the user is not authenticated.
+            InvalidUserType: If the user is not a shop.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'status': False, 'error': 'Not authenticated'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'status': False, 'error': 'Only for shops'}, status=403)
+
+        job = ImportJob.objects.filter(id=job_id, user_id=request.user.id).first()
+        if job is None:
+            return JsonResponse({'status': False, 'error': 'Import job not found'}, status=404)
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 class PartnerStatusView(APIView):
     """
     This view for managing partner state.
@@ -488,7 +629,9 @@ class PartnerStatusView(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'status': False, 'error': 'Only for shops'}, status=403)
 
-        shop = request.user.shop
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if shop is None:
+            return JsonResponse({'status': False, 'error': 'Shop not found'}, status=404)
         serializer = ShopSerializer(shop)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -519,12 +662,85 @@ class PartnerStatusView(APIView):
         if status:
             try:
                 Shop.objects.filter(user_id=request.user.id).update(status=strtobool(status))
+                bump_catalog_version(Shop.objects.filter(user_id=request.user.id).values('id'))
                 return JsonResponse({'status': True}, status=200)
             except ValueError as e:
                 return JsonResponse({'status': False, 'error': str(e)}, status=400)
         return JsonResponse({'status': False, 'error': 'Invalid arguments'})
 
 
+class PartnerNotificationsView(APIView):
+    """
+    This view for managing how the partner is notified about new orders.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        This method handles the GET request for fetching the partner's notification settings.
+
+        Args:
+            request (Request): The HTTP request object.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: A JSON response containing the notification settings of the shop.
+
+        Raises:
+            AuthenticationFailed: If the user is not authenticated.
+            InvalidUserType: If the user is not a shop.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'status': False, 'error': 'Not authenticated'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'status': False, 'error': 'Only for shops'}, status=403)
+
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if shop is None:
+            return JsonResponse({'status': False, 'error': 'Shop not found'}, status=404)
+        serializer = ShopNotificationSerializer(shop)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def post(self, request, *args, **kwargs):
+        """
+        This method handles the POST request for updating the partner's notification settings.
+
+        New orders are sent as digests every notification_interval minutes, 0 meaning as
+        soon as possible, to notification_webhook or, if it is empty, by email. The webhook
+        must be an https URL of a public host. Its requests are signed with HMAC-SHA256 of
+        the X-Signature-Timestamp header, a dot and the body, keyed with notification_secret,
+        and sent in the X-Signature header as 'sha256=<hex digest>'.
+
+        Args:
+            request (Request): The HTTP request object.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            JsonResponse: A JSON response containing the update result.
+
+        Raises:
+            AuthenticationFailed: If the user is not authenticated.
+            InvalidUserType: If the user is not a shop.
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'status': False, 'error': 'Not authenticated'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'status': False, 'error': 'Only for shops'}, status=403)
+
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if shop is None:
+            return JsonResponse({'status': False, 'error': 'Shop not found'}, status=404)
+        serializer = ShopNotificationSerializer(shop, data=request.data, partial=True)
+        if serializer.is_valid():
+            serializer.save()
+            return JsonResponse({'status': True})
+        return JsonResponse({'status': False, 'error': serializer.errors}, status=400)
+
+
+@replica_reads
 class PartnerOrdersView(APIView):
     """
     This view is responsible for fetching the partner's orders.
@@ -552,13 +768,89 @@ class PartnerOrdersView(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'status': False, 'error': 'Only for shops'}, status=403)
 
-        order = Order.objects.filter(order_items__product_info__shop__user_id=request.user.id).exclude(
-            status='basket').prefetch_related(
-            'order_items__product_info__product__category',
-            'order_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price'))).distinct()
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data, status=200)
+        since = request.query_params.get('since')
+        if since is not None:
+            feed_args = parse_feed_args(request.query_params)
+            if feed_args is None:
+                return JsonResponse({'status': False, 'error': 'since must be a cursor and limit a positive number'},
+                                    status=400)
+            return json_response(partner_feed(request.user.id, *feed_args))
+
+        order = Order.objects.filter(shop_orders__shop__user_id=request.user.id).exclude(status='basket').annotate(
+            shop_total_sum=F('shop_orders__total_sum'))
+        return json_response(serialize_orders(order, total_field='shop_total_sum'))
+
+
+def parse_feed_args(params):
+    """
+    Read the cursor and the page size of the partner order feed from query parameters.
+
+    Args:
+        params (QueryDict): The query parameters with 'since' and an optional 'limit'.
+
+    Returns:
+        tuple: The cursor and the page size, or None if they are invalid.
+    """
+    since, limit = params.get('since', ''), params.get('limit')
+    if not since.isdigit() or (limit is not None and positive_int(limit) is None):
+        return None
+    return int(since), min(positive_int(limit) or settings.PARTNER_FEED_PAGE_SIZE, settings.PARTNER_FEED_MAX_PAGE_SIZE)
+
+
+@replica_reads
+@require_http_methods(['GET'])
+async def partner_orders_poll(request):
+    """
+    Long-poll the partner order feed until orders change after the cursor.
+
+    The view is asynchronous: while waiting it only runs an index lookup every
+    PARTNER_FEED_POLL_INTERVAL seconds and holds no worker thread when the project is
+    served through asgi.py. It answers as soon as there are changes, or with an empty
+    page after PARTNER_FEED_POLL_TIMEOUT seconds.
+
+    Args:
+        request (HttpRequest): The HTTP request object with 'since' and an optional 'limit'.
+
+    Returns:
+        HttpResponse: A JSON response with the changed orders and the next cursor.
+    """
+    try:
+        user = await sync_to_async(authenticate_token)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'status': False, 'error': str(e.detail)}, status=403)
+    if user is None:
+        return JsonResponse({'status': False, 'error': 'Not authenticated'}, status=403)
+    if user.type != 'shop':
+        return JsonResponse({'status': False, 'error': 'Only for shops'}, status=403)
+
+    feed_args = parse_feed_args(request.GET)
+    if feed_args is None:
+        return JsonResponse({'status': False, 'error': 'since must be a cursor and limit a positive number'},
+                            status=400)
+    deadline = monotonic() + settings.PARTNER_FEED_POLL_TIMEOUT
+    while not await sync_to_async(has_feed_changes)(user.id, feed_args[0]) and monotonic() < deadline:
+        await asyncio.sleep(settings.PARTNER_FEED_POLL_INTERVAL)
+    return json_response(await sync_to_async(partner_feed)(user.id, *feed_args))
+
+
+def authenticate_token(request):
+    """
+    Authenticate a plain Django request with the DRF authentication classes.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        User: The authenticated user, or None if no credentials were sent.
+
+    Raises:
+        AuthenticationFailed: If the credentials are invalid.
+    """
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authentication_class().authenticate(Request(request))
+        if result is not None:
+            return result[0]
+    return None
 
 
 class ContactView(APIView):
@@ -680,6 +972,7 @@ class ContactView(APIView):
         return JsonResponse({'status': False, 'error': 'Invalid arguments'})
 
 
+@replica_reads
 class OrderView(APIView):
     """
     This view is responsible for managing the user's orders.
@@ -703,16 +996,15 @@ class OrderView(APIView):
         if not request.user.is_authenticated:
             return JsonResponse({'status': False, 'error': 'Not authenticated'}, status=403)
 
-        order = Order.objects.filter(user_id=request.user.id).exclude(status='basket').prefetch_related(
-            'order_items__product_info__product__category',
-            'order_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price'))).distinct()
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        order = Order.objects.filter(user_id=request.user.id).exclude(status='basket')
+        return json_response(serialize_orders(order))
 
     def post(self, request, *args, **kwargs):
         """
-        This method handles the POST request for updating the user's order.
+        This method handles the POST request for placing the user's basket as an order.
+
+        The stock of every line is reserved in the same transaction; if any line is not
+        available in the requested quantity the basket is left unchanged.
 
         Args:
             request (Request): The HTTP request object.
@@ -730,65 +1022,26 @@ class OrderView(APIView):
             return JsonResponse({'status': False, 'error': 'Not authenticated'}, status=403)
 
         if {'id', 'contact'} <= set(request.data):
-            if request.data['id'].isdigit():
-                try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data['id']).update(
-                        contact_id=request.data['contact'], status='new')
-                except IntegrityError as e:
-                    return JsonResponse({'status': False, 'error': str(e)}, status=400)
-                else:
-                    if is_updated:
-                        new_order.send(sender=self.__class__, user_id=request.user.id)
-                        return JsonResponse({'status': True})
-                    else:
-                        return JsonResponse({'status': False, 'error': 'Order not updated'}, status=400)
+            order_id, contact_id = positive_int(request.data['id']), positive_int(request.data['contact'])
+            if order_id and contact_id:
+                with transaction.atomic():
+                    errors = place_order(request.user.id, order_id, contact_id)
+                    if not errors:
+                        new_order.send(sender=self.__class__, user_id=request.user.id, email=request.user.email)
+                if errors:
+                    return JsonResponse({'status': False, 'error': errors}, status=400)
+                return JsonResponse({'status': True})
         return JsonResponse({'status': False, 'error': 'Invalid arguments'})
 
 
-def truncate_table(table_name):
-    '''Function for deleting data from a table and resetting the identifier.'''
-    with psycopg2.connect(database='diplom_db', user='postgres', password='postgres') as conn:
-        with conn.cursor() as cur:
-            cur.execute('''TRUNCATE TABLE {} CASCADE;'''.format(table_name))
-            cur.execute('''ALTER SEQUENCE {}_id_seq RESTART WITH 1;'''.format(table_name))
-            conn.commit()
-
-
 @require_http_methods('GET')
 def upload_goods(request):
     '''Function for loading ready data into a table. When called again, the data is reset.'''
-    ulr_for_upload = 'https://raw.githubusercontent.com/netology-code/python-final-diplom/master/data/shop1.yaml'
-    stream = get(ulr_for_upload).content
-    data = yaml_load(stream, Loader=Loader)
-    shop, _ = Shop.objects.get_or_create(name=data['shop'])
-    for category in data['categories']:
-        category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-        category_object.shops.add(shop.id)
-        category_object.save()
-    product = Product.objects.all()
-    if product:
-        truncate_table('backend_productinfo')
-        truncate_table('backend_product')
-        truncate_table('backend_shop')
-        truncate_table('backend_category')
-        truncate_table('backend_category_shops')
-        truncate_table('backend_parameter')
-        truncate_table('backend_productparameter')
+    if Product.objects.exists():
+        with transaction.atomic():
+            reset_catalog()
         return JsonResponse(
             {'status': 'The data was already in the table, the data was deleted, make a new query to load the data.'})
-    for item in data['goods']:
-        product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-        product_info, _ = ProductInfo.objects.get_or_create(product_id=product.id,
-                                                            external_id=item['id'],
-                                                            model=item['model'],
-                                                            price=item['price'],
-                                                            price_rrc=item['price_rrc'],
-                                                            quantity=item['quantity'],
-                                                            shop_id=shop.id)
-        for name, value in item['parameters'].items():
-            parameter_object, _ = Parameter.objects.get_or_create(name=name)
-            ProductParameter.objects.get_or_create(product_info_id=product_info.id,
-                                                   parameter_id=parameter_object.id,
-                                                   value=value)
+    with open(settings.CATALOG_FIXTURE, 'rb') as stream:
+        import_price_list(None, parse_yaml(stream))
     return JsonResponse({'status': 'products have been uploaded to the database'})
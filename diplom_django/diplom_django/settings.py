@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from os import path, environ
 from pathlib import Path
+
+import django
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -39,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'backend.apps.BackendConfig',
 
@@ -49,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.QueryMetricsMiddleware',
+    'backend.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,21 +87,80 @@ WSGI_APPLICATION = 'diplom_django.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before reuse, so
+# requests do not pay for connecting and authenticating. Under ASGI set DB_CONN_MAX_AGE=0
+# and put a pooler such as PgBouncer in front of PostgreSQL instead.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'diplom_db',
-        'HOST': '127.0.0.1',
-        'PORT': '5432',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
+        'NAME': environ.get('DB_NAME', 'diplom_db'),
+        'HOST': environ.get('DB_HOST', '127.0.0.1'),
+        'PORT': environ.get('DB_PORT', '5432'),
+        'USER': environ.get('DB_USER', 'postgres'),
+        'PASSWORD': environ.get('DB_PASSWORD', 'postgres'),
+        'CONN_MAX_AGE': int(environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': environ.get('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
+        'OPTIONS': {},
+    }
+}
 
+# DB_POOL_MAX_SIZE enables the psycopg 3 connection pool, which needs Django 5.1+ and
+# the psycopg[pool] package. Pooled connections replace the persistent ones.
+if environ.get('DB_POOL_MAX_SIZE'):
+    if django.VERSION < (5, 1):
+        raise ImproperlyConfigured('DB_POOL_MAX_SIZE requires Django 5.1 or newer.')
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(environ['DB_POOL_MAX_SIZE']),
+        'timeout': int(environ.get('DB_POOL_TIMEOUT', 10)),
     }
+
+# Comma separated hosts of read replicas, e.g. DB_REPLICA_HOSTS=10.0.0.2,10.0.0.3. Safe
+# requests to the catalog and order history views read from a random replica; clients are
+# pinned to the primary for REPLICA_STICKINESS_TTL seconds after they change data.
+for number, host in enumerate(filter(None, environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKINESS_TTL = int(environ.get('DB_REPLICA_STICKINESS_TTL', 10))
+
+DATABASE_ROUTERS = ['backend.routers.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Set CACHE_BACKEND and CACHE_LOCATION to share the cache between processes,
+# e.g. django.core.cache.backends.redis.RedisCache and redis://127.0.0.1:6379
+
+CACHES = {
+    'default': {
+        'BACKEND': environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': environ.get('CACHE_LOCATION', ''),
+    },
+    'benchmark': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    },
 }
 
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 600
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
+PASSWORD_HASHERS = [
+    'backend.hashers.ThrottledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+PASSWORD_HASH_ITERATIONS = int(environ.get('PASSWORD_HASH_ITERATIONS', 720000))
+PASSWORD_HASH_CONCURRENCY = int(environ.get('PASSWORD_HASH_CONCURRENCY', 2))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -145,16 +210,61 @@ EMAIL_USE_SSL = True
 
 SERVER_EMAIL = EMAIL_HOST_USER
 
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60
+# Seconds a worker has to send a claimed batch before other workers send it again.
+EMAIL_OUTBOX_LEASE = 10 * 60
+
+# Failed shop webhooks are retried after 1, 2, 4, ... minutes, at most an hour apart.
+SHOP_NOTIFICATION_RETRY_DELAY = 60
+SHOP_NOTIFICATION_MAX_RETRY_DELAY = 60 * 60
+
+PRICE_LIST_BATCH_SIZE = 2000
+
+# Price lists with at least this many goods are loaded with COPY into staging tables.
+PRICE_LIST_COPY_THRESHOLD = 20000
+
+CATALOG_FIXTURE = BASE_DIR / 'data' / 'shop1.yaml'
+
+CATALOG_SEARCH_CONFIG = 'russian'
+
+PARTNER_FEED_PAGE_SIZE = 100
+PARTNER_FEED_MAX_PAGE_SIZE = 1000
+PARTNER_FEED_POLL_TIMEOUT = 25
+PARTNER_FEED_POLL_INTERVAL = 1
+
+# /api/v1/metrics/ is served to scrapers sending METRICS_TOKEN as a bearer token or connecting
+# from METRICS_ALLOWED_NETWORKS (comma separated addresses or CIDR networks).
+METRICS_TOKEN = environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_NETWORKS = [network.strip() for network in
+                            environ.get('METRICS_ALLOWED_NETWORKS', '127.0.0.1,::1').split(',') if network.strip()]
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 300
+
+ACCESS_TOKEN_TTL = 60 * 60
+REFRESH_TOKEN_TTL = 30 * 24 * 60 * 60
+
 REST_FRAMEWORK = {
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'backend.metrics.TimedJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
 
     ),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-    )
+        'backend.authentication.SignedTokenAuthentication',
+        'backend.authentication.CachedTokenAuthentication',
+    ),
+
+    'DEFAULT_THROTTLE_RATES': {
+        'auth_ip': '30/min',
+        'auth_email': '10/min',
+    },
+
+    # Number of trusted proxies appending to X-Forwarded-For; 0 throttles by REMOTE_ADDR, never by client headers.
+    'NUM_PROXIES': int(environ.get('NUM_PROXIES', 0)),
 }
@@ -1,8 +1,44 @@
+import hmac
+import json
+import re
 import pytest
-from backend.models import User
+from datetime import timedelta
+from hashlib import sha256
+from io import BytesIO, StringIO
+from threading import Barrier, Thread
+from unittest.mock import patch
+
+import yaml
+from requests import RequestException
+from backend.authentication import token_cache
+from backend.jobs import run_pending_import_jobs
+from backend.throttling import AuthEmailThrottle, throttle_store
+from backend.tokens import issue_tokens
+from backend.mail import enqueue_email
+from backend.metrics import metrics_registry, query_budget
+from backend.importers import import_price_list, sync_price_list
+from backend.orders import place_order, update_order_totals
+from backend.parsers import parse_price_list
+from backend.seeding import reset_catalog
+from backend.fast_serializers import product_info_values, serialize_orders, serialize_product_infos
+from backend.models import User, ProductInfo, ProductParameter, Order, OrderItem, Contact, Shop, Product, Parameter, \
+    ShopOrder, EmailOutbox, Category
+from backend.serializers import OrderSerializer, ProductInfoSerializer
+from rest_framework.renderers import JSONRenderer
+from django.core.cache import cache, caches
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import update_last_login
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
 from model_bakery import baker
 from rest_framework.test import APIClient
 from django.urls import reverse
+from django.test import AsyncClient
+from asgiref.sync import async_to_sync
+from rest_framework.authtoken.models import Token
+from django.utils import timezone
 
 
 new_user = {
@@ -16,11 +52,61 @@ new_user = {
 }
 
 
+def make_price_list(shop, size, category_id=1):
+    return {
+        'shop': shop,
+        'categories': [{'id': category_id, 'name': f'Category {category_id}'}],
+        'goods': [
+            {
+                'id': external_id,
+                'category': category_id,
+                'model': f'model/{external_id}',
+                'name': f'Product {external_id}',
+                'price': 1000 + external_id,
+                'price_rrc': 1100 + external_id,
+                'quantity': 10,
+                'parameters': {f'Parameter {category_id}': external_id, 'Цвет': 'черный'},
+            }
+            for external_id in range(1, size + 1)
+        ],
+    }
+
+
+def restore_token_cache(entries):
+    for key, (_, user, token, stamp) in entries.items():
+        token_cache.set(key, user, token, stamp)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    token_cache.clear()
+    throttle_store.clear()
+
+
 @pytest.fixture
 def client():
     return APIClient()
 
 
+@pytest.fixture
+def shared_cache(settings, tmp_path):
+    settings.CACHES = {**settings.CACHES, 'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path / 'cache')}}
+    yield caches['default']
+    caches['default'].clear()
+
+
+@pytest.fixture
+def replica(settings):
+    connections.settings['replica'] = {**connections['default'].settings_dict}
+    settings.REPLICA_DATABASES = ['replica']
+    yield connections['replica']
+    connections['replica'].close()
+    del connections['replica']
+    del connections.settings['replica']
+
+
 @pytest.fixture
 def user_factory():
     def factory(*args, **kwargs):
@@ -102,3 +188,1069 @@ def test_contacts_create(client, user_factory):
     assert response.json()['message'] == 'contacts created'
     data = client.get(path=url)
     assert data.json()[0]['city'] == 'Norilsk'
+
+
+@pytest.mark.django_db
+def test_import_price_list_constant_queries(user_factory):
+    """
+    This test checks that the price list import issues the same number of queries regardless of its size.
+    """
+    with CaptureQueriesContext(connection) as small:
+        import_price_list(user_factory(type='shop').id, make_price_list('Small shop', 5, category_id=1))
+    with CaptureQueriesContext(connection) as large:
+        shop = import_price_list(user_factory(type='shop').id, make_price_list('Large shop', 200, category_id=2))
+    assert len(small.captured_queries) == len(large.captured_queries)
+    assert ProductInfo.objects.filter(shop=shop).count() == 200
+    assert ProductParameter.objects.filter(product_info__shop=shop).count() == 400
+
+
+@pytest.mark.django_db
+def test_sync_price_list_changes_only_differences(user_factory):
+    """
+    This test checks that syncing a price list updates, adds and retires only the changed goods.
+    """
+    user = user_factory(type='shop')
+    data = make_price_list('Sync shop', 50)
+    assert sync_price_list(user.id, data)['created'] == 50
+    ordered = ProductInfo.objects.get(external_id=50)
+    order_item = baker.make(OrderItem, order=baker.make(Order, user=user, status='new'), product_info=ordered,
+                            quantity=1)
+
+    data['goods'][0]['price'] = 1
+    data['goods'][1]['parameters']['Цвет'] = 'белый'
+    data['goods'].pop()
+    data['goods'].append(make_price_list('Sync shop', 51)['goods'][-1])
+    summary = sync_price_list(user.id, data)
+    assert summary == {'created': 1, 'updated': 2, 'unchanged': 47, 'retired': 1, 'parameters_updated': 3}
+
+    assert ProductInfo.objects.get(external_id=1).price == 1
+    assert ProductParameter.objects.get(product_info__external_id=2, parameter__name='Цвет').value == 'белый'
+    assert OrderItem.objects.filter(id=order_item.id).exists()
+    assert not ProductInfo.objects.get(id=ordered.id).is_active
+
+
+@pytest.mark.django_db(transaction=True)
+def test_partner_update_runs_in_background(client, user_factory):
+    """
+    This test checks that a price list update is queued as a job and its progress can be polled.
+    """
+    user = user_factory(type='shop', is_active=True)
+    client.force_authenticate(user=user)
+    response = client.post(reverse('backend:partner-update'), data={'url': 'https://example.com/shop.yaml'})
+    assert response.status_code == 202
+    job_id = response.json()['job']
+    assert not ProductInfo.objects.exists()
+
+    status_url = reverse('backend:partner-import-job', kwargs={'job_id': job_id})
+    assert client.get(status_url).json()['phase'] == 'queued'
+
+    content = yaml.dump(make_price_list('Background shop', 20), allow_unicode=True).encode()
+    with patch('backend.jobs.get') as download:
+        download.return_value.__enter__.return_value.raw = BytesIO(content)
+        download.return_value.__enter__.return_value.headers = {}
+        assert run_pending_import_jobs() == 1
+
+    job = client.get(status_url).json()
+    assert job['phase'] == 'done'
+    assert job['rows_processed'] == 20
+    assert job['summary']['created'] == 20
+    assert ProductInfo.objects.filter(shop__user=user).count() == 20
+
+
+@pytest.mark.django_db(transaction=True)
+def test_first_csv_import_takes_shop_from_request(client, user_factory):
+    """
+    This test checks that a first CSV import creates the shop named in the request and that bad rows are reported.
+    """
+    user = user_factory(type='shop', is_active=True)
+    client.force_authenticate(user=user)
+    rows = ['id,category,category_name,name,model,price,price_rrc,quantity',
+            '1,1,Category 1,Product 1,model/1,100,120,10',
+            '2,1,Category 1,Product 2,model/2,,120,10']
+    response = client.post(reverse('backend:partner-update'),
+                           data={'url': 'https://example.com/shop.csv', 'shop': 'CSV shop'})
+    assert response.status_code == 202
+    job_id = response.json()['job']
+    with patch('backend.jobs.get') as download:
+        download.return_value.__enter__.return_value.raw = BytesIO('\n'.join(rows).encode())
+        download.return_value.__enter__.return_value.headers = {}
+        assert run_pending_import_jobs() == 1
+    job = client.get(reverse('backend:partner-import-job', kwargs={'job_id': job_id})).json()
+    assert job['phase'] == 'failed'
+    assert job['error'] == 'Row 3: the price field is required'
+
+    response = client.post(reverse('backend:partner-update'), data={'url': 'https://example.com/shop.csv',
+                                                                     'shop': 'CSV shop'})
+    with patch('backend.jobs.get') as download:
+        download.return_value.__enter__.return_value.raw = BytesIO('\n'.join(rows[:2]).encode())
+        download.return_value.__enter__.return_value.headers = {}
+        assert run_pending_import_jobs() == 1
+    job = client.get(reverse('backend:partner-import-job', kwargs={'job_id': response.json()['job']})).json()
+    assert job['phase'] == 'done'
+    assert Shop.objects.get(user=user).name == 'CSV shop'
+    assert ProductInfo.objects.filter(shop__user=user).count() == 1
+
+
+@pytest.mark.django_db
+def test_sync_streamed_price_list_in_batches(settings, user_factory):
+    """
+    This test checks that streamed YAML, JSON Lines and CSV price lists are imported batch by batch.
+    """
+    settings.PRICE_LIST_BATCH_SIZE = 7
+    user = user_factory(type='shop')
+    data = make_price_list('Stream shop', 20)
+    stream = BytesIO(yaml.dump(data, allow_unicode=True, sort_keys=False).encode())
+    progress = []
+    summary = sync_price_list(user.id, parse_price_list(stream, 'yaml'), progress=progress.append)
+    assert summary['created'] == 20
+    assert progress == [7, 14, 20]
+
+    header = json.dumps({'shop': 'Stream shop', 'categories': data['categories']})
+    lines = [json.dumps(item) for item in data['goods'][:10]]
+    stream = BytesIO('\n'.join([header] + lines).encode())
+    summary = sync_price_list(user.id, parse_price_list(stream, 'jsonl'))
+    assert (summary['unchanged'], summary['retired']) == (10, 10)
+
+    rows = ['id,category,category_name,name,model,price,price_rrc,quantity,Цвет',
+            '1,1,Category 1,Product 1,model/1,5,1101,10,черный',
+            '30,3,Category 3,Product 30,model/30,1030,1130,1,белый']
+    stream = BytesIO('\n'.join(rows).encode())
+    summary = sync_price_list(user.id, parse_price_list(stream, 'csv', shop='Stream shop'))
+    assert summary == {'created': 1, 'updated': 1, 'unchanged': 0, 'retired': 9, 'parameters_updated': 2}
+    assert ProductInfo.objects.get(external_id=30).product.category.name == 'Category 3'
+
+
+@pytest.mark.django_db
+def test_products_keyset_pagination_and_filters(client, user_factory):
+    """
+    This test checks that the catalog is paged by cursor and filtered on the server.
+    """
+    data = make_price_list('Catalog shop', 25)
+    data['goods'][0]['quantity'] = 0
+    sync_price_list(user_factory(type='shop').id, data)
+    url = reverse('backend:products')
+
+    ids = []
+    response = client.get(url, {'limit': 10})
+    while True:
+        page = response.json()
+        assert len(page['results']) <= 10
+        ids.extend(product['id'] for product in page['results'])
+        if not page['next']:
+            break
+        response = client.get(page['next'])
+    assert ids == sorted(ProductInfo.objects.values_list('id', flat=True))
+
+    page = client.get(url, {'price_min': 1005, 'price_max': 1010, 'fields': 'id,price'}).json()
+    assert [product['price'] for product in page['results']] == list(range(1005, 1011))
+    assert set(page['results'][0]) == {'id', 'price'}
+
+    page = client.get(url, {'in_stock': 'true', 'parameter': 'Parameter 1:1'}).json()
+    assert page['results'] == []
+    page = client.get(url, {'parameter': ['Parameter 1:2', 'Цвет:черный']}).json()
+    assert [product['product']['name'] for product in page['results']] == ['Product 2']
+    assert client.get(url, {'price_min': 'cheap'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_fast_serializers_match_drf_serializers(user_factory):
+    """
+    This test checks that the fast read path builds the same JSON as the DRF serializers.
+    """
+    sync_price_list(user_factory(type='shop').id, make_price_list('Fast shop', 10))
+    buyer = user_factory(type='buyer')
+    order = baker.make(Order, user=buyer, status='new', contact=baker.make(Contact, user=buyer))
+    for product_info in ProductInfo.objects.order_by('id')[:3]:
+        baker.make(OrderItem, order=order, product_info=product_info, quantity=2)
+
+    products = ProductInfo.objects.order_by('id')
+    expected = JSONRenderer().render(ProductInfoSerializer(products, many=True).data)
+    assert serialize_product_infos(list(products.values(*product_info_values()))) == json.loads(expected)
+
+    update_order_totals([order.id])
+    orders = Order.objects.filter(user=buyer)
+    expected = JSONRenderer().render(OrderSerializer(orders, many=True).data)
+    assert serialize_orders(orders) == json.loads(expected)
+
+
+@pytest.mark.django_db
+def test_catalog_cache_invalidated_by_imports(client, user_factory):
+    """
+    This test checks that catalog responses are cached until a price list import or status change.
+    """
+    shop_user = user_factory(type='shop')
+    data = make_price_list('Cached shop', 5)
+    sync_price_list(shop_user.id, data)
+    url = reverse('backend:products')
+
+    first = client.get(url)
+    with CaptureQueriesContext(connection) as queries:
+        second = client.get(url)
+    assert len(queries.captured_queries) == 1
+    assert second.content == first.content
+    assert client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code == 304
+
+    data['goods'][0]['price'] = 1
+    sync_price_list(shop_user.id, data)
+    response = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 200
+    assert response.json()['results'][0]['price'] == 1
+
+    client.force_authenticate(user=shop_user)
+    client.post(reverse('backend:partner-status'), data={'status': 'false'})
+    assert client.get(reverse('backend:shops')).json() == []
+
+
+@pytest.mark.django_db
+def test_catalog_cache_is_keyed_by_host(client, user_factory):
+    """
+    This test checks that a cached catalog page with absolute cursor links is not served to another host.
+    """
+    sync_price_list(user_factory(type='shop').id, make_price_list('Host shop', 5))
+    url = reverse('backend:products')
+
+    evil = client.get(url, {'limit': 2}, HTTP_HOST='evil.example')
+    assert evil.json()['next'].startswith('http://evil.example/')
+    response = client.get(url, {'limit': 2}, HTTP_HOST='shop.example')
+    assert response.json()['next'].startswith('http://shop.example/')
+    assert response['ETag'] != evil['ETag']
+    assert client.get(url, {'limit': 2}, HTTP_HOST='shop.example', secure=True).json()['next'].startswith(
+        'https://shop.example/')
+
+
+@pytest.mark.django_db
+def test_products_full_text_search(client, user_factory):
+    """
+    This test checks that the search table is refreshed by imports and ranks products by the query.
+    """
+    shop_user = user_factory(type='shop')
+    data = make_price_list('Search shop', 10)
+    data['goods'][2]['name'] = 'Смартфон Apple iPhone XS Max'
+    data['goods'][3]['name'] = 'Смартфон Samsung Galaxy'
+    sync_price_list(shop_user.id, data)
+    url = reverse('backend:products')
+
+    results = client.get(url, {'q': 'смартфоны apple'}).json()['results']
+    assert [product['product']['name'] for product in results] == ['Смартфон Apple iPhone XS Max']
+    assert len(client.get(url, {'q': 'смартфон'}).json()['results']) == 2
+
+    data['goods'][5]['parameters']['Цвет'] = 'белый'
+    sync_price_list(shop_user.id, data)
+    results = client.get(url, {'q': 'белый', 'fields': 'id,model'}).json()['results']
+    assert results == [{'id': ProductInfo.objects.get(external_id=6).id, 'model': 'model/6'}]
+
+
+@pytest.mark.django_db
+def test_basket_batch_add_and_update(client, user_factory):
+    """
+    This test checks that basket items are validated together, merged and written in bulk.
+    """
+    sync_price_list(user_factory(type='shop').id, make_price_list('Basket shop', 200))
+    product_ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+    buyer = user_factory(type='buyer')
+    client.force_authenticate(user=buyer)
+    url = reverse('backend:basket')
+
+    items = [{'product_info': product_id, 'quantity': 1} for product_id in product_ids]
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(url, data={'items': json.dumps(items)})
+    assert response.json() == {'status': True, 'Objects_created': 200, 'Objects_merged': 0}
+    assert len(queries.captured_queries) < 15
+
+    response = client.post(url, data={'items': json.dumps(items[:2] + [{'product_info': -1, 'quantity': 1}])})
+    assert response.status_code == 400
+    response = client.post(url, data={'items': json.dumps(items[:2] + items[:1])})
+    assert response.json() == {'status': True, 'Objects_created': 0, 'Objects_merged': 2}
+    assert OrderItem.objects.get(order__user=buyer, product_info_id=product_ids[0]).quantity == 3
+
+    order_items = OrderItem.objects.filter(order__user=buyer).values_list('id', flat=True)
+    with CaptureQueriesContext(connection) as queries:
+        response = client.put(url, data={'items': json.dumps([{'id': item, 'quantity': 5} for item in order_items])})
+    assert response.json() == {'status': True, 'objects_updated': 200}
+    assert len(queries.captured_queries) < 10
+    assert set(OrderItem.objects.filter(order__user=buyer).values_list('quantity', flat=True)) == {5}
+
+
+@pytest.mark.django_db
+def test_hot_queries_use_indexes(user_factory):
+    """
+    This test checks on a large seeded dataset that the main query of every view is served by its expected index.
+    """
+    users = User.objects.bulk_create([User(email=f'user{number}@example.com', username=f'user{number}', type='buyer')
+                                      for number in range(2000)])
+    shops = Shop.objects.bulk_create([Shop(name=f'Shop {number}', user=users[number]) for number in range(20)])
+    for number, shop in enumerate(shops):
+        sync_price_list(shop.user_id, make_price_list(shop.name, 3000 if shop is shops[-1] else 250,
+                                                      category_id=number + 1))
+    Parameter.objects.bulk_create([Parameter(name=f'Extra parameter {number}') for number in range(5000)])
+    product_info_ids = list(ProductInfo.objects.values_list('id', flat=True))
+    orders = Order.objects.bulk_create([Order(user=user, status=status) for user in users
+                                        for status in ('basket', 'new', 'delivered', 'sent')])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_info_id=product_info_ids[number % len(product_info_ids)], quantity=1)
+        for number, order in enumerate(orders)
+    ])
+    update_order_totals([order.id for order in orders])
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    user, shop = users[-1], shops[-1]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, 'backend_order')
+    user_index = next(name for name, constraint in constraints.items()
+                      if constraint['index'] and not constraint['unique'] and constraint['columns'] == ['user_id'])
+    queries = {
+        'basket': (Order.objects.filter(user_id=user.id, status='basket'), 'unique_user_basket'),
+        'orders': (Order.objects.filter(user_id=user.id).exclude(status='basket'), user_index),
+        'partner orders': (Order.objects.filter(shop_orders__shop__user_id=shop.user_id).exclude(status='basket'),
+                           'shoporder_shop_change_idx'),
+        'price list sync': (ProductInfo.objects.filter(shop_id=shop.id, external_id__in=[1, 2, 3]),
+                            'productinfo_shop_external_idx'),
+        'products': (ProductInfo.objects.filter(shop__status=True, is_active=True).order_by('id')[:100],
+                     'backend_productinfo_pkey'),
+        'product lookup': (Product.objects.filter(name__in=['Product 1'], category_id__in=[len(shops)]),
+                           'product_name_category_idx'),
+        'parameter lookup': (Parameter.objects.filter(name__in=['Цвет']), 'parameter_name_idx'),
+    }
+    for name, (queryset, index) in queries.items():
+        plan = queryset.explain()
+        assert re.search(rf'Index (Only )?Scan (using|on) {index} ', plan), f'{name}:\n{plan}'
+        assert 'Seq Scan on backend_order ' not in plan and 'Seq Scan on backend_orderitem' not in plan, \
+            f'{name}:\n{plan}'
+
+
+@pytest.mark.django_db
+def test_order_totals_are_stored(client, user_factory):
+    """
+    This test checks that order totals are kept up to date on writes and repaired by reconcile_order_totals.
+    """
+    first_shop, second_shop = user_factory(type='shop'), user_factory(type='shop')
+    sync_price_list(first_shop.id, make_price_list('First shop', 2))
+    sync_price_list(second_shop.id, make_price_list('Second shop', 1, category_id=2))
+    first, second = ProductInfo.objects.filter(shop__user=first_shop).order_by('id')
+    other = ProductInfo.objects.get(shop__user=second_shop)
+    buyer = user_factory(type='buyer')
+    client.force_authenticate(user=buyer)
+    url = reverse('backend:basket')
+
+    items = [{'product_info': first.id, 'quantity': 2}, {'product_info': other.id, 'quantity': 1}]
+    client.post(url, data={'items': json.dumps(items)})
+    basket = Order.objects.get(user=buyer, status='basket')
+    assert (basket.total_sum, basket.items_count) == (2 * 1001 + 1001, 2)
+    assert not ShopOrder.objects.filter(order=basket).exists()
+
+    other_item = OrderItem.objects.get(order=basket, product_info=other)
+    client.put(url, data={'items': json.dumps([{'id': other_item.id, 'quantity': 3}])})
+    client.post(url, data={'items': json.dumps([{'product_info': second.id, 'quantity': 1}])})
+    price_list = make_price_list('First shop', 2)
+    price_list['goods'][0]['price'] = 500
+    sync_price_list(first_shop.id, price_list)
+    basket.refresh_from_db()
+    assert (basket.total_sum, basket.items_count) == (2 * 500 + 3 * 1001 + 1002, 3)
+
+    client.delete(url, data={'items': str(other_item.id)})
+
+    Order.objects.filter(id=basket.id).update(total_sum=1)
+    ShopOrder.objects.create(order=basket, shop=other.shop, total_sum=1001, items_count=1)
+    out = StringIO()
+    call_command('reconcile_order_totals', stdout=out)
+    assert 'Fixed 1 drifted order(s)' in out.getvalue()
+    basket.refresh_from_db()
+    assert basket.total_sum == 2 * 500 + 1002
+    assert not ShopOrder.objects.filter(order=basket).exists()
+
+    contact = baker.make(Contact, user=buyer)
+    client.post(reverse('backend:order'), data={'id': str(basket.id), 'contact': contact.id})
+    assert dict(ShopOrder.objects.filter(order=basket).values_list('shop__user', 'total_sum')) == {
+        first_shop.id: 2 * 500 + 1002}
+    price_list['goods'][0]['price'] = 700
+    sync_price_list(first_shop.id, price_list)
+    response = client.get(reverse('backend:order'))
+    assert response.json()[0]['total_sum'] == 2 * 500 + 1002
+
+    client.force_authenticate(user=first_shop)
+    assert client.get(reverse('backend:partner-orders')).json()[0]['total_sum'] == 2 * 500 + 1002
+
+
+@pytest.mark.django_db
+def test_placed_orders_keep_snapshots(client, user_factory):
+    """
+    This test checks that placed orders are served from snapshots and survive price list re-imports.
+    """
+    shop = user_factory(type='shop')
+    import_price_list(shop.id, make_price_list('Snapshot shop', 3))
+    first, second, third = ProductInfo.objects.order_by('id')
+    buyer, other_buyer = user_factory(type='buyer'), user_factory(type='buyer')
+    url = reverse('backend:basket')
+    client.force_authenticate(user=other_buyer)
+    client.post(url, data={'items': json.dumps([{'product_info': third.id, 'quantity': 1}])})
+    client.force_authenticate(user=buyer)
+    client.post(url, data={'items': json.dumps([{'product_info': first.id, 'quantity': 2},
+                                                {'product_info': second.id, 'quantity': 1}])})
+    basket = Order.objects.get(user=buyer, status='basket')
+    client.post(reverse('backend:order'), data={'id': str(basket.id), 'contact': baker.make(Contact, user=buyer).id})
+    placed = client.get(reverse('backend:order')).json()
+    assert placed[0]['order_items'][0]['product_info']['product']['name'] == 'Product 1'
+
+    price_list = make_price_list('Snapshot shop', 3)
+    price_list['goods'][0].update(price=1, name='Renamed product')
+    import_price_list(shop.id, price_list)
+    assert not OrderItem.objects.filter(order__status='basket').exists()
+    assert Order.objects.get(user=other_buyer, status='basket').total_sum == 0
+
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(reverse('backend:order')).json() == placed
+    assert not any('backend_productinfo' in query['sql'] for query in queries.captured_queries)
+    call_command('reconcile_order_totals', stdout=StringIO())
+    assert Order.objects.get(id=basket.id).total_sum == 2 * 1001 + 1002
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_checkouts_do_not_oversell(user_factory):
+    """
+    This test checks that concurrent checkouts reserve stock atomically, without overselling or deadlocks.
+    """
+    sync_price_list(user_factory(type='shop').id, make_price_list('Stock shop', 2))
+    first, second = ProductInfo.objects.order_by('id')
+    ProductInfo.objects.filter(id=first.id).update(quantity=7)
+    buyers = User.objects.bulk_create([User(email=f'checkout{number}@example.com', username=f'checkout{number}',
+                                            type='buyer') for number in range(20)])
+    contacts = Contact.objects.bulk_create([Contact(user=buyer, city='Moscow', street='Tverskaya', phone='1')
+                                            for buyer in buyers])
+    baskets = Order.objects.bulk_create([Order(user=buyer, status='basket') for buyer in buyers])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=basket, product_info=product_info, quantity=1)
+        for number, basket in enumerate(baskets)
+        for product_info in ((first, second) if number % 2 else (second, first))
+    ])
+
+    barrier = Barrier(len(buyers))
+    results = {}
+
+    def checkout(basket, contact):
+        try:
+            barrier.wait()
+            results[basket.id] = place_order(basket.user_id, basket.id, contact.id)
+        finally:
+            connection.close()
+
+    threads = [Thread(target=checkout, args=pair) for pair in zip(baskets, contacts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    placed = [basket_id for basket_id, errors in results.items() if not errors]
+    assert len(results) == 20 and len(placed) == 7
+    assert all(errors[0]['error'] == 'Not enough stock' for errors in results.values() if errors)
+    assert ProductInfo.objects.get(id=first.id).quantity == 0
+    assert ProductInfo.objects.get(id=second.id).quantity == 3
+    assert Order.objects.filter(status='new').count() == 7
+    assert OrderItem.objects.filter(order__status='basket').count() == 26
+
+
+@pytest.mark.django_db
+def test_checkout_invalidates_cached_stock(client, user_factory):
+    """
+    This test checks that a checkout invalidates the cached catalog, so the next response shows the reserved stock.
+    """
+    sync_price_list(user_factory(type='shop').id, make_price_list('Cached stock shop', 1))
+    product_info = ProductInfo.objects.get()
+    url = reverse('backend:products')
+    assert client.get(url).json()['results'][0]['quantity'] == 10
+    assert client.get(url, {'in_stock': 'true'}).json()['results'] != []
+
+    buyer = user_factory(type='buyer')
+    basket = baker.make(Order, user=buyer, status='basket')
+    baker.make(OrderItem, order=basket, product_info=product_info, quantity=10)
+    assert place_order(buyer.id, basket.id, baker.make(Contact, user=buyer).id) == []
+
+    assert client.get(url).json()['results'][0]['quantity'] == 0
+    assert client.get(url, {'in_stock': 'true'}).json()['results'] == []
+
+
+@pytest.mark.django_db
+def test_emails_are_sent_from_outbox(client, settings):
+    """
+    This test checks that emails are queued in the outbox and sent by the worker with retries.
+    """
+    settings.EMAIL_OUTBOX_MAX_ATTEMPTS = 2
+    client.post(reverse('backend:user-register'), data=new_user)
+    assert mail.outbox == []
+    assert EmailOutbox.objects.get().recipients == [new_user['email']]
+
+    with patch('backend.mail.EmailMultiAlternatives.send', side_effect=OSError('SMTP is down')):
+        call_command('send_outbox_emails', '--once', stdout=StringIO())
+    email = EmailOutbox.objects.get()
+    assert (email.status, email.attempts, email.error) == ('pending', 1, 'SMTP is down')
+    assert email.next_attempt_at > timezone.now()
+
+    EmailOutbox.objects.update(next_attempt_at=timezone.now())
+    enqueue_email('Second', 'Body', ['second@example.com'])
+    depth = len(connection.atomic_blocks)
+    sent = []
+
+    def send(message):
+        assert len(connection.atomic_blocks) == depth
+        assert EmailOutbox.objects.get(recipients=message.to).next_attempt_at > timezone.now()
+        sent.append(message.to)
+
+    with patch('backend.mail.EmailMultiAlternatives.send', autospec=True, side_effect=send):
+        call_command('send_outbox_emails', '--once', stdout=StringIO())
+    assert sent == [[new_user['email']], ['second@example.com']]
+    assert set(EmailOutbox.objects.values_list('status', flat=True)) == {'sent'}
+
+    enqueue_email('Third', 'Body', ['third@example.com'])
+    with patch('backend.mail.EmailMultiAlternatives.send', side_effect=OSError('SMTP is down')):
+        for _ in range(2):
+            call_command('send_outbox_emails', '--once', stdout=StringIO())
+            EmailOutbox.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+    assert EmailOutbox.objects.get(subject='Third').status == 'failed'
+
+
+@pytest.mark.django_db
+def test_shops_get_digests_of_their_order_lines(client, user_factory):
+    """
+    This test checks that every shop gets only its own lines of new orders, as an email or a webhook digest.
+    """
+    email_shop, webhook_shop = user_factory(type='shop'), user_factory(type='shop')
+    sync_price_list(email_shop.id, make_price_list('Email shop', 1))
+    sync_price_list(webhook_shop.id, make_price_list('Webhook shop', 1, category_id=2))
+    client.force_authenticate(user=webhook_shop)
+    url = reverse('backend:partner-notifications')
+    public = [(2, 1, 6, '', ('93.184.216.34', 443))]
+    private = [(2, 1, 6, '', ('10.0.0.5', 443))]
+    with patch('backend.notifications.getaddrinfo', return_value=private):
+        for webhook in ('http://shop.example.com/orders', 'https://127.0.0.1/orders', 'https://shop.example.com/'):
+            assert client.post(url, data={'notification_webhook': webhook}).status_code == 400
+    with patch('backend.notifications.getaddrinfo', return_value=public):
+        response = client.post(url, data={'notification_webhook': 'https://shop.example.com/orders'})
+    assert response.json() == {'status': True}
+    secret = client.get(url).json()['notification_secret']
+    assert len(secret) == 64
+    client.force_authenticate(user=email_shop)
+    client.post(reverse('backend:partner-notifications'), data={'notification_interval': 30})
+
+    buyer = user_factory(type='buyer')
+    contact = baker.make(Contact, user=buyer)
+    client.force_authenticate(user=buyer)
+
+    def place(quantity):
+        items = [{'product_info': product_info.id, 'quantity': quantity} for product_info in ProductInfo.objects.all()]
+        client.post(reverse('backend:basket'), data={'items': json.dumps(items)})
+        basket = Order.objects.get(user=buyer, status='basket')
+        client.post(reverse('backend:order'), data={'id': str(basket.id), 'contact': contact.id})
+        return basket.id
+
+    first_order = place(1)
+    with patch('backend.notifications.post') as webhook, \
+            patch('backend.notifications.getaddrinfo', return_value=public):
+        call_command('send_shop_notifications', '--once', stdout=StringIO())
+    body, headers = webhook.call_args.kwargs['data'], webhook.call_args.kwargs['headers']
+    assert headers['X-Signature'] == 'sha256=' + hmac.new(
+        secret.encode(), f'{headers["X-Signature-Timestamp"]}.'.encode() + body, sha256).hexdigest()
+    assert webhook.call_args.kwargs['allow_redirects'] is False
+    digest = json.loads(body)
+    assert [(order['id'], [item['name'] for item in order['items']]) for order in digest['orders']] == [
+        (first_order, ['Product 1'])]
+    assert digest['orders'][0]['total_sum'] == 1001
+    email = EmailOutbox.objects.get(subject__startswith='New orders')
+    assert f'Order {first_order}' in email.body and 'x 1 = 1001' in email.body
+
+    second_order = place(2)
+    with patch('backend.notifications.post', side_effect=RequestException('Timeout')), \
+            patch('backend.notifications.getaddrinfo', return_value=public):
+        out = StringIO()
+        call_command('send_shop_notifications', '--once', stdout=out, stderr=out)
+    assert 'Timeout' in out.getvalue()
+    shop = Shop.objects.get(user=webhook_shop)
+    assert shop.notifying_until is None and shop.notification_attempts == 1
+    assert shop.next_notification_at - timezone.now() > timedelta(seconds=50)
+    with patch('backend.notifications.post') as webhook:
+        call_command('send_shop_notifications', '--once', stdout=StringIO())
+    assert not webhook.called
+    Shop.objects.filter(user=webhook_shop).update(notified_at=timezone.now() - timedelta(minutes=1),
+                                                  next_notification_at=timezone.now())
+    with patch('backend.notifications.post') as webhook, \
+            patch('backend.notifications.getaddrinfo', return_value=private):
+        out = StringIO()
+        call_command('send_shop_notifications', '--once', stdout=out, stderr=out)
+    assert 'public address' in out.getvalue() and not webhook.called
+    shop = Shop.objects.get(user=webhook_shop)
+    assert shop.notification_attempts == 2
+    assert shop.next_notification_at - timezone.now() > timedelta(seconds=110)
+    assert EmailOutbox.objects.filter(subject__startswith='New orders', recipients=[email_shop.email]).count() == 1
+
+    with patch('backend.notifications.getaddrinfo', return_value=public):
+        client.force_authenticate(user=webhook_shop)
+        assert client.post(url, data={'notification_webhook': 'https://orders.example.com/'}).json()['status']
+    assert Shop.objects.get(user=webhook_shop).next_notification_at is None
+    Shop.objects.update(notified_at=timezone.now() - timedelta(minutes=31))
+    with patch('backend.notifications.post') as webhook, \
+            patch('backend.notifications.getaddrinfo', return_value=public):
+        call_command('send_shop_notifications', '--once', stdout=StringIO())
+    assert [order['id'] for order in json.loads(webhook.call_args.kwargs['data'])['orders']] == [second_order]
+    assert EmailOutbox.objects.filter(subject__startswith='New orders', recipients=[email_shop.email]).count() == 2
+    assert not ShopOrder.objects.filter(notified_at__isnull=True).exists()
+    assert Shop.objects.get(user=webhook_shop).notification_attempts == 0
+
+    client.force_authenticate(user=user_factory(type='shop'))
+    assert client.get(url).status_code == 404
+    assert client.post(url, data={'notification_interval': 5}).status_code == 404
+    assert client.get(reverse('backend:partner-status')).status_code == 404
+
+
+@pytest.mark.django_db
+def test_partner_order_feed_since_cursor(client, user_factory, settings):
+    """
+    This test checks that the partner order feed returns orders placed or updated after the cursor, also by long-polling.
+    """
+    settings.PARTNER_FEED_POLL_TIMEOUT = 0.2
+    settings.PARTNER_FEED_POLL_INTERVAL = 0.05
+    shop, other_shop = user_factory(type='shop', is_active=True), user_factory(type='shop')
+    sync_price_list(shop.id, make_price_list('Feed shop', 1))
+    sync_price_list(other_shop.id, make_price_list('Other feed shop', 1, category_id=2))
+    buyer = user_factory(type='buyer')
+    contact = baker.make(Contact, user=buyer)
+
+    def place(*product_infos):
+        client.force_authenticate(user=buyer)
+        items = [{'product_info': product_info.id, 'quantity': 1} for product_info in product_infos]
+        client.post(reverse('backend:basket'), data={'items': json.dumps(items)})
+        basket = Order.objects.get(user=buyer, status='basket')
+        client.post(reverse('backend:order'), data={'id': str(basket.id), 'contact': contact.id})
+        client.force_authenticate(user=shop)
+        return basket.id
+
+    own, other = ProductInfo.objects.get(shop__user=shop), ProductInfo.objects.get(shop__user=other_shop)
+    first_order = place(own, other)
+    place(other)
+    url = reverse('backend:partner-orders')
+    feed = client.get(url, {'since': 0}).json()
+    assert [order['id'] for order in feed['orders']] == [first_order]
+    assert feed['orders'][0]['total_sum'] == 1001 and feed['cursor'] == feed['orders'][0]['cursor']
+    assert client.get(url, {'since': feed['cursor']}).json() == {'cursor': feed['cursor'], 'orders': []}
+    assert client.get(url, {'since': 'x'}).status_code == 400
+
+    poll_url = reverse('backend:partner-orders-poll')
+    headers = {'Authorization': f'Token {baker.make(Token, user=shop).key}'}
+    response = async_to_sync(AsyncClient().get)(poll_url, {'since': feed['cursor']}, headers=headers)
+    assert response.json() == {'cursor': feed['cursor'], 'orders': []}
+
+    second_order = place(own)
+    response = async_to_sync(AsyncClient().get)(poll_url, {'since': feed['cursor']}, headers=headers)
+    assert [order['id'] for order in response.json()['orders']] == [second_order]
+    assert response.json()['cursor'] > feed['cursor']
+    assert async_to_sync(AsyncClient().get)(poll_url, {'since': 0}).status_code == 403
+
+    cursor = response.json()['cursor']
+    order = Order.objects.get(id=first_order)
+    order.status = 'confirmed'
+    order.save()
+    changed = client.get(url, {'since': cursor}).json()
+    assert [(order['id'], order['status']) for order in changed['orders']] == [(first_order, 'confirmed')]
+    assert changed['cursor'] > cursor
+
+
+@pytest.mark.django_db
+def test_token_authentication_is_cached(user_factory, shared_cache):
+    """
+    This test checks that repeated token authentication runs no queries and is invalidated in all processes by changes.
+    """
+    user = user_factory(type='buyer', is_active=True)
+    token = baker.make(Token, user=user)
+    client = APIClient(HTTP_AUTHORIZATION=f'Token {token.key}')
+    url = reverse('backend:order')
+    assert client.get(url).status_code == 200
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url).status_code == 200
+    assert not any('authtoken_token' in query['sql'] or 'backend_user' in query['sql']
+                   for query in queries.captured_queries)
+
+    user.is_active = False
+    user.save()
+    assert client.get(url).status_code == 401
+    user.is_active = True
+    user.save()
+    assert client.get(url).status_code == 200
+
+    entries = dict(token_cache.entries)
+    user.is_active = False
+    user.save()
+    restore_token_cache(entries)
+    assert client.get(url).status_code == 401
+    User.objects.filter(id=user.id).update(is_active=True)
+    assert client.get(url).status_code == 200
+
+    entries = dict(token_cache.entries)
+    update_last_login(None, user)
+    assert token_cache.entries == entries
+    token.delete()
+    restore_token_cache(entries)
+    assert client.get(url).status_code == 401
+
+
+@pytest.mark.django_db
+def test_token_revocation_reaches_other_processes(user_factory, shared_cache):
+    """
+    This test checks that tokens revoked in one process are rejected by another process that has them cached.
+    """
+    user = user_factory(type='buyer', is_active=True)
+    headers = [f'Token {baker.make(Token, user=user).key}', f'Bearer {issue_tokens(user)["access"]}']
+    url = reverse('backend:order')
+    for header in headers:
+        assert APIClient(HTTP_AUTHORIZATION=header).get(url).status_code == 200
+    first_process = dict(token_cache.entries)
+    assert len(first_process) == 2
+
+    token_cache.clear()
+    response = APIClient(HTTP_AUTHORIZATION=headers[1]).post(reverse('backend:token-revoke'))
+    assert response.json() == {'status': True}
+    token_cache.clear()
+    restore_token_cache(first_process)
+    for header in headers:
+        assert APIClient(HTTP_AUTHORIZATION=header).get(url).status_code == 401
+
+
+@pytest.mark.django_db
+def test_signed_tokens_expire_refresh_and_revoke(client, settings, shared_cache):
+    """
+    This test checks that login issues signed tokens verified without queries, refreshed once and revoked everywhere.
+    """
+    client.post(reverse('backend:user-register'), data=new_user)
+    User.objects.filter(email=new_user['email']).update(is_active=True)
+    tokens = client.post(reverse('backend:user-login'),
+                         data={'email': new_user['email'], 'password': new_user['password']}).json()
+    assert tokens['status'] is True and tokens['expires_in'] == settings.ACCESS_TOKEN_TTL
+
+    url = reverse('backend:order')
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}').status_code == 200
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}').status_code == 200
+    assert not any('backend_user' in query['sql'] for query in queries.captured_queries)
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}x').status_code == 401
+
+    refresh_url = reverse('backend:token-refresh')
+    refreshed = client.post(refresh_url, data={'refresh': tokens['refresh']}).json()
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {refreshed["access"]}').status_code == 200
+    assert client.post(refresh_url, data={'refresh': tokens['access']}).status_code == 401
+    rotated = client.post(refresh_url, data={'refresh': refreshed['refresh']}).json()
+    assert client.post(refresh_url, data={'refresh': tokens['refresh']}).json() == {
+        'status': False, 'error': 'Token reused'}
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {rotated["access"]}').status_code == 401
+    assert client.post(refresh_url, data={'refresh': rotated['refresh']}).status_code == 401
+
+    tokens = client.post(reverse('backend:user-login'),
+                         data={'email': new_user['email'], 'password': new_user['password']}).json()
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}').status_code == 200
+    entries = dict(token_cache.entries)
+    response = client.post(reverse('backend:token-revoke'), HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+    assert response.json() == {'status': True}
+    restore_token_cache(entries)
+    assert client.get(url, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}').status_code == 401
+    assert client.post(refresh_url, data={'refresh': tokens['refresh']}).status_code == 401
+
+    tokens = client.post(reverse('backend:user-login'),
+                         data={'email': new_user['email'], 'password': new_user['password']}).json()
+    settings.ACCESS_TOKEN_TTL = -1
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+    assert response.status_code == 401 and response.json()['detail'] == 'Token expired.'
+
+
+@pytest.mark.django_db
+def test_tokens_are_not_cached_without_shared_cache(user_factory):
+    """
+    This test checks that tokens are loaded on every request when the default cache is local to the process.
+    """
+    user = user_factory(type='buyer', is_active=True)
+    client = APIClient(HTTP_AUTHORIZATION=f'Bearer {issue_tokens(user)["access"]}')
+    url = reverse('backend:order')
+    for _ in range(2):
+        with CaptureQueriesContext(connection) as queries:
+            assert client.get(url).status_code == 200
+        assert any('backend_user' in query['sql'] for query in queries.captured_queries)
+    assert not token_cache.entries
+
+
+@pytest.mark.django_db
+def test_registration_hashes_once_and_auth_is_throttled(client, settings):
+    """
+    This test checks that registration hashes once and that logins are limited per email and unspoofable IP.
+    """
+    with patch('backend.hashers.PBKDF2PasswordHasher.encode', autospec=True,
+               side_effect=PBKDF2PasswordHasher.encode) as encode, \
+            CaptureQueriesContext(connection) as queries:
+        client.post(reverse('backend:user-register'), data=new_user)
+    assert encode.call_count == 1
+    assert len([query for query in queries.captured_queries if 'UPDATE "backend_user"' in query['sql']]) == 0
+    user = User.objects.get(email=new_user['email'])
+    assert user.check_password(new_user['password'])
+
+    url = reverse('backend:user-login')
+    with patch.dict(AuthEmailThrottle.THROTTLE_RATES, {'auth_email': '3/min', 'auth_ip': '6/min'}):
+        statuses = [client.post(url, data={'email': new_user['email'], 'password': 'wrong'}).status_code
+                    for _ in range(4)]
+        assert statuses == [200, 200, 429, 429]
+        statuses = [client.post(url, data={'email': f'other{number}@example.com', 'password': 'wrong'}).status_code
+                    for number in range(2)]
+        assert statuses == [200, 429]
+
+        throttle_store.clear()
+        statuses = [client.post(url, data={'email': f'spoofed{number}@example.com', 'password': 'wrong'},
+                                HTTP_X_FORWARDED_FOR=f'203.0.113.{number}').status_code for number in range(7)]
+        assert statuses == [200] * 6 + [429]
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}
+        throttle_store.clear()
+        statuses = [client.post(url, data={'email': f'proxied{number}@example.com', 'password': 'wrong'},
+                                HTTP_X_FORWARDED_FOR=f'203.0.113.{number % 2}, 198.51.100.{number % 2}').status_code
+                    for number in range(14)]
+        assert statuses == [200] * 12 + [429] * 2
+
+
+@pytest.mark.django_db
+def test_benchmarks_detect_regressions(tmp_path, settings):
+    """
+    This test checks that the benchmark stores baselines, rolls its data back and fails on regressions.
+    """
+    baseline = tmp_path / 'baselines.json'
+    out = StringIO()
+    with pytest.raises(CommandError, match='dedicated database'):
+        call_command('run_benchmarks', '--baseline', str(baseline), stdout=out)
+    settings.DEBUG = True
+    with patch.object(caches['default'], 'set', wraps=caches['default'].set) as shared_set:
+        call_command('run_benchmarks', '--shops', '1', '--products', '20', '--orders', '2', '--iterations', '2',
+                     '--baseline', str(baseline), '--save-baseline', stdout=out)
+    assert not any(call.args[0].startswith('catalog:') for call in shared_set.call_args_list)
+    results = json.loads(baseline.read_text())
+    assert set(results) == {'catalog', 'catalog_cached', 'basket', 'checkout', 'partner'}
+    assert results['catalog_cached']['queries'] == 1 < results['catalog']['queries']
+    assert results['checkout']['requests'] == 4
+    assert results['partner']['queries'] > 0
+    assert not Order.objects.exclude(status='basket').exists()
+    assert 'ms saved per request' in out.getvalue()
+
+    results['catalog'].update(p95=0.001, queries=0)
+    baseline.write_text(json.dumps(results))
+    with pytest.raises(CommandError, match='catalog: .* queries per request > baseline 0'):
+        call_command('run_benchmarks', '--shops', '1', '--products', '20', '--orders', '2', '--iterations', '2',
+                     '--scenario', 'catalog', '--baseline', str(baseline), stdout=out)
+
+
+@pytest.mark.django_db
+def test_request_metrics_and_query_budgets(client, user_factory, settings):
+    """
+    This test checks that requests are measured per view and that views stay within their query budgets.
+    """
+    settings.DEBUG = True
+    metrics_registry.clear()
+    shop = user_factory(type='shop', is_active=True)
+    import_price_list(shop.id, make_price_list('Metrics shop', 5))
+    buyer = user_factory(type='buyer', is_active=True)
+    client.force_authenticate(user=buyer)
+    items = [{'product_info': product_info.id, 'quantity': 1} for product_info in ProductInfo.objects.all()]
+
+    with query_budget({'backend:basket': 15, 'backend:products': 4}) as requests:
+        client.post(reverse('backend:basket'), data={'items': json.dumps(items)})
+        response = client.get(reverse('backend:basket'))
+        client.get(reverse('backend:products'))
+    assert [request['view'] for request in requests] == ['backend:basket', 'backend:basket', 'backend:products']
+    assert int(response['X-Query-Count']) == requests[1]['queries'] > 0
+    assert 'serialize;dur=' in response['Server-Timing']
+    assert requests[1]['serialization_time'] > 0
+
+    with pytest.raises(AssertionError, match='backend:basket ran .* queries, budget 1'):
+        with query_budget({'backend:basket': 1}):
+            client.get(reverse('backend:basket'))
+
+    settings.DEBUG = False
+    settings.METRICS_TOKEN = 'scrape-token'
+    url = reverse('backend:metrics')
+    assert client.get(url, REMOTE_ADDR='203.0.113.5').status_code == 403
+    assert client.get(url, REMOTE_ADDR='203.0.113.5', HTTP_AUTHORIZATION='Bearer wrong').status_code == 403
+    assert client.get(url, REMOTE_ADDR='203.0.113.5', HTTP_AUTHORIZATION='Bearer scrape-token').status_code == 200
+    settings.METRICS_ALLOWED_NETWORKS = ['10.0.0.0/8']
+    response = client.get(url, REMOTE_ADDR='10.1.2.3')
+    assert response.status_code == 200 and 'X-Query-Count' not in response
+    metrics = response.content.decode()
+    assert 'api_requests_total{view="backend:basket"} 3' in metrics
+    assert 'api_request_duration_seconds_bucket{view="backend:products",le="+Inf"} 1' in metrics
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reads_go_to_replica_until_client_writes(client, user_factory, replica):
+    """
+    This test checks that catalog and history reads use the replica, except for clients that just changed data.
+    """
+    shop = user_factory(type='shop', is_active=True)
+    import_price_list(shop.id, make_price_list('Replica shop', 2))
+    buyer, other_buyer = user_factory(type='buyer', is_active=True), user_factory(type='buyer', is_active=True)
+    auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens(buyer)["access"]}'}
+    other_auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens(other_buyer)["access"]}'}
+
+    with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(replica) as replicated:
+        assert b'Product 2' in client.get(reverse('backend:products'), **auth).content
+        assert client.get(reverse('backend:order'), **auth).json() == []
+    assert replicated.captured_queries and not primary.captured_queries
+
+    items = [{'product_info': ProductInfo.objects.order_by('id').first().id, 'quantity': 1}]
+    with CaptureQueriesContext(replica) as replicated:
+        assert client.post(reverse('backend:basket'), data={'items': json.dumps(items)}, **auth).json()['status']
+    assert not replicated.captured_queries
+
+    with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(replica) as replicated:
+        client.get(reverse('backend:order'), **auth)
+    assert primary.captured_queries and not replicated.captured_queries
+    with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(replica) as replicated:
+        client.get(reverse('backend:order'), **other_auth)
+    assert replicated.captured_queries and not primary.captured_queries
+    with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(replica) as replicated:
+        client.get(reverse('backend:basket'), **other_auth)
+    assert primary.captured_queries and not replicated.captured_queries
+
+
+@pytest.mark.django_db
+def test_seed_catalog_loads_files_and_resets(client, settings, django_capture_on_commit_callbacks):
+    """
+    This test checks that the catalog is seeded from local and generated price lists, idempotently, and reset at once.
+    The reset by upload_goods keeps the orders and the shops.
+    """
+    out = StringIO()
+    call_command('seed_catalog', str(settings.CATALOG_FIXTURE), '--shops', '2', '--products', '30', stdout=out)
+    assert 'Loaded 72 goods of 3 shop(s)' in out.getvalue()
+    call_command('seed_catalog', str(settings.CATALOG_FIXTURE), stdout=out)
+    assert Shop.objects.count() == 3 and ProductInfo.objects.count() == 72
+    assert ProductInfo.objects.filter(product__name='Synthetic product 2-30', shop__name='Synthetic shop 2').exists()
+
+    with CaptureQueriesContext(connection) as queries:
+        call_command('seed_catalog', '--reset', stdout=out)
+    assert sum('TRUNCATE' in query['sql'] for query in queries.captured_queries) == 1
+    assert not Shop.objects.exists() and not Product.objects.exists()
+
+    url = reverse('backend:upload_goods')
+    assert client.get(url).json()['status'] == 'products have been uploaded to the database'
+    assert Shop.objects.get().name == 'Связной' and ProductInfo.objects.count() == 12
+    shop = Shop.objects.get()
+    shop.user = baker.make(User, type='shop')
+    shop.save()
+    buyer = baker.make(User, type='buyer')
+    first, second = ProductInfo.objects.order_by('id')[:2]
+    placed = baker.make(Order, user=buyer, status='new')
+    baker.make(OrderItem, order=placed, product_info=first, quantity=1, product_snapshot={'model': first.model})
+    basket = baker.make(Order, user=buyer, status='basket')
+    baker.make(OrderItem, order=basket, product_info=second, quantity=1)
+    update_order_totals([basket.id])
+    cached = client.get(reverse('backend:products')).json()['results']
+    client.get(url)
+    assert not ProductInfo.objects.exists() and not Product.objects.exists()
+    assert Shop.objects.get().user_id == shop.user_id
+    assert OrderItem.objects.get(order=placed).product_info is None
+    assert not OrderItem.objects.filter(order=basket).exists() and Order.objects.get(id=basket.id).total_sum == 0
+    assert cached and client.get(reverse('backend:products')).json()['results'] == []
+
+    client.get(url)
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        call_command('seed_catalog', '--reset', stdout=out)
+    assert len(callbacks) == 1 and not Order.objects.exists()
+
+
+@pytest.mark.django_db
+def test_copy_loader_matches_orm_import(settings, user_factory):
+    """
+    This test checks that large price lists are loaded with COPY and give the same catalog as the ORM import.
+    """
+    def load(price_list):
+        reset_catalog(orders=True)
+        Category.objects.create(id=1, name='Existing category')
+        Product.objects.create(name='Product 2', category_id=1)
+        Parameter.objects.create(name='Цвет')
+        progress = []
+        with CaptureQueriesContext(connection) as queries:
+            import_price_list(shop.id, price_list, progress=progress.append)
+        catalog = {
+            'goods': list(ProductInfo.objects.order_by('id').values_list(
+                'id', 'external_id', 'product__name', 'product__category_id', 'model', 'price', 'price_rrc',
+                'quantity', 'is_active', 'shop_id', 'search__text')),
+            'parameters': list(ProductParameter.objects.order_by('id').values_list(
+                'id', 'product_info_id', 'parameter__name', 'value')),
+            'products': sorted(Product.objects.values_list('name', 'category_id')),
+            'categories': sorted(Category.objects.values_list('id', 'name', 'shops')),
+        }
+        return catalog, progress[-1], any('staging_goods' in query['sql'] for query in queries.captured_queries)
+
+    shop = user_factory(type='shop')
+    price_list = make_price_list('Copy shop', 30)
+    price_list['goods'][3]['parameters'] = {'Цвет': True, 'Вес': 1.5, 'Описание': 'строка, "кавычки"\tи\nперенос'}
+    price_list['goods'][4]['model'] = ''
+    price_list['goods'].append({**price_list['goods'][5], 'category': 2, 'category_name': 'Inline category'})
+
+    settings.PRICE_LIST_COPY_THRESHOLD = 1000
+    orm_catalog, orm_progress, orm_copied = load(json.loads(json.dumps(price_list)))
+    settings.PRICE_LIST_COPY_THRESHOLD = 10
+    settings.PRICE_LIST_BATCH_SIZE = 7
+    copy_catalog, copy_progress, copied = load(json.loads(json.dumps(price_list)))
+    assert copied and not orm_copied
+    assert orm_progress == copy_progress == 31
+    assert copy_catalog == orm_catalog
+    assert 'Inline category' in {name for _, name, _ in copy_catalog['categories']}
+
+
+@pytest.mark.django_db
+def test_copy_loader_matches_orm_categories(settings, user_factory):
+    """
+    This test checks that the COPY and ORM imports agree on inline category names and undeclared categories.
+    """
+    def load(threshold, price_list):
+        settings.PRICE_LIST_COPY_THRESHOLD = threshold
+        reset_catalog(orders=True)
+        import_price_list(shop.id, price_list)
+        return sorted(Category.objects.values_list('id', 'name', 'shops__name'))
+
+    shop = user_factory(type='shop')
+    rows = ['id,category,category_name,name,model,price,price_rrc,quantity',
+            '1,7,Phones,Phone 1,model/1,100,120,10',
+            '2,7,,Phone 2,model/2,100,120,10',
+            '3,7,,Phone 3,model/3,100,120,10']
+    categories = [load(threshold, parse_price_list(BytesIO('\n'.join(rows).encode()), 'csv', shop='CSV shop'))
+                  for threshold in (1000, 3)]
+    assert categories[0] == categories[1] == [(7, 'Phones', 'CSV shop')]
+
+    price_list = make_price_list('Undeclared shop', 3)
+    price_list['goods'][2]['category'] = 99
+    for threshold in (1000, 3):
+        with pytest.raises(IntegrityError), transaction.atomic():
+            connection.cursor().execute('SET CONSTRAINTS ALL IMMEDIATE')
+            load(threshold, json.loads(json.dumps(price_list)))
+    assert not Category.objects.filter(id=99).exists()
+
+
+@pytest.mark.django_db
+def test_large_sync_loads_new_goods_with_copy(settings, user_factory):
+    """
+    This test checks that syncing a large price list loads its new goods with COPY and gives the ORM result.
+    """
+    def load(threshold):
+        settings.PRICE_LIST_COPY_THRESHOLD = threshold
+        reset_catalog(orders=True)
+        sync_price_list(shop.id, make_price_list('Sync shop', 12))
+        price_list = make_price_list('Sync shop', 30)
+        price_list['goods'][0]['price'] = 1
+        price_list['goods'].append({**price_list['goods'][20], 'price': 2})
+        price_list['goods'].append(price_list['goods'][25])
+        with CaptureQueriesContext(connection) as queries:
+            summary = sync_price_list(shop.id, price_list)
+        catalog = list(ProductInfo.objects.order_by('external_id', 'id').values_list(
+            'external_id', 'product__name', 'model', 'price', 'quantity', 'is_active', 'search__text'))
+        parameters = sorted(ProductParameter.objects.values_list('product_info__external_id', 'parameter__name',
+                                                                 'value'))
+        return summary, catalog, parameters, any('staging_goods' in query['sql']
+                                                 for query in queries.captured_queries)
+
+    shop = user_factory(type='shop')
+    settings.PRICE_LIST_BATCH_SIZE = 7
+    *orm_result, orm_copied = load(1000)
+    assert not orm_copied
+    for threshold in (10, 20):
+        *copy_result, copied = load(threshold)
+        assert copied
+        assert copy_result == orm_result
+    assert orm_result[0] == {'created': 18, 'updated': 2, 'unchanged': 12, 'retired': 0, 'parameters_updated': 36}